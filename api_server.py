@@ -1,13 +1,17 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import uvicorn
 from datetime import datetime
+import asyncio
 import os
 
-from agent import initialize_agent_system, CustomerInquiry
+from agent import CATEGORY_HINTS, initialize_agent_system, CustomerInquiry
+from cache import get_response_cache
+from ratelimit import get_model_governor
+from tools import get_email_sender, get_faq_search, warmup
 
 
 class SupportInquiryRequest(BaseModel):
@@ -22,6 +26,20 @@ class SupportInquiryResponse(BaseModel):
     faq_count: int
     validation_status: str
     processing_time_ms: Optional[int] = None
+    stage_timings_ms: Optional[Dict[str, float]] = None
+    critical_path: Optional[List[str]] = None
+
+
+class LoggedResponse(BaseModel):
+    timestamp: str
+    to: str
+    subject: str
+    response: str
+
+
+class RecentResponsesResponse(BaseModel):
+    count: int
+    responses: List[LoggedResponse]
 
 
 class HealthResponse(BaseModel):
@@ -31,11 +49,47 @@ class HealthResponse(BaseModel):
     agents_loaded: bool
 
 
+class FAQReloadResponse(BaseModel):
+    success: bool
+    reloaded: bool
+    entries: int
+    build_time_ms: float
+
+
+class FAQEntryRequest(BaseModel):
+    question: str = Field(..., min_length=5, max_length=1000)
+    answer: str = Field(..., min_length=1, max_length=10000)
+
+
+class FAQUpdateResponse(BaseModel):
+    success: bool
+    category: str
+    key: str
+    created: bool
+    entries: int
+    unsaved_edits: int
+
+
+class FAQSaveResponse(BaseModel):
+    success: bool
+    saved_edits: int
+    save_time_ms: float
+
+
 class StatsResponse(BaseModel):
     total_inquiries: int
     categories: Dict[str, int]
     avg_response_length: int
     uptime_seconds: int
+    llm_cache: Optional[Dict[str, Any]] = None
+    answer_cache: Optional[Dict[str, Any]] = None
+    coalesced_inquiries: int = 0
+    revisions: int = 0
+    validation_calls_saved: int = 0
+    speculative_research: Optional[Dict[str, int]] = None
+    single_call: Optional[Dict[str, int]] = None
+    model_governor: Optional[Dict[str, Any]] = None
+    response_log: Optional[Dict[str, Any]] = None
 
 
 app = FastAPI(
@@ -76,6 +130,19 @@ async def startup_event():
     try:
         orchestrator = initialize_agent_system()
         print("✓ Agent system initialized successfully")
+        
+        tools_ready = warmup()
+        print(f"✓ FAQ index loaded: {tools_ready['entries']} entries in {tools_ready['warmup_ms']:.1f} ms")
+        # Train the local category classifier now; FAQ edits then update it in place
+        get_faq_search().category_classifier(CATEGORY_HINTS)
+        if orchestrator.answer_cache is not None:
+            # The answer cache misses until the FAQ embedder is fitted
+            get_faq_search().embedder()
+        
+        watch_interval = float(os.getenv("FAQ_WATCH_INTERVAL", "5"))
+        if watch_interval > 0:
+            get_faq_search().start_watching(watch_interval)
+            print(f"✓ Watching {get_faq_search().faq_file} for changes every {watch_interval:g}s")
         print("✓ API server ready to accept requests")
         print("=" * 80)
     except Exception as e:
@@ -87,6 +154,13 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     print("\nShutting down API server...")
+    get_faq_search().stop_watching()
+    if get_faq_search().unsaved_edits:
+        saved = await asyncio.to_thread(get_faq_search().save)
+        print(f"✓ {saved} unsaved FAQ edits written to {get_faq_search().faq_file}")
+    # Responses still queued for the log are written before the process exits
+    await asyncio.to_thread(get_email_sender().close)
+    print(f"✓ Response log drained")
     print(f"Total inquiries processed: {stats['total_inquiries']}")
 
 
@@ -97,7 +171,8 @@ async def root():
         "version": "1.0.0",
         "docs": "/docs",
         "health": "/api/support/health",
-        "submit_inquiry": "POST /api/support/inquiry"
+        "submit_inquiry": "POST /api/support/inquiry",
+        "recent_responses": "GET /api/support/responses/recent?count=5"
     }
 
 
@@ -114,6 +189,9 @@ async def health_check():
 @app.get("/api/support/stats", response_model=StatsResponse, tags=["Statistics"])
 async def get_stats():
     uptime = (datetime.now() - stats['start_time']).total_seconds()
+    llm_cache = get_response_cache()
+    governor = get_model_governor()
+    answer_cache = orchestrator.answer_cache if orchestrator else None
     avg_length = (stats['total_response_length'] // stats['total_inquiries'] 
                   if stats['total_inquiries'] > 0 else 0)
     
@@ -121,7 +199,22 @@ async def get_stats():
         "total_inquiries": stats['total_inquiries'],
         "categories": stats['categories'],
         "avg_response_length": avg_length,
-        "uptime_seconds": int(uptime)
+        "uptime_seconds": int(uptime),
+        "llm_cache": llm_cache.stats() if llm_cache is not None else None,
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "coalesced_inquiries": orchestrator.coalesced if orchestrator else 0,
+        "revisions": orchestrator.revisions if orchestrator else 0,
+        "validation_calls_saved": orchestrator.validation_calls_saved if orchestrator else 0,
+        "speculative_research": {
+            "used": orchestrator.speculations_used,
+            "wasted": orchestrator.speculations_wasted
+        } if orchestrator else None,
+        "single_call": {
+            "answers": orchestrator.merged_answers,
+            "fallbacks": orchestrator.merged_fallbacks
+        } if orchestrator else None,
+        "model_governor": governor.stats() if governor is not None else None,
+        "response_log": get_email_sender().stats()
     }
 
 
@@ -136,7 +229,7 @@ async def submit_inquiry(request: SupportInquiryRequest):
     try:
         start_time = datetime.now()
         
-        result: CustomerInquiry = orchestrator.process_inquiry(
+        result: CustomerInquiry = await orchestrator.process_inquiry_async(
             question=request.question,
             customer_email=request.email
         )
@@ -153,7 +246,9 @@ async def submit_inquiry(request: SupportInquiryRequest):
             "response": result.final_response,
             "faq_count": len(result.faq_results.get('raw_results', [])),
             "validation_status": result.validation_status,
-            "processing_time_ms": int(processing_time)
+            "processing_time_ms": int(processing_time),
+            "stage_timings_ms": result.stage_timings,
+            "critical_path": result.critical_path
         }
         
     except Exception as e:
@@ -164,6 +259,70 @@ async def submit_inquiry(request: SupportInquiryRequest):
         )
 
 
+@app.get("/api/support/responses/recent", response_model=RecentResponsesResponse, tags=["Support"])
+async def recent_responses(count: int = Query(5, ge=1, le=100)):
+    # Waits for queued responses to reach the log, so run it off the event loop
+    responses = await asyncio.to_thread(get_email_sender().get_recent_responses, count)
+    return {"count": len(responses), "responses": responses}
+
+
+@app.post("/api/support/faq/reload", response_model=FAQReloadResponse, tags=["Knowledge Base"])
+async def reload_faqs():
+    try:
+        # Build off the event loop; searches keep using the old index until the swap
+        result = await asyncio.to_thread(get_faq_search().reload)
+        return {"success": True, **result}
+    
+    except (OSError, ValueError) as e:
+        print(f"Error reloading FAQs: {e}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to reload FAQ file: {str(e)}"
+        )
+
+
+@app.post("/api/support/faq/save", response_model=FAQSaveResponse, tags=["Knowledge Base"])
+async def save_faqs():
+    try:
+        # Rewrites the whole file, so edits are batched in memory until this is called
+        start_time = datetime.now()
+        saved = await asyncio.to_thread(get_faq_search().save)
+        return {"success": True, "saved_edits": saved,
+                "save_time_ms": round((datetime.now() - start_time).total_seconds() * 1000, 2)}
+    
+    except OSError as e:
+        print(f"Error saving FAQs: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to save FAQ file: {str(e)}"
+        )
+
+
+@app.put("/api/support/faq/{category}/{key}", response_model=FAQUpdateResponse, tags=["Knowledge Base"])
+async def upsert_faq(category: str, key: str, entry: FAQEntryRequest, persist: bool = False):
+    # May wait out a rebuild, convert a snapshot or compact: keep it off the event loop
+    result = await asyncio.to_thread(get_faq_search().upsert_faq, category, key, entry.question, entry.answer)
+    if persist:
+        await asyncio.to_thread(get_faq_search().save)
+    
+    return {"success": True, "category": category, "key": key, **result,
+            "unsaved_edits": get_faq_search().unsaved_edits}
+
+
+@app.delete("/api/support/faq/{category}/{key}", tags=["Knowledge Base"])
+async def delete_faq(category: str, key: str, persist: bool = False):
+    if not await asyncio.to_thread(get_faq_search().delete_faq, category, key):
+        raise HTTPException(
+            status_code=404,
+            detail=f"FAQ '{category}/{key}' not found"
+        )
+    if persist:
+        await asyncio.to_thread(get_faq_search().save)
+    
+    return {"success": True, "category": category, "key": key,
+            "unsaved_edits": get_faq_search().unsaved_edits}
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     print(f"Unhandled exception: {exc}")
@@ -0,0 +1,782 @@
+"""
+Performance benchmarks for the Customer Support AI Agent System.
+
+No API key required. Run everything, or name the benchmarks to run:
+
+    python benchmark.py
+    python benchmark.py scorers --size 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from faq_index import numpy_available
+from tools import FAQSearchTool, SCORERS
+
+
+# The embedding scorer needs NumPy
+AVAILABLE_SCORERS = [s for s in SCORERS if s != 'embedding' or numpy_available()]
+
+
+# Hand-labeled paraphrases: (query, expected FAQ key)
+LABELED_QUERIES = [
+    ("I forgot my password and can't log in", "password_reset"),
+    ("reset password", "password_reset"),
+    ("How do I change my email address?", "update_email"),
+    ("update the email on my profile", "update_email"),
+    ("my account got locked after failed logins", "account_locked"),
+    ("close and delete my account permanently", "delete_account"),
+    ("Where can I find my invoices?", "billing_question"),
+    ("download past receipts", "billing_question"),
+    ("change the credit card on file", "payment_method"),
+    ("I want my money back", "refund_request"),
+    ("request a refund for my order", "refund_request"),
+    ("I'm getting an error message", "technical_issue"),
+    ("The app won't open", "app_not_loading"),
+    ("The app is running very slowly", "slow_performance"),
+    ("how do I reach customer support", "contact_support"),
+    ("What are your business hours?", "business_hours"),
+]
+
+
+# Hand-labeled inquiries: (question, expected category), 10 per category
+LABELED_CATEGORIES = [
+    ("I forgot my password and can't log in", "account"), ("reset password", "account"),
+    ("How do I change my email address?", "account"), ("update the email on my profile", "account"),
+    ("my account got locked after failed logins", "account"), ("close and delete my account permanently", "account"),
+    ("I can't sign in", "account"), ("how do I change my username", "account"),
+    ("enable two factor authentication", "account"), ("my login isn't working", "account"),
+    ("Where can I find my invoices?", "billing"), ("download past receipts", "billing"),
+    ("change the credit card on file", "billing"), ("I want my money back", "billing"),
+    ("request a refund for my order", "billing"), ("I was charged twice this month", "billing"),
+    ("cancel my subscription", "billing"), ("what payment methods do you accept", "billing"),
+    ("why is my bill higher than usual", "billing"), ("update billing address", "billing"),
+    ("I'm getting an error message", "technical"), ("The app won't open", "technical"),
+    ("The app is running very slowly", "technical"), ("the page keeps crashing", "technical"),
+    ("nothing loads after the update", "technical"), ("error 500 when saving", "technical"),
+    ("the website is really slow today", "technical"), ("app freezes on startup", "technical"),
+    ("images are not loading", "technical"), ("I found a bug in the dashboard", "technical"),
+    ("how do I reach customer support", "general"), ("What are your business hours?", "general"),
+    ("are you open on weekends", "general"), ("what is your phone number", "general"),
+    ("can I talk to a human", "general"), ("where is your office located", "general"),
+    ("do you have live chat", "general"), ("when is support available", "general"),
+    ("how can I contact you", "general"), ("do you offer discounts for nonprofits", "general"),
+]
+
+# Question pairs the answer cache should treat as the same request...
+LABELED_PARAPHRASES = [
+    ("forgot password", "I can't remember my password"),
+    ("I forgot my password and can't log in", "forgot my password, cannot log in"),
+    ("How do I reset my password?", "How can I reset my password"),
+    ("How do I change my email address?", "I want to update my email address"),
+    ("Where can I see my invoices?", "Where can I find my invoices?"),
+    ("How do I get a refund?", "Can I request a refund?"),
+    ("The app won't load", "The app is not loading"),
+    ("What are your business hours?", "When are you open?"),
+    ("My account is locked", "My account got locked, what do I do?"),
+    ("How do I contact support?", "How can I reach customer support?"),
+    ("How do I delete my account?", "I want to delete my account"),
+    ("Why is the service so slow?", "The service is running slowly"),
+    ("I can't sign in", "I cannot log in"),
+    ("how do I update my payment method", "please help me update my payment method"),
+    ("How do I download my invoice?", "Where do I download my invoices?"),
+    ("Is there a mobile app?", "Do you have a mobile app?"),
+    ("How can I export my data?", "I need to export my data"),
+    ("My payment was declined", "Why was my payment declined?"),
+    ("How do I enable two-factor authentication?", "Enabling two factor authentication"),
+]
+
+# ...and pairs close in wording that need different answers
+LABELED_DIFFERENT_INTENTS = [
+    ("How do I cancel my subscription?", "How do I upgrade my subscription?"),
+    ("Why was I charged twice?", "Why was I charged?"),
+    ("How do I change my email address?", "How do I change my password?"),
+    ("How do I delete my account?", "How do I lock my account?"),
+    ("How do I update my payment method?", "How do I get a refund for my payment?"),
+    ("The app won't load", "The app is slow"),
+    ("How do I reset my password?", "How do I reset my email?"),
+    ("I was charged the wrong amount", "I was not charged"),
+    ("Can I get a refund?", "Can I get an invoice?"),
+    ("My account is locked", "My account is deleted"),
+    ("I can log in", "I can't log in"),
+    ("Can I get a refund?", "I don't want a refund"),
+]
+
+
+def load_faqs(path: str = "faqs.json") -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def synthetic_faqs(n_entries: int, seed: int = 7) -> Dict[str, Any]:
+    """The real FAQs plus ``n_entries`` generated ones drawn from their vocabulary."""
+    faqs = load_faqs()
+    rng = random.Random(seed)
+    vocab = sorted({
+        w for cat in faqs.values() for faq in cat.values()
+        for w in (faq['question'] + ' ' + faq['answer']).split()
+    })
+    categories = list(faqs.keys())
+
+    for i in range(n_entries):
+        cat = categories[i % len(categories)]
+        question = ' '.join(rng.choice(vocab) for _ in range(rng.randint(6, 10))) + '?'
+        answer = ' '.join(rng.choice(vocab) for _ in range(rng.randint(30, 60)))
+        faqs[cat][f"synthetic_{i}"] = {'question': question, 'answer': answer}
+    return faqs
+
+
+def build_tool(faqs: Dict[str, Any], **options) -> FAQSearchTool:
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as f:
+        json.dump(faqs, f)
+    try:
+        return FAQSearchTool(f.name, **options)
+    finally:
+        os.unlink(f.name)
+
+
+def time_calls(fn: Callable[[], Any], repeat: int) -> List[float]:
+    """Wall time of each call in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def bench_scorers(args):
+    print(f"\n[BENCH] FAQ scorers: {' vs '.join(AVAILABLE_SCORERS)}")
+    print("-"*80)
+
+    faqs = load_faqs()
+    question_to_key = {faq['question']: key for cat in faqs.values() for key, faq in cat.items()}
+    tool = build_tool(faqs)
+
+    print(f"Top-k quality on {len(LABELED_QUERIES)} labeled queries (faqs.json):")
+    for scorer in AVAILABLE_SCORERS:
+        hits, reciprocal_ranks, ties = 0, [], []
+        for query, expected in LABELED_QUERIES:
+            results = tool.search(query, top_k=3, scorer=scorer)
+            keys = [question_to_key[r['question']] for r in results]
+            hits += bool(keys) and keys[0] == expected
+            reciprocal_ranks.append(1 / (keys.index(expected) + 1) if expected in keys else 0.0)
+            full = tool.search(query, top_k=10**6, scorer=scorer)
+            ties.append(sum(1 for r in full[1:] if r['score'] == full[0]['score']))
+        print(f"  {scorer:<10} top-1 {hits}/{len(LABELED_QUERIES)}  "
+              f"MRR@3 {statistics.mean(reciprocal_ranks):.3f}  "
+              f"avg ties with #1 {statistics.mean(ties):.2f}")
+
+    tool = build_tool(synthetic_faqs(args.size))
+    queries = [q for q, _ in LABELED_QUERIES]
+    print(f"\nLatency per query on {len(tool._index):,} entries:")
+    for scorer in AVAILABLE_SCORERS:
+        tool.search("warm up", scorer=scorer)
+        timings = [t for q in queries for t in time_calls(lambda: tool.search(q, scorer=scorer), 5)]
+        print(f"  {scorer:<10} p50 {percentile(timings, 50):.3f} ms  "
+              f"p95 {percentile(timings, 95):.3f} ms")
+
+
+def sample_queries(n_queries: int, seed: int = 11) -> List[str]:
+    """Labeled questions mixed with random vocabulary queries, with repeats."""
+    faqs = load_faqs()
+    rng = random.Random(seed)
+    vocab = sorted({w for cat in faqs.values() for faq in cat.values() for w in faq['question'].split()})
+    pool = [q for q, _ in LABELED_QUERIES]
+    pool += [' '.join(rng.choice(vocab) for _ in range(rng.randint(2, 6))) for _ in range(500)]
+    return [rng.choice(pool) for _ in range(n_queries)]
+
+
+def bench_search_many(args):
+    print("\n[BENCH] Batch search: search_many vs looped search")
+    print("-"*80)
+
+    tool = build_tool(synthetic_faqs(args.size))
+    print(f"Corpus: {len(tool._index):,} entries")
+    for scorer in AVAILABLE_SCORERS:
+        tool.search("warm up", scorer=scorer)
+        for n_queries in (1, 100, 10000):
+            queries = sample_queries(n_queries)
+            start = time.perf_counter()
+            for q in queries:
+                tool.search(q, scorer=scorer)
+            looped = time.perf_counter() - start
+
+            start = time.perf_counter()
+            tool.search_many(queries, scorer=scorer)
+            batched = time.perf_counter() - start
+
+            print(f"  {scorer:<10} {n_queries:>6,} queries  "
+                  f"looped {n_queries / looped:>9,.0f} q/s  "
+                  f"search_many {n_queries / batched:>9,.0f} q/s  "
+                  f"({looped / batched:.1f}x)")
+
+
+def bench_faq_updates(args):
+    print("\n[BENCH] Incremental FAQ updates vs corpus size")
+    print("-"*80)
+
+    n_ops = 200
+    for size in (args.size // 10, args.size, args.size * 5):
+        tool = build_tool(synthetic_faqs(size))
+        if numpy_available():
+            tool._index.build_embeddings()
+        n_entries = len(tool._index)
+        # Keep compaction out of the per-entry numbers
+        tool.MAX_DEAD_FRACTION = float('inf')
+
+        insert = time_calls(lambda: tool.upsert_faq(
+            'general', f"bench_{time.perf_counter_ns()}", 'How do I export my data?',
+            'Go to Settings > Privacy > Export Data and choose a format.'), n_ops)
+        keys = [f"synthetic_{i}" for i in range(0, size, 4)][:n_ops]
+        update = [t for key in keys for t in time_calls(lambda: tool.upsert_faq(
+            'account', key, 'How do I rename my workspace?', 'Open Workspace > Settings > Rename.'), 1)]
+        delete = [t for key in keys for t in time_calls(lambda: tool.delete_faq('account', key), 1)]
+        rebuild = time_calls(lambda: tool._index.compacted(), 1)[0]
+
+        print(f"  {n_entries:>8,} entries  insert {statistics.mean(insert) * 1000:>7.1f} µs  "
+              f"update {statistics.mean(update) * 1000:>7.1f} µs  "
+              f"delete {statistics.mean(delete) * 1000:>7.1f} µs  "
+              f"full rebuild {rebuild:>9.1f} ms")
+
+
+def bench_shards(args):
+    print("\n[BENCH] Category shards: single index vs shards, unfiltered and filtered to one category")
+    print("-"*80)
+
+    faqs = synthetic_faqs(args.size * 10)
+    queries = [q for q, _ in LABELED_QUERIES]
+    flat = build_tool(faqs, sharded=False)
+    sharded = build_tool(faqs)
+    category = next(iter(faqs))
+    print(f"Corpus: {len(flat._index):,} entries in {len(sharded._index.shards)} categories; "
+          f"filtered searches use '{category}'")
+
+    for scorer in AVAILABLE_SCORERS:
+        for filtered in (None, category):
+            baseline = None
+            for label, tool in (("single index", flat), ("shards", sharded)):
+                tool.search("warm up", filtered, scorer=scorer)
+                timings = [t for q in queries
+                           for t in time_calls(lambda: tool.search(q, filtered, scorer=scorer), 3)]
+                p50 = percentile(timings, 50)
+                baseline = baseline or p50
+                label = f"{label}, {'filtered' if filtered else 'unfiltered'}"
+                print(f"  {scorer:<10} {label:<24} p50 {p50:>8.2f} ms  "
+                      f"p95 {percentile(timings, 95):>8.2f} ms  ({baseline / p50:.2f}x)")
+
+
+def bench_classifier(args):
+    import contextlib
+    import io
+    from agent import ClassifierAgent, LOCAL_CLASSIFIER_THRESHOLD
+    from fake_model import FakeModel
+
+    print("\n[BENCH] Local fast-path classifier in front of the Gemini classifier")
+    print("-"*80)
+    print(f"{len(LABELED_CATEGORIES)} labeled inquiries; below the threshold the LLM decides "
+          f"(default threshold {LOCAL_CLASSIFIER_THRESHOLD})")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        classifier = ClassifierAgent()
+    classifier.agent.cache = None
+    classifier.agent.model = model = FakeModel(latency=0)
+
+    predictions = [(classifier.classify_locally(q), expected) for q, expected in LABELED_CATEGORIES]
+    for threshold in (0.5, 0.6, 0.7, 0.8, 0.9):
+        local = [(label, expected) for (label, confidence), expected in predictions
+                 if label and confidence >= threshold]
+        correct = sum(label == expected for label, expected in local)
+        print(f"  threshold {threshold:.1f}  LLM skipped {len(local):>2}/{len(predictions)} "
+              f"({len(local) / len(predictions):>4.0%})  local accuracy "
+              f"{correct}/{len(local)} ({correct / len(local) if local else 1:.0%})")
+
+    timings = time_calls(lambda: [classifier.classify_locally(q) for q, _ in LABELED_CATEGORIES], 20)
+    print(f"  local classification {statistics.mean(timings) * 1000 / len(LABELED_CATEGORIES):.1f} µs/inquiry "
+          f"vs one Gemini round-trip")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for q, _ in LABELED_CATEGORIES:
+            classifier.classify(q)
+    print(f"  classify() at the default threshold: {model.calls} of {len(LABELED_CATEGORIES)} "
+          f"inquiries reached the model")
+
+
+def quiet_orchestrator(latency: float):
+    """An orchestrator on the fake model, with caches off and responses logged to a temp file."""
+    import contextlib
+    import io
+    import tools
+    from agent import CustomerSupportOrchestrator
+    from fake_model import FakeModel, install
+
+    log_file = os.path.join(tempfile.mkdtemp(), "response_log.jsonl")
+    tools._email_sender = tools.EmailResponseTool(log_file)
+    with contextlib.redirect_stdout(io.StringIO()):
+        orchestrator = CustomerSupportOrchestrator()
+    orchestrator.answer_cache = None
+    for stage in (orchestrator.classifier, orchestrator.researcher, orchestrator.writer, orchestrator.validator):
+        stage.agent.cache = None
+    install(orchestrator, FakeModel(latency=latency))
+    return orchestrator
+
+
+def run_inquiries(orchestrator, questions: List[str]) -> List[Any]:
+    import asyncio
+    import contextlib
+    import io
+
+    async def run_all():
+        return await asyncio.gather(*(
+            orchestrator.process_inquiry_async(q, f"bench{i}@example.com") for i, q in enumerate(questions)
+        ))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(run_all())
+
+
+def bench_stages(args):
+    from agent import RESEARCH_LOCAL_SUMMARY_THRESHOLD
+
+    latency = 0.05
+    print("\n[BENCH] Per-stage pipeline latency: model research summaries vs local when confident")
+    print("-"*80)
+    print(f"{len(LABELED_CATEGORIES)} inquiries on a fake model with {latency * 1000:.0f} ms per call")
+
+    stages = ['classify', 'research', 'write', 'validate', 'send']
+    print(f"  {'research summary':<24}" + "".join(f"{s:>10}" for s in stages) + f"{'total':>10}  model calls")
+    for label, threshold in (("always model", None),
+                             (f"local if score >= {RESEARCH_LOCAL_SUMMARY_THRESHOLD:g}", RESEARCH_LOCAL_SUMMARY_THRESHOLD)):
+        orchestrator = quiet_orchestrator(latency)
+        orchestrator.researcher.summary_threshold = threshold
+        results = run_inquiries(orchestrator, [q for q, _ in LABELED_CATEGORIES])
+        means = {s: statistics.mean(r.stage_timings.get(s, 0.0) for r in results) for s in stages}
+        print(f"  {label:<24}" + "".join(f"{means[s]:>10.1f}" for s in stages) +
+              f"{sum(means.values()):>10.1f}  {orchestrator.researcher.agent.model.calls} "
+              f"(research {orchestrator.researcher.llm_summaries})")
+    print("  (mean ms per inquiry)")
+
+
+def bench_parallel(args):
+    import asyncio
+    import contextlib
+    import io
+    from ratelimit import ModelGovernor
+
+    latency = 0.05
+    print("\n[BENCH] End-to-end latency: sequential stages vs the FAQ search beside classification")
+    print("-"*80)
+    print(f"{len(LABELED_CATEGORIES)} inquiries on a fake model with {latency * 1000:.0f} ms per call")
+
+    async def timed(orchestrator, question, email):
+        start = time.perf_counter()
+        await orchestrator.process_inquiry_async(question, email)
+        return (time.perf_counter() - start) * 1000
+
+    async def run_all(orchestrator):
+        return await asyncio.gather(*(
+            timed(orchestrator, q, f"bench{i}@example.com") for i, (q, _) in enumerate(LABELED_CATEGORIES)
+        ))
+
+    for workload, local in (("local fast paths on", True), ("every stage asks the model", False)):
+        print(f"  {workload}:")
+        # Default governor (no in-flight cap), then a cap below the load, reported on its own
+        for label, parallel, cap in (("sequential", False, None), ("parallel", True, None),
+                                     ("parallel, 32-call cap", True, 32)):
+            orchestrator = quiet_orchestrator(latency)
+            orchestrator.parallel_stages = parallel
+            if cap is not None:
+                governor = ModelGovernor(max_in_flight=cap)
+                for stage in (orchestrator.classifier, orchestrator.researcher, orchestrator.writer,
+                              orchestrator.validator, orchestrator.merged):
+                    stage.agent.governor = governor
+            if not local:
+                orchestrator.classifier.local_threshold = None
+                orchestrator.researcher.summary_threshold = None
+            with contextlib.redirect_stdout(io.StringIO()):
+                timings = asyncio.run(run_all(orchestrator))
+            print(f"    {label:<22} mean {statistics.mean(timings):>6.1f} ms  p50 {percentile(timings, 50):>6.1f} ms  "
+                  f"p95 {percentile(timings, 95):>6.1f} ms  model calls {orchestrator.researcher.agent.model.calls:>4}  "
+                  f"speculation used/wasted {orchestrator.speculations_used}/{orchestrator.speculations_wasted}")
+
+
+def bench_merged(args):
+    import asyncio
+    import contextlib
+    import io
+
+    latency = 0.05
+    inquiries = len(LABELED_CATEGORIES)
+    print("\n[BENCH] Single structured-output call vs the four-agent pipeline")
+    print("-"*80)
+    print(f"{inquiries} inquiries on a fake model with {latency * 1000:.0f} ms per call; "
+          f"tokens estimated at 4 characters each, system instructions included")
+
+    async def timed(orchestrator, question, email):
+        start = time.perf_counter()
+        await orchestrator.process_inquiry_async(question, email)
+        return (time.perf_counter() - start) * 1000
+
+    async def run_all(orchestrator):
+        return await asyncio.gather(*(
+            timed(orchestrator, q, f"bench{i}@example.com") for i, (q, _) in enumerate(LABELED_CATEGORIES)
+        ))
+
+    print(f"  {'single-call categories':<34}{'calls/inq':>10}{'in tok/inq':>12}{'out tok/inq':>12}"
+          f"{'p50 ms':>9}{'p95 ms':>9}  single-call answers")
+    for label, categories in (("none (four agents)", frozenset()),
+                              ("general", frozenset({'general'})),
+                              ("all", frozenset({'account', 'billing', 'technical', 'general'}))):
+        orchestrator = quiet_orchestrator(latency)
+        orchestrator.merged_categories = categories
+        model = orchestrator.merged.agent.model
+        with contextlib.redirect_stdout(io.StringIO()):
+            timings = asyncio.run(run_all(orchestrator))
+        print(f"  {label:<34}{model.calls / inquiries:>10.2f}{model.prompt_tokens / inquiries:>12.0f}"
+              f"{model.output_tokens / inquiries:>12.0f}{percentile(timings, 50):>9.1f}{percentile(timings, 95):>9.1f}"
+              f"  {orchestrator.merged_answers} (fallbacks {orchestrator.merged_fallbacks})")
+
+
+def bench_response_log(args):
+    import contextlib
+    import threading
+    from tools import EmailResponseTool
+
+    total = 32000
+    body = "Dear Customer,\n\nThank you for reaching out.\n" + "Please follow these steps.\n" * 10
+    print("\n[BENCH] Response log: direct append per send vs buffered background writer")
+    print("-"*80)
+    print(f"{total:,} sends of {len(body)} characters; buffered time includes the final flush")
+
+    for producers in (1, 64):
+        for label, buffered in (("direct", False), ("buffered", True)):
+            log_dir = tempfile.mkdtemp()
+            sender = EmailResponseTool(os.path.join(log_dir, "response_log.jsonl"), buffered=buffered)
+
+            def produce(n):
+                for _ in range(total // producers):
+                    sender.send(f"user{n}@example.com", body)
+
+            threads = [threading.Thread(target=produce, args=(n,)) for n in range(producers)]
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                sender.flush()
+                elapsed = time.perf_counter() - start
+            batches = sender.stats()['batches'] if buffered else total
+            sender.close()
+            shutil.rmtree(log_dir, ignore_errors=True)
+            print(f"  {producers:>2} producer(s), {label:<9} {total / elapsed:>10,.0f} sends/s  "
+                  f"({batches:,} writes)")
+
+
+def bench_response_lookups(args):
+    from response_log import TEXT_RULE, SegmentedResponseLog, migrate_text_log, read_text_log
+
+    print("\n[BENCH] Response log lookups: old text log vs indexed, compressed JSON-lines segments")
+    print("-"*80)
+
+    workdir = tempfile.mkdtemp()
+    text_path = os.path.join(workdir, "response_log.txt")
+    log_path = os.path.join(workdir, "response_log.jsonl")
+    rng = random.Random(7)
+    paragraph = "Thank you for contacting support. Here is what to do next.\n"
+    base = time.mktime((2025, 1, 1, 0, 0, 0, 0, 0, -1))
+    target = args.log_mb * 2**20
+    entries = 0
+    with open(text_path, 'w', encoding='utf-8') as f:
+        while f.tell() < target:
+            chunk = []
+            for _ in range(10000):
+                stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(base + entries))
+                body = f"Dear Customer,\n\n{paragraph * rng.randint(8, 24)}Reference {entries}"
+                chunk.append(f"\n{TEXT_RULE}\nTIMESTAMP: {stamp}\nTO: user{rng.randrange(50000)}@example.com\n"
+                             f"SUBJECT: Customer Support Response\n{TEXT_RULE}\n{body}\n{TEXT_RULE}\n\n")
+                entries += 1
+            f.write(''.join(chunk))
+    print(f"Text log: {entries:,} responses, {os.path.getsize(text_path) / 2**30:.2f} GB")
+
+    start = time.perf_counter()
+    scanned = sum(1 for _ in read_text_log(text_path))
+    scan_s = time.perf_counter() - start
+    print(f"  text log, any lookup: full scan          {scan_s * 1000:>12,.0f} ms  ({scanned:,} entries parsed)")
+
+    start = time.perf_counter()
+    migrate_text_log(text_path, log_path, batch_size=10000)
+    migrate_s = time.perf_counter() - start
+    log = SegmentedResponseLog(log_path)
+    segments = log.stats()
+    index_bytes = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir) if name.endswith(".idx"))
+    print(f"  migration: {os.path.getsize(text_path) / 2**20 / migrate_s:,.0f} MB/s, {migrate_s:.1f} s "
+          f"(gzip included); indexes {index_bytes / 2**20:.1f} MB")
+    print(f"  {segments['segments']} segments of up to 64 MB, {(segments['stored_bytes'] + segments['active_bytes']) / 2**20:,.0f} MB "
+          f"on disk for {(segments['sealed_bytes'] + segments['active_bytes']) / 2**20:,.0f} MB of JSON lines")
+    os.unlink(text_path)
+
+    middle = base + entries // 2
+    lookups = [
+        ("last 10", lambda: log.recent(10)),
+        ("by email (newest 20)", lambda: log.find(email="user123@example.com", limit=20)),
+        ("by time range (1 hour)", lambda: log.find(since=middle, until=middle + 3600)),
+    ]
+    for label, lookup in lookups:
+        found = len(lookup())
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            lookup()
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"  indexed, {label:<30}{statistics.median(timings):>12.2f} ms  ({found} entries, "
+              f"{scan_s * 1000 / statistics.median(timings):,.0f}x faster than a scan)")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_recent_responses(args):
+    import tracemalloc
+    from response_log import ResponseLog, tail_lines
+
+    print("\n[BENCH] Last 5 responses as the log grows: whole-file read vs index vs backward tail read")
+    print("-"*80)
+
+    workdir = tempfile.mkdtemp()
+    log = ResponseLog(os.path.join(workdir, "response_log.jsonl"))
+    log.open()
+    rng = random.Random(11)
+    paragraph = "Thank you for contacting support. Here is what to do next.\n"
+    written = 0
+
+    def measure(fn, repeat):
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), peak
+
+    def read_whole_file():
+        # What get_recent_responses used to do: read it all, split, keep the tail
+        with open(log.path, 'rb') as f:
+            return f.read().split(b"\n")[-6:-1]
+
+    print(f"{'log size':>10}{'whole file':>26}{'index':>26}{'tail read':>26}")
+    for size_mb in [mb for mb in (16, 128, 1024) if mb <= args.log_mb]:
+        while log.size < size_mb * 2**20:
+            log.append([{'to': f"user{rng.randrange(50000)}@example.com", 'subject': "Customer Support Response",
+                         'response': f"Dear Customer,\n\n{paragraph * rng.randint(8, 24)}Reference {written + i}"}
+                        for i in range(10000)])
+            written += 10000
+        log.sync()
+        expected = [json.loads(line) for line in read_whole_file()]
+        assert log.recent(5) == expected and [json.loads(line) for line in tail_lines(log.path, 5)] == expected
+
+        row = [measure(read_whole_file, 3), measure(lambda: log.recent(5), 50),
+               measure(lambda: tail_lines(log.path, 5), 50)]
+        print(f"{size_mb:>7} MB" + ''.join(f"{ms:>12.2f} ms {peak / 2**20:>7.1f} MB" for ms, peak in row))
+    log.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_smtp_delivery(args):
+    import contextlib
+    import smtplib
+    from delivery import LocalSMTPServer, SMTPDelivery
+    from tools import EmailResponseTool
+
+    total = 400
+    latency = 0.002
+    messages = [{'to': f"user{i}@example.com", 'subject': "Customer Support Response",
+                 'response': "Dear Customer,\n\n" + "Please follow these steps.\n" * 10} for i in range(total)]
+    print("\n[BENCH] SMTP delivery: connection per message vs pooled, pipelined connections")
+    print("-"*80)
+    print(f"{total} messages to the local SMTP stand-in with {latency * 1000:g} ms per round trip")
+
+    def one_connection_each(server):
+        for message in messages:
+            smtp = smtplib.SMTP(server.hostname, server.port)
+            smtp.sendmail("support@example.com", [message['to']], message['response'].encode())
+            smtp.quit()
+
+    def pooled(server, pool_size):
+        delivery = SMTPDelivery(server.hostname, server.port, pool_size=pool_size)
+        for i in range(0, total, 40):
+            delivery.deliver(messages[i:i + 40])
+        delivery.close()
+
+    runs = [
+        ("new connection per message", False, one_connection_each),
+        ("1 pooled connection", False, lambda server: pooled(server, 1)),
+        ("1 pooled, pipelined", True, lambda server: pooled(server, 1)),
+        ("4 pooled, pipelined", True, lambda server: pooled(server, 4)),
+    ]
+    for label, pipelining, run in runs:
+        with LocalSMTPServer(latency=latency, pipelining=pipelining) as server:
+            start = time.perf_counter()
+            run(server)
+            elapsed = time.perf_counter() - start
+            assert len(server.messages) == total
+            print(f"  {label:<30}{total / elapsed:>8,.0f} msgs/s  {server.connections:>4} connections  "
+                  f"{server.commands / total:>5.1f} commands/msg")
+
+    # What process_inquiry waits for: send() only queues for the background delivery thread
+    log_dir = tempfile.mkdtemp()
+    with LocalSMTPServer(latency=latency) as server:
+        delivery = SMTPDelivery(server.hostname, server.port)
+        sender = EmailResponseTool(os.path.join(log_dir, "response_log.jsonl"), delivery=delivery)
+        timings = []
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for message in messages:
+                start = time.perf_counter()
+                sender.send(message['to'], message['response'])
+                timings.append((time.perf_counter() - start) * 1000)
+            sender.flush()
+        sender.close()
+        timings.sort()
+        print(f"  send() with EMAIL_BACKEND=smtp: median {statistics.median(timings):.3f} ms, "
+              f"p99 {timings[int(len(timings) * 0.99)]:.3f} ms ({delivery.sent} delivered)")
+    shutil.rmtree(log_dir, ignore_errors=True)
+
+
+_LOAD_PROBE = """
+import json, sys, time
+from tools import FAQSearchTool
+start = time.perf_counter()
+tool = FAQSearchTool(sys.argv[1], snapshot_file=sys.argv[2])
+tool.search("password reset"); tool.search("password reset", scorer=sys.argv[3])
+elapsed = (time.perf_counter() - start) * 1000
+status = dict(line.split(':', 1) for line in open('/proc/self/status') if ':' in line)
+kb = lambda field: int(status.get(field, '0 kB').split()[0])
+print(json.dumps({'ms': elapsed, 'rss': kb('VmRSS'), 'anon': kb('RssAnon'), 'file': kb('RssFile'),
+                  'index': type(tool._index).__name__}))
+"""
+
+
+def bench_answer_cache(args):
+    from cache import SemanticAnswerCache, is_negated, question_terms, term_overlap
+    from tools import get_faq_search
+
+    print("\n[BENCH] Answer cache: labelled paraphrases vs different intents by threshold")
+    print("-"*80)
+    print(f"{len(LABELED_PARAPHRASES)} paraphrase pairs should hit, "
+          f"{len(LABELED_DIFFERENT_INTENTS)} different-intent pairs must miss")
+
+    embedder = get_faq_search().embedder()
+    pairs = [(a, b, True) for a, b in LABELED_PARAPHRASES] + [(a, b, False) for a, b in LABELED_DIFFERENT_INTENTS]
+    similarity, overlap = {}, {}
+    for a, b, _ in pairs:
+        vectors = embedder.transform([a, b])
+        similarity[a, b] = float(vectors[0] @ vectors[1])
+        overlap[a, b] = term_overlap(question_terms(a), question_terms(b)) if is_negated(a) == is_negated(b) else 0.0
+
+    for min_overlap in (0.0, 0.5, 0.6, 0.8):
+        for threshold in (0.3, 0.4, 0.5, 0.6, 0.7, 0.8):
+            cache = SemanticAnswerCache(threshold=threshold, embedder=embedder, min_overlap=min_overlap)
+            hits = {True: 0, False: 0}
+            for a, b, same in pairs:
+                cache.clear()
+                cache.store(a, "bench", 0, "answer", {}, 0.0)
+                hits[same] += cache.lookup(b, "bench", 0) is not None
+            print(f"  overlap {min_overlap:.1f}  threshold {threshold:.2f}  "
+                  f"paraphrases hit {hits[True]:>2}/{len(LABELED_PARAPHRASES)}  "
+                  f"wrong answers {hits[False]:>2}/{len(LABELED_DIFFERENT_INTENTS)}")
+
+    print("  pair similarity / term overlap (0 when only one side is negated):")
+    for a, b, same in pairs:
+        print(f"    {'same' if same else 'diff'}  {similarity[a, b]:.2f} / {overlap[a, b]:.2f}  {a!r} vs {b!r}")
+
+
+def bench_snapshot(args):
+    import subprocess
+    import sys
+    from faq_index import compile_snapshot
+
+    print("\n[BENCH] Startup and memory: JSON vs memory-mapped snapshot")
+    print("-"*80)
+
+    workdir = tempfile.mkdtemp()
+    faq_file = os.path.join(workdir, 'faqs.json')
+    with open(faq_file, 'w', encoding='utf-8') as f:
+        json.dump(synthetic_faqs(args.size * 5), f)
+    start = time.perf_counter()
+    snapshot_file = compile_snapshot(faq_file)
+    print(f"Corpus: {args.size * 5:,} entries, JSON {os.path.getsize(faq_file) / 2**20:.1f} MB, "
+          f"snapshot {os.path.getsize(snapshot_file) / 2**20:.1f} MB "
+          f"(compiled in {time.perf_counter() - start:.1f} s)")
+
+    scorer = 'embedding' if numpy_available() else 'bm25'
+    for label, snapshot in (("JSON", os.path.join(workdir, 'none.snapshot')), ("snapshot", snapshot_file)):
+        # Load plus a first search with each scorer, in a fresh process
+        out = subprocess.run([sys.executable, '-c', _LOAD_PROBE, faq_file, snapshot, scorer],
+                             capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        probe = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"  {label:<9} ({probe['index']}) startup {probe['ms']:>8.1f} ms  RSS {probe['rss'] / 1024:>6.1f} MB  "
+              f"private {probe['anon'] / 1024:>6.1f} MB  shared file-backed {probe['file'] / 1024:>6.1f} MB")
+    print(f"  (private memory is paid once per worker; file-backed pages are shared)")
+
+    for name in os.listdir(workdir):
+        os.unlink(os.path.join(workdir, name))
+    os.rmdir(workdir)
+
+
+BENCHMARKS = {
+    'scorers': bench_scorers,
+    'search-many': bench_search_many,
+    'faq-updates': bench_faq_updates,
+    'snapshot': bench_snapshot,
+    'shards': bench_shards,
+    'classifier': bench_classifier,
+    'stages': bench_stages,
+    'parallel': bench_parallel,
+    'merged': bench_merged,
+    'response-log': bench_response_log,
+    'response-lookups': bench_response_lookups,
+    'recent-responses': bench_recent_responses,
+    'smtp-delivery': bench_smtp_delivery,
+    'answer-cache': bench_answer_cache,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('benchmarks', nargs='*',
+                        help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument('--size', type=int, default=10000,
+                        help="Synthetic FAQ entries for corpus-size dependent benchmarks")
+    parser.add_argument('--log-mb', type=int, default=2048,
+                        help="Size of the synthetic response log for response-lookups and recent-responses")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    print("="*80)
+    print("CUSTOMER SUPPORT AI AGENT - BENCHMARKS")
+    print("="*80)
+
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args)
+
+    print("\n" + "="*80)
+
+
+if __name__ == "__main__":
+    main()
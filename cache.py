@@ -0,0 +1,447 @@
+"""Response cache for LLM calls."""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class CachedResponse:
+    """Stands in for a model response: the agents only read ``.text``."""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+def cache_key(agent_name: str, model: str, system_instruction: str,
+              prompt: str, temperature: float) -> str:
+    instruction_hash = hashlib.sha256(system_instruction.encode('utf-8')).hexdigest()
+    raw = json.dumps([agent_name, model, instruction_hash, prompt, temperature])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Base class: subclasses store text by key and keep the counters up to date."""
+
+    backend = "none"
+
+    def __init__(self, ttl: float = 3600.0):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, text: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend,
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class LRUCache(ResponseCache):
+    """In-process cache, evicting the least recently used entry past either limit."""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 2**20, ttl: float = 3600.0):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and item[1] <= time.monotonic():
+                self._discard(key)
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: str, text: str) -> None:
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (text, time.monotonic() + self.ttl, size)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _discard(self, key: str) -> None:
+        self.size_bytes -= self._entries.pop(key)[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats['size_bytes'] = self.size_bytes
+        return stats
+
+
+class SQLiteCache(ResponseCache):
+    """On-disk cache that survives restarts and can be shared by workers on one host."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = "llm_cache.sqlite3", max_entries: int = 100000, ttl: float = 86400.0):
+        super().__init__(ttl)
+        self.path = path
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, text TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT text, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] <= now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.expirations += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, text: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, text, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, text, now + self.ttl, now)
+            )
+            excess = self._count() - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY used_at LIMIT ?)", (excess,)
+                )
+                self.evictions += excess
+
+    def _count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+
+def cache_from_env() -> Optional[ResponseCache]:
+    """Build the cache selected by LLM_CACHE: memory (default), sqlite or off."""
+    backend = os.getenv("LLM_CACHE", "memory").lower()
+    ttl = float(os.getenv("LLM_CACHE_TTL", "3600"))
+    max_entries = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+
+    if backend in ("off", "none", "0", ""):
+        return None
+    if backend == "sqlite":
+        path = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+        try:
+            return SQLiteCache(path, max_entries=max_entries, ttl=ttl)
+        except sqlite3.Error as e:
+            print(f"Warning: Could not open LLM cache '{path}': {e}. Using in-memory cache.")
+    elif backend != "memory":
+        print(f"Warning: Unknown LLM_CACHE '{backend}', using in-memory cache")
+    return LRUCache(max_entries=max_entries, ttl=ttl)
+
+
+_response_cache: Optional[ResponseCache] = None
+_configured = False
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """The process-wide cache shared by all agents, or None if disabled."""
+    global _response_cache, _configured
+    if not _configured:
+        with _cache_lock:
+            if not _configured:
+                _response_cache = cache_from_env()
+                _configured = True
+    return _response_cache
+
+
+# A negated question asks the opposite of its plain form, however close the words
+NEGATION = re.compile(r"\b(?:not|no|never|cannot|\w+n['’]t)\b")
+
+# Words two questions may differ by and still ask the same thing
+FILLER_WORDS = frozenset({'am', 'and', 'any', 'be', 'could', 'for', 'get', 'got', 'hello', 'help', 'hi',
+                          'it', 'just', 'like', 'need', 'of', 'on', 'or', 'please', 'should', 'so',
+                          'some', 'still', 'thanks', 'that', 'there', 'this', 'want', 'was', 'will',
+                          'with', 'would', 'you', 'your'})
+
+_SUFFIXES = ("ing", "edly", "ly", "ed", "es", "e", "s")
+
+
+def is_negated(question: str) -> bool:
+    return NEGATION.search(question.lower()) is not None
+
+
+def question_terms(question: str) -> frozenset:
+    """Crudely stemmed content words of a question, negations left out."""
+    from faq_index import analyze
+    terms = set()
+    for word in analyze(NEGATION.sub(" ", question.lower())):
+        if word in FILLER_WORDS:
+            continue
+        for suffix in _SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)]
+                break
+        terms.add(word)
+    return frozenset(terms)
+
+
+def term_overlap(a: frozenset, b: frozenset) -> float:
+    """Jaccard overlap of two term sets."""
+    union = a | b
+    return len(a & b) / len(union) if union else 1.0
+
+
+class AnswerEntry:
+    __slots__ = ('question', 'category', 'faq_version', 'response', 'faq_results',
+                 'cost_ms', 'expires_at', 'last_used', 'terms', 'negated')
+
+    def __init__(self, question: str, category: str, faq_version: Any, response: str,
+                 faq_results: Dict[str, Any], cost_ms: float, expires_at: float):
+        self.question = question
+        self.terms = question_terms(question)
+        self.negated = is_negated(question)
+        self.category = category
+        self.faq_version = faq_version
+        self.response = response
+        self.faq_results = faq_results
+        self.cost_ms = cost_ms
+        self.expires_at = expires_at
+        self.last_used = time.monotonic()
+
+
+class SemanticAnswerCache:
+    """Validated answers indexed by a local embedding of the question.
+
+    Questions are embedded with the FAQ index's embedder (fitted on the FAQ
+    corpus) unless ``embedder`` is given. A lookup returns the closest stored
+    answer in the same category and FAQ version whose cosine similarity
+    reaches ``threshold``, whose content words overlap by at least
+    ``min_overlap`` (Jaccard) and which is negated only if the question is: a
+    lexical embedding scores "charged twice" close to "charged", so
+    similarity alone would hand out the wrong answer. Entries expire after
+    ``ttl`` seconds. ``python benchmark.py answer-cache`` calibrates both
+    thresholds on labelled pairs.
+    """
+
+    def __init__(self, threshold: float = 0.4, ttl: float = 86400.0, max_entries: int = 512,
+                 embedder: Any = None, min_overlap: float = 0.6):
+        from faq_index import numpy_available
+        if embedder is None and not numpy_available():
+            raise ImportError("NumPy is required for the semantic answer cache. Run: pip install numpy")
+        self.embedder = embedder
+        self._fixed_embedder = embedder is not None
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.latency_saved_ms = 0.0
+        self._entries: Dict[str, List[AnswerEntry]] = {}
+        self._vectors: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, question: str, category: str,
+               faq_version: Any) -> Optional[Tuple[AnswerEntry, float]]:
+        """The best matching entry and its similarity, or None."""
+        terms = question_terms(question)
+        negated = is_negated(question)
+        embedder = self._current_embedder()
+        if embedder is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        vector = embedder.transform([question])[0]
+        with self._lock:
+            self._use_embedder(embedder)
+            self._prune(category, faq_version)
+            entries = self._entries.get(category)
+            if entries:
+                similarities = self._vectors[category] @ vector
+                for best in similarities.argsort()[::-1]:
+                    if similarities[best] < self.threshold:
+                        break
+                    entry = entries[best]
+                    if entry.negated != negated or term_overlap(entry.terms, terms) < self.min_overlap:
+                        continue
+                    entry.last_used = time.monotonic()
+                    self.hits += 1
+                    self.latency_saved_ms += entry.cost_ms
+                    return entry, float(similarities[best])
+            self.misses += 1
+            return None
+
+    def store(self, question: str, category: str, faq_version: Any, response: str,
+              faq_results: Dict[str, Any], cost_ms: float) -> None:
+        import numpy as np
+        embedder = self._current_embedder()
+        if embedder is None:
+            return
+        entry = AnswerEntry(question, category, faq_version, response, faq_results,
+                            cost_ms, time.monotonic() + self.ttl)
+        vector = embedder.transform([question])
+        with self._lock:
+            self._use_embedder(embedder)
+            entries = self._entries.setdefault(category, [])
+            entries.append(entry)
+            vectors = self._vectors.get(category)
+            self._vectors[category] = vector if vectors is None else np.vstack([vectors, vector])
+            self.stores += 1
+            while len(self) > self.max_entries:
+                oldest = min((e for group in self._entries.values() for e in group),
+                             key=lambda e: e.last_used)
+                self._remove(oldest.category, lambda e: e is oldest)
+                self.evictions += 1
+
+    def _current_embedder(self) -> Any:
+        if self._fixed_embedder:
+            return self.embedder
+        # Never fit the FAQ embedder inline: until it is ready, lookups miss
+        from tools import get_faq_search
+        return get_faq_search().embedder(fit=False)
+
+    def _use_embedder(self, embedder: Any) -> None:
+        if embedder is not self.embedder:
+            # Refitted on a reloaded corpus: old vectors are not comparable
+            self._entries.clear()
+            self._vectors.clear()
+            self.embedder = embedder
+
+    def _prune(self, category: str, faq_version: Any) -> None:
+        now = time.monotonic()
+        self.expirations += self._remove(category, lambda e: e.expires_at <= now)
+        self.invalidations += self._remove(category, lambda e: e.faq_version != faq_version)
+
+    def _remove(self, category: str, drop) -> int:
+        entries = self._entries.get(category, [])
+        keep = [i for i, e in enumerate(entries) if not drop(e)]
+        removed = len(entries) - len(keep)
+        if removed:
+            self._entries[category] = [entries[i] for i in keep]
+            self._vectors[category] = self._vectors[category][keep]
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+
+    def __len__(self) -> int:
+        return sum(len(group) for group in self._entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'latency_saved_ms': round(self.latency_saved_ms, 1),
+            'threshold': self.threshold,
+            'min_overlap': self.min_overlap
+        }
+
+
+def answer_cache_from_env() -> Optional[SemanticAnswerCache]:
+    """Build the answer cache unless ANSWER_CACHE=off; it needs NumPy for the embeddings."""
+    if os.getenv("ANSWER_CACHE", "on").lower() in ("off", "none", "0", ""):
+        return None
+    try:
+        return SemanticAnswerCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.4")),
+            min_overlap=float(os.getenv("ANSWER_CACHE_MIN_OVERLAP", "0.6")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+        )
+    except ImportError as e:
+        print(f"Warning: Semantic answer cache disabled: {e}")
+        return None
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_configured = False
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """The process-wide semantic answer cache, or None if disabled."""
+    global _answer_cache, _answer_cache_configured
+    if not _answer_cache_configured:
+        with _cache_lock:
+            if not _answer_cache_configured:
+                _answer_cache = answer_cache_from_env()
+                _answer_cache_configured = True
+    return _answer_cache
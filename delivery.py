@@ -0,0 +1,446 @@
+"""Outbound delivery backends for EmailResponseTool.
+
+Every response is written to the response log first; that alone is the
+default ("file") backend. SMTPDelivery additionally sends it over a pool of
+open SMTP connections. LocalSMTPServer is a stdlib SMTP stand-in for tests
+and benchmarks.
+"""
+
+import binascii
+import math
+import os
+import random
+import re
+import smtplib
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.header import Header
+from email.utils import formatdate, make_msgid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def reply_code(error: BaseException) -> Optional[int]:
+    """The SMTP reply code behind ``error``, if the server sent one."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return max(code for code, _ in error.recipients.values())
+    return getattr(error, 'smtp_code', None)
+
+
+def is_transient(error: BaseException) -> bool:
+    """4xx replies, dropped connections and network errors; 5xx replies will fail the same way again."""
+    code = reply_code(error)
+    if code is not None:
+        return 400 <= code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class SMTPDelivery:
+    """Sends responses over SMTP from a pool of reusable connections.
+
+    A sink for ``log_writer.BufferedWriter``: ``append`` takes a batch of
+    log entries (to, subject, response), splits it across up to
+    ``pool_size`` connections and sends each share over one connection,
+    ``batch_size`` messages at most. When the server offers PIPELINING, the
+    envelope and DATA go out in one write. Transient failures are retried
+    with jittered exponential backoff, reconnecting if the connection was
+    lost; 5xx replies fail the message at once.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 25, sender: str = "support@example.com",
+                 username: Optional[str] = None, password: Optional[str] = None, starttls: bool = False,
+                 timeout: float = 10.0, pool_size: int = 4, batch_size: int = 20, max_retries: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 8.0, idle_timeout: float = 60.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Servers drop idle clients after a few minutes; older connections are replaced, not reused
+        self.idle_timeout = idle_timeout
+        self._domain = sender.rpartition('@')[2] or "localhost"
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.connections = 0
+        self.reused = 0
+        self.pipelined = 0
+        # The last messages given up on, for /api/support/stats
+        self.recent_failures: deque = deque(maxlen=20)
+        self._idle: deque = deque()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def open(self) -> None:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.pool_size, thread_name_prefix="smtp-delivery")
+
+    def append(self, messages: Iterable[Dict[str, Any]]) -> int:
+        """Deliver ``messages``; bytes sent for the ones that got through."""
+        return sum(size for size, error in self.deliver(messages) if error is None)
+
+    def deliver(self, messages: Iterable[Dict[str, Any]]) -> List[Tuple[int, Optional[Exception]]]:
+        """(bytes, error or None) for each message, in order."""
+        messages = list(messages)
+        if not messages:
+            return []
+        self.open()
+        share = max(1, min(self.batch_size, math.ceil(len(messages) / self.pool_size)))
+        shares = [messages[i:i + share] for i in range(0, len(messages), share)]
+        if len(shares) == 1:
+            return self._deliver_share(shares[0])
+        return [result for results in self._executor.map(self._deliver_share, shares) for result in results]
+
+    def sync(self) -> None:
+        pass
+
+    def close(self) -> None:
+        """Say QUIT on every idle connection and stop the delivery threads."""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for smtp, _ in idle:
+            self._quit(smtp)
+
+    def _deliver_share(self, messages: List[Dict[str, Any]]) -> List[Tuple[int, Optional[Exception]]]:
+        results: List[Tuple[int, Optional[Exception]]] = []
+        smtp = None
+        try:
+            for message in messages:
+                attempt = 0
+                while True:
+                    try:
+                        data = self._format(message)
+                        if smtp is None:
+                            smtp = self._checkout()
+                        self._send(smtp, message['to'], data)
+                    except Exception as e:
+                        smtp = self._recover(smtp, e)
+                        delay = self._failed(e, attempt)
+                        if delay is None:
+                            print(f"✗ Failed to deliver response to {message.get('to')}: {e}")
+                            with self._lock:
+                                self.recent_failures.append({
+                                    'to': message.get('to'),
+                                    'subject': message.get('subject'),
+                                    'error': str(e),
+                                    'failed_at': time.strftime("%Y-%m-%dT%H:%M:%S")
+                                })
+                            results.append((0, e))
+                            break
+                        attempt += 1
+                        time.sleep(delay)
+                    else:
+                        with self._lock:
+                            self.sent += 1
+                        results.append((len(data), None))
+                        break
+        finally:
+            if smtp is not None:
+                self._checkin(smtp)
+        return results
+
+    def _format(self, message: Dict[str, Any]) -> bytes:
+        # Built by hand: email.message.EmailMessage takes over a millisecond per message
+        to, subject = message['to'], message.get('subject', "Customer Support Response")
+        if any(c in to or c in subject for c in "\r\n"):
+            raise ValueError("Header values may not contain line breaks")
+        if not subject.isascii():
+            subject = Header(subject, 'utf-8').encode()
+        body = message['response'].replace("\r\n", "\n").replace("\r", "\n")
+        if body.isascii() and all(len(line) <= 998 for line in body.split("\n")):
+            encoding, payload = "7bit", body.encode('ascii')
+        else:
+            encoding, payload = "quoted-printable", binascii.b2a_qp(body.encode('utf-8'))
+        payload = payload.replace(b"\n", b"\r\n")
+        if not payload.endswith(b"\r\n"):
+            payload += b"\r\n"
+        headers = (f"From: {self.sender}\r\nTo: {to}\r\nSubject: {subject}\r\n"
+                   f"Date: {formatdate(localtime=True)}\r\n"
+                   # An explicit domain avoids make_msgid's getfqdn() lookup on every message
+                   f"Message-ID: {make_msgid(domain=self._domain)}\r\nMIME-Version: 1.0\r\n"
+                   f"Content-Type: text/plain; charset=\"utf-8\"\r\n"
+                   f"Content-Transfer-Encoding: {encoding}\r\n\r\n")
+        return headers.encode('ascii') + payload
+
+    def _send(self, smtp: smtplib.SMTP, to: str, data: bytes) -> None:
+        if not smtp.has_extn('pipelining'):
+            smtp.sendmail(self.sender, [to], data)
+            return
+        # RFC 2920: MAIL, RCPT and DATA in one write, then their replies together
+        smtp.send(f"MAIL FROM:<{self.sender}>\r\nRCPT TO:<{to}>\r\nDATA\r\n".encode('ascii'))
+        replies = [smtp.getreply() for _ in range(3)]
+        if replies[2][0] == 354:
+            smtp.send(re.sub(rb'(?m)^\.', b'..', data) + b".\r\n")
+            replies.append(smtp.getreply())
+        with self._lock:
+            self.pipelined += 1
+        for code, text in replies:
+            if code >= 400:
+                raise smtplib.SMTPResponseException(code, text)
+
+    def _checkout(self) -> smtplib.SMTP:
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            while self._idle:
+                smtp, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout:
+                    self.reused += 1
+                    break
+                stale.append(smtp)
+            else:
+                smtp = None
+        for old in stale:
+            self._quit(old)
+        return smtp if smtp is not None else self._connect()
+
+    def _checkin(self, smtp: smtplib.SMTP) -> None:
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append((smtp, time.monotonic()))
+                return
+        self._quit(smtp)
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, local_hostname=self._domain, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.starttls:
+                smtp.starttls()
+                smtp.ehlo()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+        except Exception:
+            smtp.close()
+            raise
+        with self._lock:
+            self.connections += 1
+        return smtp
+
+    def _recover(self, smtp: Optional[smtplib.SMTP], error: Exception) -> Optional[smtplib.SMTP]:
+        """The connection to carry on with after ``error``, or None to reconnect."""
+        if smtp is None:
+            return None
+        if reply_code(error) is not None:
+            # The server answered, so the connection is fine once the transaction is reset
+            try:
+                smtp.rset()
+                return smtp
+            except Exception:
+                pass
+        smtp.close()
+        return None
+
+    def _failed(self, error: Exception, attempt: int) -> Optional[float]:
+        """Backoff before the next attempt, or None to give up."""
+        with self._lock:
+            if not is_transient(error) or attempt >= self.max_retries:
+                self.failed += 1
+                return None
+            self.retries += 1
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def _quit(smtp: smtplib.SMTP) -> None:
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': 'smtp',
+                'sent': self.sent,
+                'failed': self.failed,
+                'retries': self.retries,
+                'connections': self.connections,
+                'reused': self.reused,
+                'pipelined': self.pipelined,
+                'idle': len(self._idle),
+                'recent_failures': list(self.recent_failures)
+            }
+
+
+def delivery_from_env() -> Optional[SMTPDelivery]:
+    """SMTPDelivery configured by the SMTP_* variables if EMAIL_BACKEND=smtp; None (log file only) otherwise."""
+    backend = os.getenv("EMAIL_BACKEND", "file").lower()
+    if backend in ("file", "off", "none", ""):
+        return None
+    if backend != "smtp":
+        print(f"Warning: Unknown EMAIL_BACKEND '{backend}', logging responses to the file only")
+        return None
+    return SMTPDelivery(
+        host=os.getenv("SMTP_HOST", "localhost"),
+        port=int(os.getenv("SMTP_PORT", "25")),
+        sender=os.getenv("SMTP_FROM", "support@example.com"),
+        username=os.getenv("SMTP_USERNAME") or None,
+        password=os.getenv("SMTP_PASSWORD") or None,
+        starttls=os.getenv("SMTP_STARTTLS", "off").lower() in ("on", "1", "true"),
+        timeout=float(os.getenv("SMTP_TIMEOUT", "10")),
+        pool_size=int(os.getenv("SMTP_POOL_SIZE", "4")),
+        batch_size=int(os.getenv("SMTP_BATCH_SIZE", "20")),
+        max_retries=int(os.getenv("SMTP_MAX_RETRIES", "3"))
+    )
+
+
+_DISCONNECT = object()
+
+
+class _SMTPHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        server: 'LocalSMTPServer' = self.server.controller
+        sock = self.request
+        server._count('connections')
+        replies = [b"220 localhost ESMTP stand-in\r\n"]
+        pending = b''
+        mail_from, rcpt_tos, data = None, [], None
+        closing = False
+        while True:
+            if replies:
+                # One simulated round trip per batch of replies, however many commands it answers
+                if server.latency:
+                    time.sleep(server.latency)
+                sock.sendall(b''.join(replies))
+                replies = []
+            if closing:
+                return
+            chunk = sock.recv(65536)
+            if not chunk:
+                return
+            lines = (pending + chunk).split(b"\r\n")
+            pending = lines.pop()
+            for line in lines:
+                if data is not None:
+                    if line == b".":
+                        server._received(mail_from, rcpt_tos, b"\r\n".join(data) + b"\r\n")
+                        replies.append(b"250 2.0.0 OK: queued\r\n")
+                        mail_from, rcpt_tos, data = None, [], None
+                    else:
+                        data.append(line[1:] if line.startswith(b".") else line)
+                    continue
+                server._count('commands')
+                verb = line[:4].upper()
+                if verb == b"EHLO":
+                    replies.append(b"250-localhost\r\n" + (b"250-PIPELINING\r\n" if server.pipelining else b"")
+                                   + b"250-8BITMIME\r\n250 SIZE 10485760\r\n")
+                elif verb == b"HELO":
+                    replies.append(b"250 localhost\r\n")
+                elif verb == b"MAIL":
+                    fault = server._take_fault()
+                    if fault is _DISCONNECT:
+                        return
+                    if fault is not None:
+                        replies.append(fault.encode('ascii') + b"\r\n")
+                        continue
+                    mail_from, rcpt_tos = line[10:].strip().strip(b"<>").decode(), []
+                    replies.append(b"250 2.1.0 OK\r\n")
+                elif verb == b"RCPT":
+                    if mail_from is None:
+                        replies.append(b"503 5.5.1 Error: need MAIL command\r\n")
+                        continue
+                    rcpt_tos.append(line[8:].strip().strip(b"<>").decode())
+                    replies.append(b"250 2.1.5 OK\r\n")
+                elif verb == b"DATA":
+                    if not rcpt_tos:
+                        replies.append(b"503 5.5.1 Error: need RCPT command\r\n")
+                        continue
+                    data = []
+                    replies.append(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                elif verb == b"RSET":
+                    mail_from, rcpt_tos = None, []
+                    replies.append(b"250 2.0.0 OK\r\n")
+                elif verb == b"NOOP":
+                    replies.append(b"250 2.0.0 OK\r\n")
+                elif verb == b"QUIT":
+                    replies.append(b"221 2.0.0 Bye\r\n")
+                    closing = True
+                    break
+                else:
+                    replies.append(b"502 5.5.2 Error: command not recognized\r\n")
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LocalSMTPServer:
+    """In-process SMTP server for tests and benchmarks, started and stopped like aiosmtpd's Controller.
+
+    Accepts every message and keeps it in ``messages`` (mail_from, rcpt_tos,
+    data). ``latency`` seconds pass before each batch of replies, standing in
+    for the network round trip. ``fail_next`` and ``disconnect_next`` make
+    the next MAIL commands get an error reply or a dropped connection.
+    """
+
+    def __init__(self, hostname: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 pipelining: bool = True):
+        self.hostname = hostname
+        self.port = port
+        self.latency = latency
+        self.pipelining = pipelining
+        self.messages: List[Dict[str, Any]] = []
+        self.connections = 0
+        self.commands = 0
+        self._faults: deque = deque()
+        self._lock = threading.Lock()
+        self._server: Optional[_ThreadingServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'LocalSMTPServer':
+        self._server = _ThreadingServer((self.hostname, self.port), _SMTPHandler)
+        self._server.controller = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="local-smtp", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self) -> 'LocalSMTPServer':
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def fail_next(self, count: int = 1, reply: str = "451 4.3.0 Try again later") -> None:
+        with self._lock:
+            self._faults.extend([reply] * count)
+
+    def disconnect_next(self, count: int = 1) -> None:
+        with self._lock:
+            self._faults.extend([_DISCONNECT] * count)
+
+    def _take_fault(self) -> Any:
+        with self._lock:
+            return self._faults.popleft() if self._faults else None
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _received(self, mail_from: str, rcpt_tos: List[str], data: bytes) -> None:
+        with self._lock:
+            self.messages.append({'mail_from': mail_from, 'rcpt_tos': rcpt_tos, 'data': data})
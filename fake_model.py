@@ -0,0 +1,136 @@
+"""
+Offline stand-in for the Gemini model, for tests and benchmarks.
+
+Answers every agent's prompt with a plausible canned reply after a fixed
+simulated latency, and counts calls, estimated tokens and peak concurrency.
+"""
+
+import asyncio
+import json
+import math
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any
+
+
+CATEGORY_KEYWORDS = {
+    'account': ('password', 'log in', 'login', 'email', 'account', 'profile', 'locked'),
+    'billing': ('invoice', 'refund', 'payment', 'billing', 'charge', 'receipt', 'subscription'),
+    'technical': ('app', 'error', 'slow', 'crash', 'bug', 'load', 'open'),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return math.ceil(len(text) / 4)
+
+
+def category_for(question: str) -> str:
+    question = question.lower()
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        if any(keyword in question for keyword in keywords):
+            return category
+    return 'general'
+
+
+class FakeResponse:
+    def __init__(self, text: str, prompt_tokens: int = 0):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(prompt_token_count=prompt_tokens,
+                                              candidates_token_count=estimate_tokens(text))
+
+
+class FakeModel:
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str, generation_config: Any = None,
+                         system_instruction: str = "") -> FakeResponse:
+        self._enter()
+        try:
+            time.sleep(self.latency)
+            return self._respond(prompt, system_instruction)
+        finally:
+            self._exit()
+
+    async def generate_content_async(self, prompt: str, generation_config: Any = None,
+                                     system_instruction: str = "") -> FakeResponse:
+        self._enter()
+        try:
+            await asyncio.sleep(self.latency)
+            return self._respond(prompt, system_instruction)
+        finally:
+            self._exit()
+
+    def _respond(self, prompt: str, system_instruction: str) -> FakeResponse:
+        # The system instruction is billed as input on every call
+        response = FakeResponse(self.reply(prompt), estimate_tokens(system_instruction + prompt))
+        with self._lock:
+            self.prompt_tokens += response.usage_metadata.prompt_token_count
+            self.output_tokens += response.usage_metadata.candidates_token_count
+        return response
+
+    def reply(self, prompt: str) -> str:
+        if prompt.startswith("Classify this inquiry:"):
+            return category_for(prompt.split(':', 1)[1])
+        if prompt.startswith("Answer this customer inquiry in one step"):
+            question = prompt.split("Customer Question:", 1)[1].split("\n", 1)[0]
+            return json.dumps({
+                'category': category_for(question),
+                'response': ("Dear Customer,\n\nThank you for reaching out. Please follow the steps "
+                             "from our help center.\n\nBest regards,\nCustomer Support Team"),
+                'approved': True,
+                'issues': ""
+            })
+        if prompt.startswith("Validate this customer support response"):
+            return "STATUS: APPROVED\nISSUES: None\nSUGGESTIONS: None"
+        if prompt.startswith("Search for FAQs"):
+            return "The FAQ entries above cover this question."
+        if prompt.startswith("Revise this customer support response"):
+            return ("Dear Customer,\n\nThank you for reaching out. Here are the exact steps "
+                    "from our help center.\n\nBest regards,\nCustomer Support Team")
+        return ("Dear Customer,\n\nThank you for reaching out. Please follow the steps "
+                "from our help center.\n\nBest regards,\nCustomer Support Team")
+
+    def _enter(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+class AgentModel:
+    """One agent's handle on a shared FakeModel, passing along its system instruction."""
+
+    def __init__(self, model: FakeModel, system_instruction: str):
+        self.model = model
+        self.system_instruction = system_instruction
+
+    def generate_content(self, prompt: str, generation_config: Any = None) -> FakeResponse:
+        return self.model.generate_content(prompt, generation_config, self.system_instruction)
+
+    async def generate_content_async(self, prompt: str, generation_config: Any = None) -> FakeResponse:
+        return await self.model.generate_content_async(prompt, generation_config, self.system_instruction)
+
+    def __getattr__(self, name: str) -> Any:
+        # Counters and settings live on the shared model
+        return getattr(self.model, name)
+
+
+def install(orchestrator, model: FakeModel) -> FakeModel:
+    """Point every agent of ``orchestrator`` at ``model``."""
+    for stage in (orchestrator.classifier, orchestrator.researcher, orchestrator.writer,
+                  orchestrator.validator, orchestrator.merged):
+        stage.agent.model = AgentModel(model, stage.agent.system_instruction)
+    return model
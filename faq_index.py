@@ -0,0 +1,953 @@
+"""Inverted index over the FAQ knowledge base."""
+
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from typing import List, Dict, Any, NamedTuple, Iterable, Iterator, Optional, Sequence, Tuple
+
+# NumPy is optional and only needed for embedding search; it is imported on
+# first use so importing this module stays cheap
+np = None
+_numpy_missing = False
+
+
+def numpy_available() -> bool:
+    global np, _numpy_missing
+    if np is None and not _numpy_missing:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            _numpy_missing = True
+    return np is not None
+
+
+STOP_WORDS = frozenset({'how', 'do', 'i', 'can', 'what', 'where', 'why', 'when',
+                        'is', 'are', 'the', 'a', 'an', 'to', 'my', 'me'})
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def analyze(text: str) -> List[str]:
+    """Lowercased word tokens used for BM25, without stop words or stray letters."""
+    return [w for w in _WORD_RE.findall(text.lower()) if len(w) > 1 and w not in STOP_WORDS]
+
+
+class BM25Stats(NamedTuple):
+    n_docs: int
+    avg_question_len: float
+    avg_answer_len: float
+    doc_freq: Dict[str, int]
+
+
+class FAQEntry(NamedTuple):
+    category: str
+    key: str
+    question: str
+    answer: str
+    question_lower: str
+    answer_lower: str
+
+
+class FAQIndex:
+    # Snapshot-backed indexes can't be modified in place
+    read_only = False
+    # Set when this index is one category shard of a ShardedFAQIndex
+    shard_category: Optional[str] = None
+    _parent: Optional["ShardedFAQIndex"] = None
+
+    # Cap on cached keyword -> doc id expansions before the cache is reset
+    TERM_CACHE_SIZE = 4096
+    # Embedder fitted without building the vectors, see embedder()
+    _embedder: Optional["HashingEmbedder"] = None
+    _embedder_lock = threading.Lock()
+
+    # BM25F parameters; question terms count double
+    BM25_K1 = 1.2
+    BM25_B = 0.75
+    QUESTION_WEIGHT = 2.0
+    ANSWER_WEIGHT = 1.0
+
+    def __init__(self, faqs: Dict[str, Any], parent: Optional["ShardedFAQIndex"] = None):
+        self.faqs = faqs
+        self._parent = parent
+        if parent is not None:
+            self.shard_category = next(iter(faqs))
+        # Deleted and replaced entries leave a None tombstone so doc ids stay
+        # stable; readers skip them and a rebuild compacts them away
+        self.entries: List[Optional[FAQEntry]] = []
+        self.doc_ids: Dict[Tuple[str, str], int] = {}
+        self.live_count = 0
+        self.postings: Dict[str, List[int]] = {}
+        self._term_cache: Dict[str, List[int]] = {}
+        self._generation = 0
+
+        # BM25 statistics: per-term postings with per-field term frequencies,
+        # and per-doc field lengths, all as typed arrays
+        self.term_ids: Dict[str, int] = {}
+        self.doc_freq = array('I')
+        self.term_docs: List[array] = []
+        self.term_tf_question: List[array] = []
+        self.term_tf_answer: List[array] = []
+        self.question_len = array('I')
+        self.answer_len = array('I')
+        self.total_question_len = 0
+        self.total_answer_len = 0
+
+        # Dense vectors for scorer='embedding', built on first use
+        self._embeddings: Optional["FAQEmbeddingIndex"] = None
+
+        for cat, items in faqs.items():
+            for faq_key, faq_data in items.items():
+                self._add_entry(cat, faq_key, faq_data)
+
+    def __len__(self) -> int:
+        return self.live_count
+
+    @property
+    def dead_count(self) -> int:
+        return len(self.entries) - self.live_count
+
+    def live_entries(self) -> Iterator[FAQEntry]:
+        return (entry for entry in self.entries if entry is not None)
+
+    def get(self, category: str, key: str) -> Optional[FAQEntry]:
+        doc_id = self.doc_ids.get((category, key))
+        return self.entries[doc_id] if doc_id is not None else None
+
+    def _add_entry(self, category: str, key: str, faq_data: Dict[str, str]) -> int:
+        # Writes are ordered so a concurrent reader never follows a doc id or
+        # term id into a structure that has not been extended yet
+        question = faq_data.get('question', '')
+        answer = faq_data.get('answer', '')
+        doc_id = len(self.entries)
+        entry = FAQEntry(category, key, question, answer, question.lower(), answer.lower())
+
+        question_terms = analyze(question)
+        answer_terms = analyze(answer)
+        self.question_len.append(len(question_terms))
+        self.answer_len.append(len(answer_terms))
+        self.total_question_len += len(question_terms)
+        self.total_answer_len += len(answer_terms)
+        self.entries.append(entry)
+        self.doc_ids[(category, key)] = doc_id
+        self.live_count += 1
+
+        # Whitespace tokens: a query keyword never contains whitespace, so it is a
+        # substring of the text exactly when it is a substring of one of these tokens
+        for token in set(entry.question_lower.split()) | set(entry.answer_lower.split()):
+            self.postings.setdefault(token, []).append(doc_id)
+
+        for term, (tf_question, tf_answer) in self._term_frequencies(question_terms, answer_terms).items():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                self.doc_freq.append(0)
+                self.term_docs.append(array('I'))
+                self.term_tf_question.append(array('H'))
+                self.term_tf_answer.append(array('H'))
+                term_id = self.term_ids[term] = len(self.term_docs) - 1
+            self.doc_freq[term_id] += 1
+            self.term_tf_question[term_id].append(min(tf_question, 0xFFFF))
+            self.term_tf_answer[term_id].append(min(tf_answer, 0xFFFF))
+            self.term_docs[term_id].append(doc_id)
+
+        return doc_id
+
+    def _remove_entry(self, doc_id: int) -> None:
+        entry = self.entries[doc_id]
+        question_terms = analyze(entry.question)
+        answer_terms = analyze(entry.answer)
+
+        # Postings keep the dead doc id; only the statistics are retracted
+        self.entries[doc_id] = None
+        del self.doc_ids[(entry.category, entry.key)]
+        self.live_count -= 1
+        self.total_question_len -= len(question_terms)
+        self.total_answer_len -= len(answer_terms)
+        for term in self._term_frequencies(question_terms, answer_terms):
+            self.doc_freq[self.term_ids[term]] -= 1
+
+        if self._embeddings is not None:
+            self._embeddings.remove(doc_id)
+
+    @staticmethod
+    def _term_frequencies(question_terms: List[str], answer_terms: List[str]) -> Dict[str, List[int]]:
+        tf: Dict[str, List[int]] = {}
+        for term in question_terms:
+            tf.setdefault(term, [0, 0])[0] += 1
+        for term in answer_terms:
+            tf.setdefault(term, [0, 0])[1] += 1
+        return tf
+
+    def upsert(self, category: str, key: str, faq_data: Dict[str, str]) -> bool:
+        """Add or replace one FAQ in place; returns True if it is new.
+
+        Cost is proportional to the entry's own terms, not the corpus. A
+        replaced FAQ moves to the end of the tie-break order.
+        """
+        old_doc_id = self.doc_ids.get((category, key))
+        if old_doc_id is not None:
+            self._remove_entry(old_doc_id)
+
+        self.faqs.setdefault(category, {})[key] = dict(faq_data)
+        doc_id = self._add_entry(category, key, faq_data)
+        if self._embeddings is not None:
+            self._embeddings.add(self.entries[doc_id])
+        self._invalidate_term_cache()
+        return old_doc_id is None
+
+    def delete(self, category: str, key: str) -> bool:
+        doc_id = self.doc_ids.get((category, key))
+        if doc_id is None:
+            return False
+
+        self._remove_entry(doc_id)
+        del self.faqs[category][key]
+        self._invalidate_term_cache()
+        return True
+
+    def _invalidate_term_cache(self) -> None:
+        self._generation += 1
+        self._term_cache = {}
+
+    def has_embeddings(self) -> bool:
+        return self._embeddings is not None
+
+    def embeddings(self) -> "FAQEmbeddingIndex":
+        if self._embeddings is None:
+            # Shards share one embedder fitted on the whole corpus so that
+            # similarities stay comparable across shards
+            embedder = self._parent.embedder() if self._parent is not None else self._embedder
+            self._embeddings = FAQEmbeddingIndex(self.entries, embedder)
+        return self._embeddings
+
+    def embedder(self) -> "HashingEmbedder":
+        """The embedder for this index's vectors, fitted without building them."""
+        if self._parent is not None:
+            return self._parent.embedder()
+        if self._embeddings is not None:
+            return self._embeddings.embedder
+        with self._embedder_lock:
+            if self._embedder is None:
+                self._embedder = HashingEmbedder().fit(
+                    [FAQEmbeddingIndex._text(entry) for entry in self.live_entries()])
+            return self._embedder
+
+    def embedder_fitted(self) -> bool:
+        if self._parent is not None:
+            return self._parent.embedder_fitted()
+        return self._embeddings is not None or self._embedder is not None
+
+    def build_embeddings(self) -> None:
+        self.embeddings()
+
+    def shards_for(self, category: Optional[str]) -> List["FAQIndex"]:
+        """Indexes to search for ``category``; an unsharded index is its own only shard."""
+        return [self]
+
+    def compacted(self) -> "FAQIndex":
+        """A fresh index over the same FAQs, without tombstones."""
+        return FAQIndex(self.faqs)
+
+    def lookup(self, term: str) -> List[int]:
+        """Doc ids whose question or answer contains ``term`` as a substring.
+
+        May include tombstoned doc ids.
+        """
+        term_cache, generation = self._term_cache, self._generation
+        cached = term_cache.get(term)
+        if cached is not None:
+            return cached
+
+        exact = self.postings.get(term)
+        # Snapshot the items: a concurrent upsert may add tokens
+        matches = [postings for token, postings in list(self.postings.items())
+                   if term in token and token != term]
+        if not matches:
+            doc_ids = list(exact or [])
+        else:
+            merged = set(exact or [])
+            for postings in matches:
+                merged.update(postings)
+            doc_ids = sorted(merged)
+
+        if generation == self._generation:
+            if len(term_cache) >= self.TERM_CACHE_SIZE:
+                term_cache.clear()
+            term_cache[term] = doc_ids
+        return doc_ids
+
+    def candidates(self, query: str, keywords: Iterable[str]) -> List[int]:
+        """Doc ids that can score above zero for ``query``, in corpus order.
+
+        A doc scores when it contains a keyword or the whole query phrase. Any
+        doc containing the phrase contains each of its words, so the postings of
+        the longest word cover phrase matches.
+        """
+        words = query.split()
+        if not words:
+            # Empty or whitespace-only query: the phrase check decides for every doc
+            return self._live(range(len(self.entries)))
+
+        doc_ids = set(self.lookup(max(words, key=len)))
+        for keyword in keywords:
+            doc_ids.update(self.lookup(keyword))
+        return self._live(doc_ids)
+
+    def _live(self, doc_ids: Iterable[int]) -> List[int]:
+        if not self.dead_count:
+            return sorted(doc_ids)
+        entries = self.entries
+        return sorted(d for d in doc_ids if entries[d] is not None)
+
+    def candidates_many(self, queries: Sequence[str],
+                        keyword_lists: Sequence[Iterable[str]]) -> List[List[int]]:
+        """candidates() for many queries, expanding each distinct term only once."""
+        expanded: Dict[str, List[int]] = {}
+        results = []
+        for query, keywords in zip(queries, keyword_lists):
+            words = query.split()
+            if not words:
+                results.append(self._live(range(len(self.entries))))
+                continue
+
+            doc_ids = set()
+            for term in [max(words, key=len), *keywords]:
+                postings = expanded.get(term)
+                if postings is None:
+                    postings = expanded[term] = self.lookup(term)
+                doc_ids.update(postings)
+            results.append(self._live(doc_ids))
+        return results
+
+    def bm25_stats(self, terms: Iterable[str]) -> BM25Stats:
+        n_docs = self.live_count
+        return BM25Stats(
+            n_docs,
+            (self.total_question_len / n_docs) if n_docs else 0.0,
+            (self.total_answer_len / n_docs) if n_docs else 0.0,
+            {term: self.doc_freq[self.term_ids[term]] for term in terms if term in self.term_ids}
+        )
+
+    def bm25_scores(self, query: str, stats: Optional[BM25Stats] = None) -> Dict[int, float]:
+        """BM25F score for every doc sharing a term with ``query``.
+
+        ``stats`` carries corpus-wide statistics when this index is one shard.
+        """
+        terms = set(analyze(query))
+        stats = stats or self.bm25_stats(terms)
+        n_docs = stats.n_docs
+        if not n_docs or not self.live_count:
+            return {}
+
+        k1, b = self.BM25_K1, self.BM25_B
+        avg_question_len = stats.avg_question_len or 1.0
+        avg_answer_len = stats.avg_answer_len or 1.0
+        entries, question_len, answer_len = self.entries, self.question_len, self.answer_len
+        check_dead = self.dead_count > 0
+
+        scores: Dict[int, float] = {}
+        for term in terms:
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            df = stats.doc_freq[term]
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            tf_question = self.term_tf_question[term_id]
+            tf_answer = self.term_tf_answer[term_id]
+
+            for i, doc_id in enumerate(self.term_docs[term_id]):
+                if check_dead and entries[doc_id] is None:
+                    continue
+                tf = (self.QUESTION_WEIGHT * tf_question[i]
+                      / (1.0 - b + b * question_len[doc_id] / avg_question_len)
+                      + self.ANSWER_WEIGHT * tf_answer[i]
+                      / (1.0 - b + b * answer_len[doc_id] / avg_answer_len))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1.0) / (tf + k1)
+
+        return scores
+
+
+def _stem(token: str) -> str:
+    # Crude suffix stripping so "loads"/"loading" and "invoice"/"invoices" meet
+    for suffix in ('ing', 'ly', 'ed', 'es', 's'):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+class CategoryClassifier:
+    """Multinomial naive Bayes over the FAQ text, one class per category.
+
+    Trained on index entries; ``add``/``remove`` keep it in step with a single
+    edited FAQ at the cost of that entry's terms. ``hints`` adds training text
+    per category, such as category descriptions. predict() returns the best
+    category with its posterior probability, or ``(None, 0.0)`` when the text
+    shares no vocabulary with the FAQs.
+    """
+
+    QUESTION_WEIGHT = 2
+
+    def __init__(self, entries: Iterable[Optional[FAQEntry]] = (), hints: Optional[Dict[str, str]] = None):
+        self.hints = dict(hints or {})
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.totals: Dict[str, int] = {}
+        # Weight of each term over all categories; the vocabulary is its keys
+        self.vocabulary: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        for entry in entries:
+            if entry is not None:
+                self.add(entry)
+
+    def add(self, entry: FAQEntry) -> None:
+        with self._lock:
+            if entry.category not in self.counts:
+                self.counts[entry.category], self.totals[entry.category] = {}, 0
+                if entry.category in self.hints:
+                    self._count(entry.category, self.hints[entry.category], self.QUESTION_WEIGHT)
+            self._count(entry.category, entry.question, self.QUESTION_WEIGHT)
+            self._count(entry.category, entry.answer, 1)
+
+    def remove(self, entry: FAQEntry) -> None:
+        with self._lock:
+            self._count(entry.category, entry.question, -self.QUESTION_WEIGHT)
+            self._count(entry.category, entry.answer, -1)
+
+    def _count(self, category: str, text: str, weight: int) -> None:
+        category_counts = self.counts[category]
+        for term in self._terms(text):
+            for counts in (category_counts, self.vocabulary):
+                n = counts.get(term, 0) + weight
+                if n:
+                    counts[term] = n
+                else:
+                    del counts[term]
+            self.totals[category] += weight
+
+    @staticmethod
+    def _terms(text: str) -> List[str]:
+        return [_stem(token) for token in analyze(text)]
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        with self._lock:
+            terms = [term for term in self._terms(text) if term in self.vocabulary]
+            if not terms or not self.counts:
+                return None, 0.0
+
+            # Laplace smoothing; classes get a uniform prior
+            scores = {}
+            for category, category_counts in self.counts.items():
+                denominator = self.totals[category] + len(self.vocabulary)
+                scores[category] = sum(math.log((category_counts.get(term, 0) + 1) / denominator)
+                                       for term in terms)
+        top = max(scores.values())
+        weights = {category: math.exp(score - top) for category, score in scores.items()}
+        best = max(weights, key=weights.get)
+        return best, weights[best] / sum(weights.values())
+
+
+class HashingEmbedder:
+    """Deterministic local text embedder: hashed word and character n-gram
+    features, TF-IDF weighted and projected into ``dim`` buckets."""
+
+    def __init__(self, dim: int = 1024, ngram: int = 3):
+        if not numpy_available():
+            raise ImportError("NumPy is required for embedding search. Run: pip install numpy")
+        self.dim = dim
+        self.ngram = ngram
+        self.idf = np.ones(dim, dtype=np.float32)
+        self._token_features: Dict[str, Tuple[List[int], List[float]]] = {}
+
+    def _features(self, token: str) -> Tuple[List[int], List[float]]:
+        cached = self._token_features.get(token)
+        if cached is not None:
+            return cached
+
+        padded = f"<{token}>"
+        grams = [f"w:{token}"] + [padded[i:i + self.ngram]
+                                  for i in range(max(1, len(padded) - self.ngram + 1))]
+        buckets, signs = [], []
+        for gram in grams:
+            # crc32 is stable across processes, unlike hash()
+            h = zlib.crc32(gram.encode('utf-8'))
+            buckets.append(h % self.dim)
+            signs.append(1.0 if h & 0x80000000 else -1.0)
+
+        self._token_features[token] = (buckets, signs)
+        return buckets, signs
+
+    def _raw_matrix(self, texts: Sequence[str]) -> "np.ndarray":
+        rows, cols, values = [], [], []
+        for row, text in enumerate(texts):
+            for token in analyze(text):
+                buckets, signs = self._features(token)
+                rows.extend([row] * len(buckets))
+                cols.extend(buckets)
+                values.extend(signs)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if rows:
+            np.add.at(matrix, (np.asarray(rows), np.asarray(cols)),
+                      np.asarray(values, dtype=np.float32))
+        return matrix
+
+    def fit(self, texts: Sequence[str]) -> "HashingEmbedder":
+        self.fit_transform(texts)
+        return self
+
+    def fit_transform(self, texts: Sequence[str]) -> "np.ndarray":
+        matrix = self._raw_matrix(texts)
+        df = np.count_nonzero(matrix, axis=0)
+        self.idf = (np.log((1.0 + len(texts)) / (1.0 + df)) + 1.0).astype(np.float32)
+        return self._normalize(matrix)
+
+    def transform(self, texts: Sequence[str]) -> "np.ndarray":
+        return self._normalize(self._raw_matrix(texts))
+
+    def _normalize(self, matrix: "np.ndarray") -> "np.ndarray":
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        return matrix
+
+
+class FAQEmbeddingIndex:
+    """FAQ vectors in one contiguous float32 matrix, queried by matrix products."""
+
+    # Cosine similarity a result must exceed to be returned
+    MIN_SIMILARITY = 0.0
+    # Queries scored per matrix product in batch search, bounding the score matrix
+    BATCH_ROWS = 256
+    # Category code of tombstoned rows, which also have all-zero vectors
+    DEAD_CODE = -3
+
+    def __init__(self, entries: Sequence[Optional[FAQEntry]],
+                 embedder: Optional[HashingEmbedder] = None):
+        # A given embedder is already fitted; otherwise fit one on these entries
+        fit = embedder is None
+        self.embedder = embedder or HashingEmbedder()
+        live = [e for e in entries if e is not None]
+        self._buffer = np.zeros((len(entries), self.embedder.dim), dtype=np.float32)
+        self._codes_buffer = np.full(len(entries), self.DEAD_CODE, dtype=np.int32)
+        self.category_ids: Dict[str, int] = {}
+
+        rows = [doc_id for doc_id, e in enumerate(entries) if e is not None]
+        if rows:
+            texts = [self._text(e) for e in live]
+            self._buffer[rows] = self.embedder.fit_transform(texts) if fit else self.embedder.transform(texts)
+            self._codes_buffer[rows] = [self._category_code(e.category) for e in live]
+
+        # Views over the first ``size`` rows; buffers grow geometrically on add()
+        self.size = len(entries)
+        self.category_codes = self._codes_buffer[:self.size]
+        self.matrix = self._buffer[:self.size]
+
+    @classmethod
+    def from_arrays(cls, embedder: HashingEmbedder, matrix: "np.ndarray",
+                    category_codes: "np.ndarray", category_ids: Dict[str, int]) -> "FAQEmbeddingIndex":
+        """Wrap prebuilt (e.g. memory-mapped, read-only) vectors without copying."""
+        index = cls.__new__(cls)
+        index.embedder = embedder
+        index._buffer, index._codes_buffer = matrix, category_codes
+        index.category_ids = dict(category_ids)
+        index.size = len(matrix)
+        index.category_codes = category_codes
+        index.matrix = matrix
+        return index
+
+    @staticmethod
+    def _text(entry: FAQEntry) -> str:
+        # Question text counts twice so it outweighs the longer answer
+        return f"{entry.question} {entry.question} {entry.answer}"
+
+    def _category_code(self, category: str) -> int:
+        return self.category_ids.setdefault(category, len(self.category_ids))
+
+    def add(self, entry: FAQEntry) -> None:
+        """Append a vector for the next doc id, reusing the fitted IDF weights."""
+        if self.size == len(self._buffer):
+            capacity = max(16, 2 * len(self._buffer))
+            buffer = np.zeros((capacity, self.embedder.dim), dtype=np.float32)
+            buffer[:self.size] = self._buffer[:self.size]
+            codes = np.full(capacity, self.DEAD_CODE, dtype=np.int32)
+            codes[:self.size] = self._codes_buffer[:self.size]
+            self._buffer, self._codes_buffer = buffer, codes
+
+        self._buffer[self.size] = self.embedder.transform([self._text(entry)])[0]
+        self._codes_buffer[self.size] = self._category_code(entry.category)
+        self.size += 1
+        # Codes first: readers slice them to the matrix they already hold
+        self.category_codes = self._codes_buffer[:self.size]
+        self.matrix = self._buffer[:self.size]
+
+    def remove(self, doc_id: int) -> None:
+        self._codes_buffer[doc_id] = self.DEAD_CODE
+        self._buffer[doc_id] = 0.0
+
+    def search(self, query: str, category: Optional[str] = None,
+               top_k: int = 3) -> List[Tuple[int, float]]:
+        return self.search_batch([query], [category], top_k)[0]
+
+    def search_batch(self, queries: Sequence[str], categories: Sequence[Optional[str]],
+                     top_k: int = 3) -> List[List[Tuple[int, float]]]:
+        """Top ``(doc_id, similarity)`` pairs for each query, in input order."""
+        matrix = self.matrix
+        n_docs = matrix.shape[0]
+        category_codes = self.category_codes[:n_docs]
+        if not n_docs or top_k <= 0:
+            return [[] for _ in queries]
+
+        k = min(top_k, n_docs)
+        # Unknown categories match nothing, like the keyword scorers
+        codes = np.array([-1 if not c else self.category_ids.get(c, -2) for c in categories],
+                         dtype=np.int32)
+        results = []
+
+        for start in range(0, len(queries), self.BATCH_ROWS):
+            vectors = self.embedder.transform(queries[start:start + self.BATCH_ROWS])
+            scores = vectors @ matrix.T
+            chunk_codes = codes[start:start + len(vectors)]
+            filtered = chunk_codes != -1
+            if filtered.any():
+                mismatch = category_codes[None, :] != chunk_codes[:, None]
+                scores[mismatch & filtered[:, None]] = -np.inf
+
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for row, doc_ids in enumerate(top):
+                row_scores = scores[row, doc_ids]
+                order = np.lexsort((doc_ids, -row_scores))
+                results.append([
+                    (int(doc_ids[i]), float(row_scores[i])) for i in order
+                    if row_scores[i] > self.MIN_SIMILARITY
+                ])
+
+        return results
+
+
+class ShardedFAQIndex:
+    """One FAQIndex shard per category.
+
+    Category-filtered searches touch a single shard; unfiltered ones scan
+    each shard in turn and merge the results. BM25 and embedding IDF weights are computed over the
+    whole corpus, so scores match an unsharded index.
+    """
+
+    read_only = False
+
+    def __init__(self, faqs: Dict[str, Any]):
+        self.faqs = faqs
+        self.shards: Dict[str, FAQIndex] = {
+            cat: FAQIndex({cat: items}, parent=self) for cat, items in faqs.items()
+        }
+        self._embedder: Optional[HashingEmbedder] = None
+        self._embedder_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in list(self.shards.values()))
+
+    @property
+    def dead_count(self) -> int:
+        return sum(shard.dead_count for shard in list(self.shards.values()))
+
+    def live_entries(self) -> Iterator[FAQEntry]:
+        return (entry for shard in list(self.shards.values()) for entry in shard.live_entries())
+
+    def get(self, category: str, key: str) -> Optional[FAQEntry]:
+        shard = self.shards.get(category)
+        return shard.get(category, key) if shard is not None else None
+
+    def shards_for(self, category: Optional[str]) -> List[FAQIndex]:
+        if category:
+            shard = self.shards.get(category)
+            return [shard] if shard is not None else []
+        return list(self.shards.values())
+
+    def bm25_stats(self, terms: Iterable[str]) -> BM25Stats:
+        terms = list(terms)
+        shards = list(self.shards.values())
+        n_docs = sum(shard.live_count for shard in shards)
+        doc_freq: Dict[str, int] = {}
+        for shard in shards:
+            for term, df in shard.bm25_stats(terms).doc_freq.items():
+                doc_freq[term] = doc_freq.get(term, 0) + df
+        return BM25Stats(
+            n_docs,
+            sum(shard.total_question_len for shard in shards) / n_docs if n_docs else 0.0,
+            sum(shard.total_answer_len for shard in shards) / n_docs if n_docs else 0.0,
+            doc_freq
+        )
+
+    def embedder(self) -> HashingEmbedder:
+        """The embedder shared by all shards, fitted on the whole corpus."""
+        with self._embedder_lock:
+            if self._embedder is None:
+                self._embedder = HashingEmbedder().fit([
+                    FAQEmbeddingIndex._text(entry)
+                    for shard in self.shards.values() for entry in shard.entries
+                    if entry is not None
+                ])
+            return self._embedder
+
+    def embedder_fitted(self) -> bool:
+        return self._embedder is not None
+
+    def has_embeddings(self) -> bool:
+        # Only the shard matrices count: a fitted embedder alone is cheap to keep
+        return any(shard.has_embeddings() for shard in list(self.shards.values()))
+
+    def build_embeddings(self) -> None:
+        for shard in list(self.shards.values()):
+            shard.embeddings()
+
+    def upsert(self, category: str, key: str, faq_data: Dict[str, str]) -> bool:
+        shard = self.shards.get(category)
+        if shard is None:
+            shard = FAQIndex({category: self.faqs.setdefault(category, {})}, parent=self)
+            self.shards[category] = shard
+        return shard.upsert(category, key, faq_data)
+
+    def delete(self, category: str, key: str) -> bool:
+        shard = self.shards.get(category)
+        return shard is not None and shard.delete(category, key)
+
+    def compacted(self) -> "ShardedFAQIndex":
+        return ShardedFAQIndex(self.faqs)
+
+
+# Binary snapshot layout: a fixed header, a table of (offset, length) pairs,
+# then 8-byte aligned sections. Every doc owns six consecutive strings in the
+# string table, followed by the whitespace tokens and then the BM25 terms.
+SNAPSHOT_MAGIC = b"FAQSNAP1"
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<8sIIqq")
+_SNAPSHOT_SECTION = struct.Struct("<QQ")
+_SNAPSHOT_SECTIONS = (
+    'meta', 'strings', 'string_offsets', 'token_offsets', 'token_docs',
+    'doc_freq', 'term_offsets', 'term_docs', 'term_tf_question', 'term_tf_answer',
+    'question_len', 'answer_len', 'category_codes', 'embedding_idf', 'embedding_matrix',
+)
+_FIELDS_PER_DOC = 6
+
+
+def snapshot_path(faq_file: str) -> str:
+    return os.path.splitext(faq_file)[0] + ".snapshot"
+
+
+def _file_signature(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def compile_snapshot(faq_file: str, snapshot_file: Optional[str] = None) -> str:
+    """Compile a FAQ JSON file and its search index into a binary snapshot."""
+    snapshot_file = snapshot_file or snapshot_path(faq_file)
+    signature = _file_signature(faq_file)
+    with open(faq_file, 'r', encoding='utf-8') as f:
+        index = FAQIndex(json.load(f))
+
+    strings: List[str] = []
+    for entry in index.entries:
+        strings.extend(entry[:_FIELDS_PER_DOC])
+    tokens = sorted(index.postings)
+    strings.extend(tokens)
+    terms = sorted(index.term_ids, key=index.term_ids.get)
+    strings.extend(terms)
+
+    blob = bytearray()
+    string_offsets = array('Q', [0])
+    for text in strings:
+        blob += text.encode('utf-8')
+        string_offsets.append(len(blob))
+
+    token_offsets, token_docs = array('Q', [0]), array('I')
+    for token in tokens:
+        token_docs.extend(index.postings[token])
+        token_offsets.append(len(token_docs))
+
+    term_offsets, term_docs = array('Q', [0]), array('I')
+    term_tf_question, term_tf_answer = array('H'), array('H')
+    for term_id in range(len(terms)):
+        term_docs.extend(index.term_docs[term_id])
+        term_tf_question.extend(index.term_tf_question[term_id])
+        term_tf_answer.extend(index.term_tf_answer[term_id])
+        term_offsets.append(len(term_docs))
+
+    categories = list(dict.fromkeys(e.category for e in index.entries))
+    category_codes = array('i', [categories.index(e.category) for e in index.entries])
+
+    meta = {
+        'docs': len(index.entries), 'tokens': len(tokens), 'terms': len(terms),
+        'categories': categories,
+        'total_question_len': index.total_question_len,
+        'total_answer_len': index.total_answer_len,
+        'byteorder': sys.byteorder,
+    }
+    sections = {
+        'strings': bytes(blob), 'string_offsets': string_offsets.tobytes(),
+        'token_offsets': token_offsets.tobytes(), 'token_docs': token_docs.tobytes(),
+        'doc_freq': index.doc_freq.tobytes(), 'term_offsets': term_offsets.tobytes(),
+        'term_docs': term_docs.tobytes(), 'term_tf_question': term_tf_question.tobytes(),
+        'term_tf_answer': term_tf_answer.tobytes(), 'question_len': index.question_len.tobytes(),
+        'answer_len': index.answer_len.tobytes(), 'category_codes': category_codes.tobytes(),
+        'embedding_idf': b'', 'embedding_matrix': b'',
+    }
+    if index.entries and numpy_available():
+        embeddings = index.embeddings()
+        meta.update(embedding_dim=embeddings.embedder.dim, embedding_ngram=embeddings.embedder.ngram)
+        sections['embedding_idf'] = embeddings.embedder.idf.astype(np.float32).tobytes()
+        sections['embedding_matrix'] = np.ascontiguousarray(embeddings.matrix).tobytes()
+    sections['meta'] = json.dumps(meta).encode('utf-8')
+
+    table_size = _SNAPSHOT_HEADER.size + _SNAPSHOT_SECTION.size * len(_SNAPSHOT_SECTIONS)
+    offset = table_size
+    layout = []
+    for name in _SNAPSHOT_SECTIONS:
+        offset += -offset % 8
+        layout.append((offset, len(sections[name])))
+        offset += len(sections[name])
+
+    tmp_file = f"{snapshot_file}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(_SNAPSHOT_SECTIONS), *signature))
+        for section in layout:
+            f.write(_SNAPSHOT_SECTION.pack(*section))
+        for name, (offset, _) in zip(_SNAPSHOT_SECTIONS, layout):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(sections[name])
+    os.replace(tmp_file, snapshot_file)
+    return snapshot_file
+
+
+class _SnapshotEntries:
+    """FAQ entries decoded from the memory-mapped string table on access."""
+
+    def __init__(self, strings: memoryview, offsets: memoryview, n_docs: int):
+        self._strings = strings
+        self._offsets = offsets
+        self._n_docs = n_docs
+
+    def __len__(self) -> int:
+        return self._n_docs
+
+    def __getitem__(self, doc_id):
+        if isinstance(doc_id, slice):
+            return [self[i] for i in range(*doc_id.indices(self._n_docs))]
+        if doc_id < 0:
+            doc_id += self._n_docs
+        if not 0 <= doc_id < self._n_docs:
+            raise IndexError(doc_id)
+        first = doc_id * _FIELDS_PER_DOC
+        return FAQEntry(*(self._string(first + i) for i in range(_FIELDS_PER_DOC)))
+
+    def _string(self, string_id: int) -> str:
+        return str(self._strings[self._offsets[string_id]:self._offsets[string_id + 1]], 'utf-8')
+
+
+class SnapshotFAQIndex(FAQIndex):
+    """Read-only FAQIndex served straight from a memory-mapped snapshot.
+
+    Strings, postings and the embedding matrix stay in the page cache and
+    are shared by every process that maps the same file. Only the token and
+    term dictionaries are decoded at open time.
+    """
+
+    read_only = True
+
+    def __init__(self, snapshot_file: str):
+        with open(snapshot_file, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, version, n_sections, mtime_ns, size = _SNAPSHOT_HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or n_sections != len(_SNAPSHOT_SECTIONS):
+            raise ValueError(f"'{snapshot_file}' is not a supported FAQ snapshot")
+        self.source_signature = (mtime_ns, size)
+
+        sections = {}
+        for i, name in enumerate(_SNAPSHOT_SECTIONS):
+            offset, length = _SNAPSHOT_SECTION.unpack_from(view, _SNAPSHOT_HEADER.size + i * _SNAPSHOT_SECTION.size)
+            sections[name] = view[offset:offset + length]
+        meta = json.loads(bytes(sections['meta']))
+        if meta['byteorder'] != sys.byteorder:
+            raise ValueError(f"'{snapshot_file}' was built on a {meta['byteorder']}-endian machine")
+
+        n_docs, n_tokens = meta['docs'], meta['tokens']
+        self.entries = _SnapshotEntries(sections['strings'], sections['string_offsets'].cast('Q'), n_docs)
+        self.live_count = n_docs
+        self._faqs: Optional[Dict[str, Any]] = None
+        self._term_cache = {}
+        self._generation = 0
+
+        string = self.entries._string
+        token_base = n_docs * _FIELDS_PER_DOC
+        token_offsets = sections['token_offsets'].cast('Q')
+        token_docs = sections['token_docs'].cast('I')
+        self.postings = {
+            string(token_base + j): token_docs[token_offsets[j]:token_offsets[j + 1]]
+            for j in range(n_tokens)
+        }
+
+        term_base = token_base + n_tokens
+        term_offsets = sections['term_offsets'].cast('Q')
+        term_docs = sections['term_docs'].cast('I')
+        tf_question = sections['term_tf_question'].cast('H')
+        tf_answer = sections['term_tf_answer'].cast('H')
+        self.term_ids = {string(term_base + j): j for j in range(meta['terms'])}
+        ranges = [(term_offsets[j], term_offsets[j + 1]) for j in range(meta['terms'])]
+        self.term_docs = [term_docs[a:b] for a, b in ranges]
+        self.term_tf_question = [tf_question[a:b] for a, b in ranges]
+        self.term_tf_answer = [tf_answer[a:b] for a, b in ranges]
+        self.doc_freq = sections['doc_freq'].cast('I')
+        self.question_len = sections['question_len'].cast('I')
+        self.answer_len = sections['answer_len'].cast('I')
+        self.total_question_len = meta['total_question_len']
+        self.total_answer_len = meta['total_answer_len']
+
+        self._embeddings = None
+        if len(sections['embedding_matrix']) and numpy_available():
+            embedder = HashingEmbedder(meta['embedding_dim'], meta['embedding_ngram'])
+            embedder.idf = np.frombuffer(sections['embedding_idf'], dtype=np.float32)
+            matrix = np.frombuffer(sections['embedding_matrix'], dtype=np.float32)
+            self._embeddings = FAQEmbeddingIndex.from_arrays(
+                embedder, matrix.reshape(n_docs, embedder.dim),
+                np.frombuffer(sections['category_codes'], dtype=np.int32),
+                {cat: i for i, cat in enumerate(meta['categories'])}
+            )
+
+    @property
+    def faqs(self) -> Dict[str, Any]:
+        # Rebuilt from the snapshot on first use; searches never need it
+        if self._faqs is None:
+            faqs: Dict[str, Any] = {}
+            for entry in self.entries:
+                faqs.setdefault(entry.category, {})[entry.key] = {
+                    'question': entry.question, 'answer': entry.answer
+                }
+            self._faqs = faqs
+        return self._faqs
+
+    def upsert(self, category: str, key: str, faq_data: Dict[str, str]) -> bool:
+        raise TypeError("Snapshot indexes are read-only; rebuild with FAQIndex(index.faqs)")
+
+    def delete(self, category: str, key: str) -> bool:
+        raise TypeError("Snapshot indexes are read-only; rebuild with FAQIndex(index.faqs)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile a FAQ JSON file into a binary search snapshot.")
+    parser.add_argument('faq_file', nargs='?', default="faqs.json")
+    parser.add_argument('-o', '--output', help="Snapshot path (default: <faq_file>.snapshot)")
+    args = parser.parse_args()
+
+    output = compile_snapshot(args.faq_file, args.output)
+    print(f"✓ Compiled {args.faq_file} → {output} ({os.path.getsize(output):,} bytes)")
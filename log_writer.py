@@ -0,0 +1,224 @@
+"""Background, batching appender for the response log."""
+
+import atexit
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Union
+
+_STOP = object()
+# Ends the batch being collected, so a flush doesn't wait out the interval
+_FLUSH = object()
+
+
+def parse_fsync_policy(value: str) -> Union[str, float]:
+    """'off', 'always' (every batch), or a number of seconds between fsyncs."""
+    value = value.strip().lower()
+    if value in ("off", "always"):
+        return value
+    return float(value)
+
+
+class BufferedWriter:
+    """Appends entries to ``sink`` from one background thread.
+
+    ``sink`` has ``open()``, ``append(entries) -> bytes``, ``sync()`` and
+    ``close()``, like ``response_log.ResponseLog``. ``write`` only queues; the
+    thread hands whatever is queued to a single ``append`` once roughly
+    ``batch_bytes`` (as measured by ``sizeof``) have built up or
+    ``flush_interval`` seconds have passed since the oldest entry. The queue is bounded, so producers
+    wait (up to ``put_timeout``) rather than buffer without limit when the
+    disk falls behind. With ``fsync`` a number of seconds, the last batch is
+    synced that long after it was written even if nothing follows it. The
+    thread starts on the first write and stops on ``close``; writes made
+    while it closes wait for it, and writing after that starts it again.
+    """
+
+    def __init__(self, sink: Any, max_queue: int = 10000, batch_bytes: int = 256 * 1024,
+                 flush_interval: float = 0.05, fsync: Union[str, float] = 1.0,
+                 put_timeout: float = 5.0, sizeof: Callable[[Any], int] = len,
+                 name: str = "response-log-writer"):
+        self.sink = sink
+        self.name = name
+        self.sizeof = sizeof
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.put_timeout = put_timeout
+
+        self.entries = 0
+        self.batches = 0
+        self.bytes = 0
+        self.fsyncs = 0
+        self.dropped = 0
+        self.max_batch = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._last_fsync = time.monotonic()
+        self._unsynced = False
+        self._closing = False
+        self._writing = 0
+        self._queued = 0
+        self._done = 0
+        self._progress = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._close_lock = threading.Lock()
+
+    def write(self, entry: Any) -> bool:
+        """Queue ``entry``; False if it could not be queued in time."""
+        with self._progress:
+            # Nothing may land in the queue behind close()'s stop marker
+            while self._closing:
+                self._progress.wait()
+            self._writing += 1
+            self._queued += 1
+        try:
+            self._ensure_started()
+            self._queue.put(entry, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            self._settle(1, dropped=True)
+            return False
+        finally:
+            with self._progress:
+                self._writing -= 1
+                if self._closing:
+                    self._progress.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far is written; False on timeout."""
+        with self._progress:
+            target = self._queued
+            if self._done >= target:
+                return True
+        try:
+            self._queue.put_nowait(_FLUSH)
+        except queue.Full:
+            pass
+        with self._progress:
+            return self._progress.wait_for(lambda: self._done >= target, timeout)
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Drain the queue, stop the thread and close the file."""
+        with self._close_lock:
+            # Writes under way finish first (one may be starting the thread); new ones wait
+            with self._progress:
+                self._closing = True
+                self._progress.wait_for(lambda: self._writing == 0)
+            try:
+                with self._start_lock:
+                    thread = self._thread
+                    if thread is None:
+                        return
+                    self._queue.put(_STOP)
+                    thread.join(timeout)
+                    self._thread = None
+                    atexit.unregister(self.close)
+            finally:
+                with self._progress:
+                    self._closing = False
+                    self._progress.notify_all()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                # Opened here, so the file exists as soon as write() returns
+                self.sink.open()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+                # Scripts that exit without closing still get their entries written
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self._queue.get(timeout=self._sync_due())]
+            except queue.Empty:
+                # Idle with a batch not yet synced: sync it now rather than on the next write
+                self._sync()
+                continue
+            if batch[0] is _STOP:
+                break
+            if batch[0] is _FLUSH:
+                continue
+            size = self.sizeof(batch[0])
+            deadline = time.monotonic() + self.flush_interval
+            while size < self.batch_bytes:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                if item is _FLUSH:
+                    break
+                batch.append(item)
+                size += self.sizeof(item)
+            self._write_batch(batch)
+        try:
+            if self.fsync != "off":
+                self._sync()
+        finally:
+            self.sink.close()
+
+    def _sync_due(self) -> Optional[float]:
+        """Seconds the idle wait may last before the pending fsync, or None to wait for the next entry."""
+        if not self._unsynced or isinstance(self.fsync, str):
+            return None
+        return max(0.0, self._last_fsync + self.fsync - time.monotonic())
+
+    def _sync(self) -> None:
+        try:
+            self.sink.sync()
+        except Exception as e:
+            print(f"✗ Failed to sync the response log: {e}")
+            # Try again after another interval rather than straight away
+            self._last_fsync = time.monotonic()
+            return
+        self._last_fsync = time.monotonic()
+        self._unsynced = False
+        self.fsyncs += 1
+
+    def _write_batch(self, batch: list) -> None:
+        try:
+            written = self.sink.append(batch)
+            if self.fsync == "always" or (
+                    self.fsync != "off" and time.monotonic() - self._last_fsync >= self.fsync):
+                self.sink.sync()
+                self._last_fsync = time.monotonic()
+                self._unsynced = False
+                self.fsyncs += 1
+            else:
+                self._unsynced = self.fsync != "off"
+        except Exception as e:
+            print(f"✗ Failed to write {len(batch)} response log entries: {e}")
+            self._settle(len(batch), dropped=True)
+            return
+        self.batches += 1
+        self.bytes += written
+        self.max_batch = max(self.max_batch, len(batch))
+        self._settle(len(batch))
+
+    def _settle(self, count: int, dropped: bool = False) -> None:
+        with self._progress:
+            self._done += count
+            if dropped:
+                self.dropped += count
+            else:
+                self.entries += count
+            self._progress.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': self._queue.qsize(),
+            'entries': self.entries,
+            'batches': self.batches,
+            'max_batch': self.max_batch,
+            'bytes': self.bytes,
+            'fsyncs': self.fsyncs,
+            'dropped': self.dropped
+        }
@@ -0,0 +1,297 @@
+"""Rate limiting and concurrency control shared by all Gemini calls."""
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+try:
+    from google.api_core import exceptions as api_exceptions
+    RETRYABLE_ERRORS = (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted,
+                        api_exceptions.ServiceUnavailable, api_exceptions.InternalServerError,
+                        api_exceptions.DeadlineExceeded)
+except ImportError:
+    RETRYABLE_ERRORS = ()
+
+RETRYABLE_STATUS = {429, 500, 503, 504}
+
+# Lower numbers get capacity first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: 'high', PRIORITY_NORMAL: 'normal', PRIORITY_LOW: 'low'}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Quota, overload and timeout errors; anything else will fail the same way again."""
+    if RETRYABLE_ERRORS and isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return getattr(error, 'code', None) in RETRYABLE_STATUS
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return getattr(error, 'code', None) == 429
+
+
+class _Waiter:
+    __slots__ = ('priority', 'granted', 'cancelled', 'event', 'loop', 'future')
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.granted = False
+        self.cancelled = False
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+
+    def notify(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ModelGovernor:
+    """Token bucket plus in-flight limit in front of the model, with retries.
+
+    Calls beyond either limit queue by priority, then arrival. Retryable
+    errors are retried with jittered exponential backoff, and a 429 halves
+    the bucket's rate until successful calls win it back. Works from threads
+    and from any number of event loops at once.
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, max_retries: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 8.0):
+        self.rate = rate
+        self.current_rate = rate
+        self.burst = burst or max(1, int(rate or 1))
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.in_flight = 0
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.max_queue_depth = 0
+        self.wait_ms = 0.0
+        self._throttled_by_priority: Dict[int, int] = {}
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._queue: list = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if self.current_rate is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.current_rate)
+        self._updated = now
+
+    def _available(self) -> bool:
+        return ((self.max_in_flight is None or self.in_flight < self.max_in_flight)
+                and (self.current_rate is None or self._tokens >= 1))
+
+    def _take(self) -> None:
+        self.in_flight += 1
+        self.calls += 1
+        if self.current_rate is not None:
+            self._tokens -= 1
+
+    def _dispatch(self) -> Optional[float]:
+        """Grant queued waiters what capacity allows; seconds until a token frees up, if one is awaited."""
+        with self._lock:
+            self._refill(time.monotonic())
+            while self._queue and self._available():
+                waiter = heapq.heappop(self._queue)[2]
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._take()
+                waiter.notify()
+            if self._queue and self.current_rate and (self.max_in_flight is None
+                                                      or self.in_flight < self.max_in_flight):
+                return (1 - self._tokens) / self.current_rate
+            return None
+
+    def _recheck_after(self) -> Optional[float]:
+        """Dispatch, then how long a queued caller may sleep: release() wakes the ones it grants."""
+        delay = self._dispatch()
+        if delay is None and self.current_rate:
+            # Held by the in-flight cap; once a call ends it may be tokens that are short
+            return 1 / self.current_rate
+        return delay
+
+    def _enqueue(self, waiter: _Waiter) -> bool:
+        """Take capacity now (True), or queue ``waiter`` for it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if not self._queue and self._available():
+                self._take()
+                return True
+            heapq.heappush(self._queue, (waiter.priority, next(self._order), waiter))
+            self.throttled += 1
+            self._throttled_by_priority[waiter.priority] = self._throttled_by_priority.get(waiter.priority, 0) + 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            return False
+
+    def acquire(self, priority: int = PRIORITY_NORMAL) -> None:
+        start = time.perf_counter()
+        waiter = _Waiter(priority)
+        waiter.event = threading.Event()
+        if self._enqueue(waiter):
+            return
+        while not waiter.granted:
+            waiter.event.wait(self._recheck_after())
+        self._waited(start)
+
+    async def acquire_async(self, priority: int = PRIORITY_NORMAL) -> None:
+        start = time.perf_counter()
+        waiter = _Waiter(priority)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        if self._enqueue(waiter):
+            return
+        try:
+            while not waiter.granted:
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), self._recheck_after())
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.granted
+            if granted:
+                self.release()
+            raise
+        self._waited(start)
+
+    def _waited(self, start: float) -> None:
+        with self._lock:
+            self.wait_ms += (time.perf_counter() - start) * 1000
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._dispatch()
+
+    def call(self, fn: Callable[[], Any], priority: int = PRIORITY_NORMAL) -> Any:
+        """Run ``fn`` within the limits, retrying retryable errors."""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._failed(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self._succeeded()
+                return result
+            finally:
+                self.release()
+            time.sleep(delay)
+
+    async def call_async(self, fn: Callable[[], Awaitable[Any]], priority: int = PRIORITY_NORMAL) -> Any:
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async(priority)
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._failed(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self._succeeded()
+                return result
+            finally:
+                self.release()
+            await asyncio.sleep(delay)
+
+    def _failed(self, error: Exception, attempt: int) -> Optional[float]:
+        """Backoff before the next attempt, or None to give up."""
+        with self._lock:
+            if is_rate_limited(error):
+                self.rate_limited += 1
+                # Everyone slows down, not just the caller that hit the quota
+                if self.current_rate is not None:
+                    self.current_rate = max(self.rate / 10, self.current_rate / 2)
+                    self._tokens = min(self._tokens, 0.0)
+            if not is_retryable(error) or attempt >= self.max_retries:
+                self.failures += 1
+                return None
+            self.retries += 1
+        # Full jitter keeps retrying callers from stampeding together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _succeeded(self) -> None:
+        if self.current_rate is not None and self.current_rate < self.rate:
+            with self._lock:
+                self.current_rate = min(self.rate, self.current_rate + self.rate / 20)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queued: Dict[str, int] = {}
+            for priority, _, waiter in self._queue:
+                if not waiter.cancelled:
+                    name = PRIORITY_NAMES.get(priority, str(priority))
+                    queued[name] = queued.get(name, 0) + 1
+            return {
+                'rate_limit': self.rate,
+                'current_rate': round(self.current_rate, 3) if self.current_rate is not None else None,
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.in_flight,
+                'queue_depth': sum(queued.values()),
+                'queued': queued,
+                'max_queue_depth': self.max_queue_depth,
+                'calls': self.calls,
+                'throttled': self.throttled,
+                'throttled_by_priority': {PRIORITY_NAMES.get(p, str(p)): n
+                                          for p, n in sorted(self._throttled_by_priority.items())},
+                'retries': self.retries,
+                'rate_limited': self.rate_limited,
+                'failures': self.failures,
+                'wait_ms': round(self.wait_ms, 1)
+            }
+
+
+def governor_from_env() -> Optional[ModelGovernor]:
+    """Build the governor from GEMINI_RATE_LIMIT (calls/s) and GEMINI_MAX_IN_FLIGHT ("off" = no cap)."""
+    if os.getenv("MODEL_GOVERNOR", "on").lower() in ("off", "none", "0", ""):
+        return None
+    rate = os.getenv("GEMINI_RATE_LIMIT", "off").lower()
+    max_in_flight = os.getenv("GEMINI_MAX_IN_FLIGHT", "off").lower()
+    return ModelGovernor(
+        rate=None if rate in ("off", "none", "0", "") else float(rate),
+        burst=int(os.getenv("GEMINI_BURST", "0")) or None,
+        max_in_flight=None if max_in_flight in ("off", "none", "0", "") else int(max_in_flight),
+        max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+    )
+
+
+_governor: Optional[ModelGovernor] = None
+_configured = False
+_governor_lock = threading.Lock()
+
+
+def get_model_governor() -> Optional[ModelGovernor]:
+    """The process-wide governor shared by all agents, or None if MODEL_GOVERNOR=off."""
+    global _governor, _configured
+    if not _configured:
+        with _governor_lock:
+            if not _configured:
+                _governor = governor_from_env()
+                _configured = True
+    return _governor
@@ -0,0 +1,875 @@
+"""Append-only JSON-lines response log with a sidecar offset index.
+
+Every response is one JSON object on one line of the data file, so a body
+can contain any text. ``<path>.idx`` holds a fixed-width record per entry
+(byte offset, length, timestamp, hash of the address), which lets the last
+N entries, a time range or one customer's responses be read by seeking
+instead of scanning the whole log. SegmentedResponseLog rolls that file
+over by size or day into sealed segments, compressed in the background.
+
+Convert a log written in the old text format with:
+
+    python response_log.py migrate response_log.txt
+"""
+
+import bisect
+import hashlib
+import importlib.util
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+_INDEX_MAGIC = b"RESPIDX1"
+_INDEX_HEADER = struct.Struct("<8sI")
+# offset, length, timestamp, email key
+_INDEX_RECORD = struct.Struct("<QIdQ")
+_TIMESTAMP_FIELD = struct.Struct("<d")
+_KEY_FIELD = struct.Struct("<Q")
+_TIMESTAMP_AT = 12
+_KEY_AT = 20
+
+# Sealed segments are compressed in blocks of about this many bytes, each on
+# its own, so one entry is read by decompressing just its block
+BLOCK_BYTES = 256 * 1024
+# raw offset, compressed offset
+_BLOCK = struct.Struct("<QQ")
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+# The sequence number in a segment name: <base>.<stamp>.<sequence>.jsonl[.gz]
+_SEGMENT_SEQUENCE = re.compile(r"\.(\d+)\.jsonl(?:\.\w+)?$")
+
+TEXT_RULE = '=' * 80
+
+TimeLike = Union[datetime, float, int]
+
+_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+
+@lru_cache(maxsize=4096)
+def email_key(email: str) -> int:
+    """64-bit hash of a normalized address, as stored in the index."""
+    digest = hashlib.blake2b(email.strip().lower().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def _epoch(value: TimeLike) -> float:
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+
+def _whole_ms(ts: float) -> float:
+    # Truncated, so an entry never looks later than it was logged
+    return math.floor(ts * 1000) / 1000
+
+
+def _format_time(ts: float) -> str:
+    ms = round(ts * 1000)
+    return f"{datetime.fromtimestamp(ms // 1000):%Y-%m-%d %H:%M:%S}.{ms % 1000:03d}"
+
+
+def _parse_time(text: str) -> float:
+    return datetime.fromisoformat(text).timestamp()
+
+
+def _codec(compression: str) -> tuple:
+    """(compress, decompress) for 'gzip', or 'zstd' with the zstandard package installed."""
+    if compression == 'gzip':
+        import gzip
+        return (lambda data: gzip.compress(data, compresslevel=6)), gzip.decompress
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+    raise ValueError(f"Unknown compression '{compression}'")
+
+
+class _IndexView:
+    """Read-only view of the entries fully written when it was opened."""
+
+    def __init__(self, log: "ResponseLog"):
+        self.count = 0
+        # Bytes of data the index covers
+        self.end = 0
+        self._mmap = None
+        try:
+            with open(log.index_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size > _INDEX_HEADER.size:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return
+        if self._mmap is None or _INDEX_HEADER.unpack_from(self._mmap) != (_INDEX_MAGIC, _INDEX_RECORD.size):
+            return
+        self.count = (len(self._mmap) - _INDEX_HEADER.size) // _INDEX_RECORD.size
+        if log.compression is not None:
+            return
+        data_size = os.path.getsize(log.path) if os.path.exists(log.path) else 0
+        # Left over from a crash; the writer drops these when it next opens the log
+        while self.count and sum(self.record(self.count - 1)[:2]) > data_size:
+            self.count -= 1
+        self.end = sum(self.record(self.count - 1)[:2]) if self.count else 0
+
+    def __enter__(self) -> "_IndexView":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def _at(self, i: int) -> int:
+        return _INDEX_HEADER.size + i * _INDEX_RECORD.size
+
+    def record(self, i: int) -> tuple:
+        return _INDEX_RECORD.unpack_from(self._mmap, self._at(i))
+
+    def timestamp(self, i: int) -> float:
+        return _TIMESTAMP_FIELD.unpack_from(self._mmap, self._at(i) + _TIMESTAMP_AT)[0]
+
+    def bisect(self, ts: float) -> int:
+        """First entry logged at or after ``ts``; index timestamps never decrease."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp(mid) < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def matching_keys(self, key: int, lo: int, hi: int) -> Iterator[int]:
+        """Entries in [lo, hi) whose email key is ``key``, newest first."""
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        if np is not None and hi > lo:
+            column = np.frombuffer(self._mmap, dtype=np.dtype([
+                ('offset', '<u8'), ('length', '<u4'), ('timestamp', '<f8'), ('key', '<u8')
+            ]), count=hi - lo, offset=self._at(lo))['key']
+            matches = (np.flatnonzero(column == key) + lo).tolist()
+            # The mmap can't be closed while an array still points into it
+            del column
+            yield from reversed(matches)
+            return
+        for i in range(hi - 1, lo - 1, -1):
+            if _KEY_FIELD.unpack_from(self._mmap, self._at(i) + _KEY_AT)[0] == key:
+                yield i
+
+
+class ResponseLog:
+    """One data file of JSON lines plus its ``.idx`` offset index.
+
+    A single writer appends with ``open``/``append``/``close`` (safe across
+    threads in one process); readers can query at any time and see every
+    entry whose index record has been written. Timestamps are assigned when
+    an entry is appended and never go backwards, so time lookups can bisect.
+    With ``compression`` set, the log is a sealed segment that
+    ``compress_segment`` has compressed; it can be read but not appended to.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None):
+        self.path = path
+        self.compression = compression
+        self.data_path = path + COMPRESSION_SUFFIXES[compression] if compression else path
+        self.index_path = path + ".idx"
+        self._data = None
+        self._index = None
+        self._size = 0
+        self._last_ts = 0.0
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        """Open for appending, first repairing anything a crash left behind."""
+        with self._lock:
+            if self._data is not None:
+                return
+            self._data = open(self.path, 'a+b')
+            self._index = open(self.index_path, 'a+b')
+            self._recover()
+
+    def _recover(self) -> None:
+        data_size = os.fstat(self._data.fileno()).st_size
+        index_size = os.fstat(self._index.fileno()).st_size
+        self._index.seek(0)
+        header = self._index.read(_INDEX_HEADER.size)
+        if len(header) < _INDEX_HEADER.size or _INDEX_HEADER.unpack(header) != (_INDEX_MAGIC, _INDEX_RECORD.size):
+            self._index.truncate(0)
+            self._index.write(_INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_RECORD.size))
+            index_size = _INDEX_HEADER.size
+
+        count = (index_size - _INDEX_HEADER.size) // _INDEX_RECORD.size
+        end, self._last_ts = 0, 0.0
+        while count:
+            self._index.seek(_INDEX_HEADER.size + (count - 1) * _INDEX_RECORD.size)
+            offset, length, ts, _ = _INDEX_RECORD.unpack(self._index.read(_INDEX_RECORD.size))
+            if offset + length <= data_size:
+                end, self._last_ts = offset + length, ts
+                break
+            count -= 1
+        self._index.truncate(_INDEX_HEADER.size + count * _INDEX_RECORD.size)
+        self._size = end
+        if end < data_size:
+            self._reindex(end, data_size)
+
+    def _reindex(self, start: int, data_size: int) -> None:
+        """Index complete lines past ``start``; a torn last line is cut off."""
+        self._data.seek(start)
+        offset, records, skipped = start, [], 0
+        for line in self._data:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line)
+                ts = max(_parse_time(entry['timestamp']), self._last_ts)
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+            else:
+                records.append(_INDEX_RECORD.pack(offset, len(line), ts, email_key(entry.get('to', ''))))
+                self._last_ts = ts
+            offset += len(line)
+            if len(records) >= 10000:
+                self._index.write(b''.join(records))
+                records.clear()
+        self._index.write(b''.join(records))
+        self._index.flush()
+        if skipped:
+            print(f"⚠ Skipped {skipped} unreadable response log lines in {self.path}")
+        if offset < data_size:
+            print(f"⚠ Dropped {data_size - offset} bytes of a partly written response log entry")
+            self._data.truncate(offset)
+        self._size = offset
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Write entries (to, subject, response, optional timestamp) and index them; bytes written."""
+        with self._lock:
+            lines, index = [], []
+            offset = self._size
+            # Entries appended together share one write time
+            now = max(_whole_ms(time.time()), self._last_ts)
+            now_text = _format_time(now)
+            for record in records:
+                if 'timestamp' in record:
+                    ts = max(_whole_ms(_parse_time(record['timestamp'])), self._last_ts)
+                    stamp = _format_time(ts)
+                else:
+                    ts = max(now, self._last_ts)
+                    stamp = now_text if ts == now else _format_time(ts)
+                self._last_ts = ts
+                entry = {'timestamp': stamp, **record}
+                entry['timestamp'] = stamp
+                line = (_encode(entry) + "\n").encode('utf-8')
+                index.append(_INDEX_RECORD.pack(offset, len(line), ts, email_key(record.get('to', ''))))
+                lines.append(line)
+                offset += len(line)
+            data = b''.join(lines)
+            try:
+                self._data.write(data)
+                self._data.flush()
+            except Exception:
+                # Don't leave a torn line for the next append to run into
+                self._data.truncate(self._size)
+                raise
+            # Written after the data, so the index never points at missing bytes
+            self._index.write(b''.join(index))
+            self._index.flush()
+            self._size = offset
+            return len(data)
+
+    @staticmethod
+    def approx_size(record: Dict[str, Any]) -> int:
+        """Roughly the encoded size, without encoding it."""
+        return len(record.get('response', '')) + len(record.get('subject', '')) + len(record.get('to', '')) + 80
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._data is not None:
+                os.fsync(self._data.fileno())
+                os.fsync(self._index.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._data is not None:
+                self._data.close()
+                self._index.close()
+                self._data = self._index = None
+
+    @property
+    def size(self) -> int:
+        """Bytes of data written and indexed, while open."""
+        return self._size
+
+    @property
+    def last_timestamp(self) -> float:
+        return self._last_ts
+
+    def first_timestamp(self) -> Optional[float]:
+        with _IndexView(self) as view:
+            return view.timestamp(0) if view.count else None
+
+    def __len__(self) -> int:
+        with _IndexView(self) as view:
+            return view.count
+
+    def _read(self, view: _IndexView, ids: Iterable[int]) -> Iterator[Dict[str, Any]]:
+        if self.compression is not None:
+            yield from self._read_compressed(view, ids)
+            return
+        with open(self.path, 'rb') as f:
+            for i in ids:
+                offset, length, _, _ = view.record(i)
+                yield json.loads(os.pread(f.fileno(), length, offset))
+
+    def _read_compressed(self, view: _IndexView, ids: Iterable[int]) -> Iterator[Dict[str, Any]]:
+        with open(self.data_path + ".blk", 'rb') as f:
+            blocks = list(_BLOCK.iter_unpack(f.read()))
+        raw_starts = [raw for raw, _ in blocks]
+        _, decompress = _codec(self.compression)
+        current, data = -1, b''
+        with open(self.data_path, 'rb') as f:
+            end_of_file = os.fstat(f.fileno()).st_size
+            for i in ids:
+                offset, length, _, _ = view.record(i)
+                block = bisect.bisect_right(raw_starts, offset) - 1
+                # Lookups walk the log in order, so one decompressed block is enough to keep
+                if block != current:
+                    start = blocks[block][1]
+                    end = blocks[block + 1][1] if block + 1 < len(blocks) else end_of_file
+                    current, data = block, decompress(os.pread(f.fileno(), end - start, start))
+                at = offset - raw_starts[block]
+                yield json.loads(data[at:at + length])
+
+    def recent(self, count: int = 5) -> List[Dict[str, Any]]:
+        """The last ``count`` entries, oldest first."""
+        with _IndexView(self) as view:
+            if self.compression is None and os.path.exists(self.path) and os.path.getsize(self.path) > view.end:
+                # Lines the index doesn't cover yet (or no index at all): read back from the end instead
+                return _parse_lines(tail_lines(self.path, count))
+            return list(self._read(view, range(max(0, view.count - count), view.count)))
+
+    def find(self, email: Optional[str] = None, since: Optional[TimeLike] = None,
+             until: Optional[TimeLike] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Entries to ``email`` logged in [since, until), the newest ``limit`` of them, oldest first."""
+        with _IndexView(self) as view:
+            lo = view.bisect(_epoch(since)) if since is not None else 0
+            hi = view.bisect(_epoch(until)) if until is not None else view.count
+            if email is None:
+                start = max(lo, hi - limit) if limit is not None else lo
+                return list(self._read(view, range(start, hi)))
+
+            wanted = email.strip().lower()
+            found = []
+            # Keys can collide, so each candidate is checked against its entry
+            for entry in self._read(view, view.matching_keys(email_key(email), lo, hi)):
+                if entry.get('to', '').strip().lower() == wanted:
+                    found.append(entry)
+                    if limit is not None and len(found) >= limit:
+                        break
+            return found[::-1]
+
+
+def tail_lines(path: str, count: int, block_size: int = 64 * 1024) -> List[bytes]:
+    """The last ``count`` complete lines of ``path``, oldest first.
+
+    Reads fixed-size blocks backward from the end of the file and stops as
+    soon as it has enough, so the cost depends on the lines returned, not
+    the file size. A last line without its newline is still being written
+    and is left out.
+    """
+    newest_first: List[bytes] = []
+    with open(path, 'rb') as f:
+        position = os.fstat(f.fileno()).st_size
+        pending = b''
+        trailing = True
+        while position > 0 and len(newest_first) < count:
+            size = min(block_size, position)
+            position -= size
+            parts = (os.pread(f.fileno(), size, position) + pending).split(b"\n")
+            # The first part may continue in the block before this one
+            pending = parts.pop(0)
+            if trailing and parts:
+                parts.pop()
+                trailing = False
+            newest_first.extend(part for part in reversed(parts) if part)
+        if position == 0 and pending and not trailing:
+            newest_first.append(pending)
+    return newest_first[:count][::-1]
+
+
+def _parse_lines(lines: Iterable[bytes]) -> List[Dict[str, Any]]:
+    entries = []
+    for line in lines:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    return entries
+
+
+def compress_segment(path: str, compression: str, block_bytes: int = BLOCK_BYTES) -> int:
+    """Compress a sealed segment's data beside it; returns the compressed size.
+
+    Blocks end on line boundaries and their offsets go to ``<data>.blk``.
+    The uncompressed file is left for the caller to remove.
+    """
+    compress, _ = _codec(compression)
+    target = path + COMPRESSION_SUFFIXES[compression]
+    blocks = []
+    with open(path, 'rb') as source, open(target + ".tmp", 'wb') as out:
+        raw = 0
+        while True:
+            chunk = source.read(block_bytes)
+            if not chunk:
+                break
+            chunk += source.readline()
+            blocks.append(_BLOCK.pack(raw, out.tell()))
+            out.write(compress(chunk))
+            raw += len(chunk)
+        out.flush()
+        os.fsync(out.fileno())
+    with open(target + ".blk.tmp", 'wb') as f:
+        f.write(b''.join(blocks))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(target + ".blk.tmp", target + ".blk")
+    os.replace(target + ".tmp", target)
+    return os.path.getsize(target)
+
+
+class SegmentedResponseLog:
+    """The response log as a series of segments, appending to the newest.
+
+    ``path`` is always the active segment. Once it reaches ``segment_bytes``,
+    or its first entry is from an earlier day, it is sealed: renamed to
+    ``<base>.<time of its first entry>.<sequence>.jsonl`` and listed in
+    ``<base>.manifest.json`` with its time range. A background thread then
+    compresses sealed segments and drops the oldest past ``retain_days`` or
+    ``retain_bytes``, so senders never wait on either. Lookups skip segments
+    outside the requested time range, and the last few entries usually come
+    from the active segment alone.
+    """
+
+    def __init__(self, path: str, segment_bytes: Optional[int] = 64 * 2**20, daily: bool = True,
+                 compression: Optional[str] = 'gzip', retain_days: Optional[float] = None,
+                 retain_bytes: Optional[int] = None):
+        self.path = path
+        self.base = path[:-len(".jsonl")] if path.endswith(".jsonl") else path
+        self.manifest_path = self.base + ".manifest.json"
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.segment_bytes = segment_bytes
+        self.daily = daily
+        self.compression = compression
+        self.retain_days = retain_days
+        self.retain_bytes = retain_bytes
+        self.active = ResponseLog(path)
+
+        self.rollovers = 0
+        self.compressed = 0
+        self.expired = 0
+        # Sealed segments, oldest first; loaded while open
+        self._segments: Optional[List[Dict[str, Any]]] = None
+        self._active_first: Optional[float] = None
+        # Bumped whenever segments change, so a lookup that raced one can retry
+        self._generation = 0
+        # Numbers sealed segments, so a name is never reused while expiry may still be deleting it
+        self._sequence = 0
+        self._maintenance: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.RLock()
+
+    approx_size = staticmethod(ResponseLog.approx_size)
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'segments': []}
+
+    def _load_manifest(self) -> List[Dict[str, Any]]:
+        return self._read_manifest()['segments']
+
+    def _save_manifest(self) -> None:
+        with open(self.manifest_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'sequence': self._sequence, 'segments': self._segments}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+        self._generation += 1
+
+    def _segment_path(self, segment: Dict[str, Any]) -> str:
+        return os.path.join(self.directory, segment['name'])
+
+    def _describe(self, name: str, compression: Optional[str] = None) -> Dict[str, Any]:
+        log = ResponseLog(os.path.join(self.directory, name), compression)
+        with _IndexView(log) as view:
+            first = view.timestamp(0) if view.count else 0.0
+            last = view.timestamp(view.count - 1) if view.count else 0.0
+            entries = view.count
+            size = sum(view.record(view.count - 1)[:2]) if view.count else 0
+        return {'name': name, 'first': first, 'last': last, 'entries': entries,
+                'bytes': size, 'stored': os.path.getsize(log.data_path), 'compression': compression}
+
+    def open(self) -> None:
+        """Open the active segment for appending and pick up where the last run stopped."""
+        with self._lock:
+            if self._segments is not None:
+                return
+            manifest = self._read_manifest()
+            self._segments = manifest['segments']
+            self._sequence = manifest.get('sequence', 0)
+            self._recover_segments()
+            self.active.open()
+            self._active_first = self.active.first_timestamp()
+            if self._segments:
+                # Keep timestamps increasing across segments
+                self.active._last_ts = max(self.active._last_ts, self._segments[-1]['last'])
+            self._schedule()
+
+    def _recover_segments(self) -> None:
+        """Adopt segments sealed but not yet listed, and clean up interrupted compressions."""
+        known = {segment['name'] for segment in self._segments}
+        prefix = os.path.basename(self.base) + "."
+        files = set(os.listdir(self.directory))
+        adopted = []
+        for name in sorted(files):
+            compression = next((c for c, suffix in COMPRESSION_SUFFIXES.items() if name.endswith(".jsonl" + suffix)), None)
+            if compression is not None:
+                name = name[:-len(COMPRESSION_SUFFIXES[compression])]
+                if name in files:
+                    # Compression was interrupted; the uncompressed file is adopted instead
+                    continue
+            if (not name.startswith(prefix) or not name.endswith(".jsonl") or name == os.path.basename(self.path)
+                    or name in known):
+                continue
+            if compression is None:
+                log = ResponseLog(os.path.join(self.directory, name))
+                log.open()
+                log.close()
+            self._segments.append(self._describe(name, compression))
+            adopted.append(name)
+        self._segments.sort(key=lambda segment: (segment['first'], segment['name']))
+        # A lost manifest also loses the sequence; carry on past every name still on disk
+        for name in files:
+            match = _SEGMENT_SEQUENCE.search(name)
+            if match and name.startswith(prefix):
+                self._sequence = max(self._sequence, int(match.group(1)))
+
+        for segment in self._segments:
+            path = self._segment_path(segment)
+            if segment['compression'] is None:
+                stale = [path + suffix + extra for suffix in COMPRESSION_SUFFIXES.values()
+                         for extra in ("", ".tmp", ".blk", ".blk.tmp")]
+            else:
+                stale = [path]
+            for leftover in stale:
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        if adopted:
+            self._save_manifest()
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        with self._lock:
+            if self._should_roll():
+                self._roll()
+            written = self.active.append(records)
+            if self._active_first is None:
+                self._active_first = self.active.first_timestamp()
+            return written
+
+    def _should_roll(self) -> bool:
+        if self.active.size == 0:
+            return False
+        if self.segment_bytes is not None and self.active.size >= self.segment_bytes:
+            return True
+        return (self.daily and self._active_first is not None
+                and date.fromtimestamp(self._active_first) != date.today())
+
+    def _roll(self) -> None:
+        stamp = datetime.fromtimestamp(self._active_first or time.time()).strftime("%Y%m%d-%H%M%S")
+        self._sequence += 1
+        name = f"{os.path.basename(self.base)}.{stamp}.{self._sequence:06d}.jsonl"
+        sealed = os.path.join(self.directory, name)
+
+        last_ts = self.active.last_timestamp
+        self.active.close()
+        # Index first: stopping in between just leaves the active segment to re-index
+        os.replace(self.active.index_path, sealed + ".idx")
+        os.replace(self.active.path, sealed)
+        self._segments.append(self._describe(name))
+        self._save_manifest()
+        self.active.open()
+        self.active._last_ts = max(self.active._last_ts, last_ts)
+        self._active_first = None
+        self.rollovers += 1
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self.compression is None and self.retain_days is None and self.retain_bytes is None:
+            return
+        if self._maintenance is None:
+            self._maintenance = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-log-maintenance")
+        self._maintenance.submit(self._maintain)
+
+    def _maintain(self) -> None:
+        try:
+            self._expire()
+            with self._lock:
+                pending = [segment for segment in self._segments if segment['compression'] is None]
+            if self.compression is not None:
+                for segment in pending:
+                    self._compress(segment)
+        except Exception as e:
+            print(f"✗ Response log maintenance failed: {e}")
+
+    def _compress(self, segment: Dict[str, Any]) -> None:
+        path = self._segment_path(segment)
+        stored = compress_segment(path, self.compression)
+        with self._lock:
+            if segment not in self._segments:
+                return
+            segment.update(compression=self.compression, stored=stored)
+            self._save_manifest()
+            self.compressed += 1
+        os.remove(path)
+
+    def _expire(self) -> None:
+        expired = []
+        with self._lock:
+            cutoff = time.time() - self.retain_days * 86400 if self.retain_days is not None else None
+            while self._segments:
+                total = sum(segment['stored'] for segment in self._segments) + self.active.size
+                oldest = self._segments[0]
+                if not ((cutoff is not None and oldest['last'] < cutoff)
+                        or (self.retain_bytes is not None and total > self.retain_bytes)):
+                    break
+                expired.append(self._segments.pop(0))
+            if not expired:
+                return
+            self._save_manifest()
+            self.expired += len(expired)
+            # Still under the lock, so no segment sealed meanwhile can be caught up in this
+            for segment in expired:
+                path = self._segment_path(segment)
+                files = {path, path + ".idx"}
+                if segment['compression'] is not None:
+                    suffix = COMPRESSION_SUFFIXES[segment['compression']]
+                    files.update((path + suffix, path + suffix + ".blk"))
+                for leftover in files:
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+
+    def sync(self) -> None:
+        self.active.sync()
+
+    def close(self) -> None:
+        """Close the active segment after any compression already under way."""
+        with self._lock:
+            maintenance, self._maintenance = self._maintenance, None
+        if maintenance is not None:
+            maintenance.shutdown(wait=True)
+        with self._lock:
+            self.active.close()
+            self._segments = None
+
+    def _sealed(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._segments is not None:
+                return [dict(segment) for segment in self._segments]
+        return self._load_manifest()
+
+    def _consistent(self, lookup: Callable[[], Any]) -> Any:
+        """Run ``lookup`` again if a segment was sealed, compressed or dropped under it."""
+        for attempt in range(3):
+            generation = self._generation
+            try:
+                result = lookup()
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+                continue
+            if generation == self._generation:
+                break
+        return result
+
+    def __len__(self) -> int:
+        return self._consistent(lambda: len(self.active) + sum(s['entries'] for s in self._sealed()))
+
+    def recent(self, count: int = 5) -> List[Dict[str, Any]]:
+        """The last ``count`` entries, oldest first."""
+        def lookup():
+            sealed = self._sealed()
+            entries = self.active.recent(count)
+            for segment in reversed(sealed):
+                if len(entries) >= count:
+                    break
+                log = ResponseLog(self._segment_path(segment), segment['compression'])
+                entries = log.recent(count - len(entries)) + entries
+            return entries
+        return self._consistent(lookup)
+
+    def find(self, email: Optional[str] = None, since: Optional[TimeLike] = None,
+             until: Optional[TimeLike] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """ResponseLog.find across segments, skipping those outside [since, until)."""
+        since_ts = _epoch(since) if since is not None else None
+        until_ts = _epoch(until) if until is not None else None
+
+        def lookup():
+            sealed = self._sealed()
+            found = self.active.find(email, since, until, limit)
+            for segment in reversed(sealed):
+                if limit is not None and len(found) >= limit:
+                    break
+                if (since_ts is not None and segment['last'] < since_ts) or (
+                        until_ts is not None and segment['first'] >= until_ts):
+                    continue
+                log = ResponseLog(self._segment_path(segment), segment['compression'])
+                found = log.find(email, since, until, None if limit is None else limit - len(found)) + found
+            return found
+        return self._consistent(lookup)
+
+    def stats(self) -> Dict[str, Any]:
+        sealed = self._sealed()
+        return {
+            'segments': len(sealed) + 1,
+            'active_bytes': self.active.size,
+            'sealed_bytes': sum(segment['bytes'] for segment in sealed),
+            'stored_bytes': sum(segment['stored'] for segment in sealed),
+            'rollovers': self.rollovers,
+            'compressed': self.compressed,
+            'expired': self.expired
+        }
+
+
+def _env_limit(name: str, default: str) -> Optional[float]:
+    value = os.getenv(name, default).lower()
+    return None if value in ("off", "none", "0", "") else float(value)
+
+
+def response_log_from_env(path: str) -> SegmentedResponseLog:
+    """Segmented log configured by RESPONSE_LOG_SEGMENT_MB, _ROTATE_DAILY, _COMPRESS, _RETAIN_DAYS and _RETAIN_MB."""
+    compression = os.getenv("RESPONSE_LOG_COMPRESS", "gzip").lower()
+    if compression in ("off", "none", "0", ""):
+        compression = None
+    elif compression == "zstd" and importlib.util.find_spec("zstandard") is None:
+        print("Warning: RESPONSE_LOG_COMPRESS=zstd needs the zstandard package, using gzip")
+        compression = "gzip"
+    elif compression not in COMPRESSION_SUFFIXES:
+        print(f"Warning: Unknown RESPONSE_LOG_COMPRESS '{compression}', using gzip")
+        compression = "gzip"
+    segment_mb = _env_limit("RESPONSE_LOG_SEGMENT_MB", "64")
+    retain_mb = _env_limit("RESPONSE_LOG_RETAIN_MB", "off")
+    return SegmentedResponseLog(
+        path,
+        segment_bytes=int(segment_mb * 2**20) if segment_mb else None,
+        daily=os.getenv("RESPONSE_LOG_ROTATE_DAILY", "on").lower() not in ("off", "0", "false"),
+        compression=compression,
+        retain_days=_env_limit("RESPONSE_LOG_RETAIN_DAYS", "off"),
+        retain_bytes=int(retain_mb * 2**20) if retain_mb else None
+    )
+
+
+def _starts_text_entry(window: deque) -> bool:
+    return (len(window) >= 5 and window[0] == TEXT_RULE and window[1].startswith("TIMESTAMP: ")
+            and window[2].startswith("TO: ") and window[3].startswith("SUBJECT: ") and window[4] == TEXT_RULE)
+
+
+def _finish_text_entry(header: List[str], body: List[str]) -> Dict[str, Any]:
+    while body and not body[-1]:
+        body.pop()
+    if body and body[-1] == TEXT_RULE:
+        body.pop()
+    return {
+        'timestamp': header[0][len("TIMESTAMP: "):],
+        'to': header[1][len("TO: "):],
+        'subject': header[2][len("SUBJECT: "):],
+        'response': "\n".join(body)
+    }
+
+
+def read_text_log(path: str) -> Iterator[Dict[str, Any]]:
+    """Entries of a log in the old '=' * 80 text format, streamed.
+
+    An entry starts at a rule line followed by the TIMESTAMP/TO/SUBJECT
+    header and another rule, so bodies that contain the rule themselves are
+    kept whole.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = (line.rstrip('\n') for line in f)
+        window = deque(islice(lines, 5))
+        header: Optional[List[str]] = None
+        body: List[str] = []
+        while window:
+            if _starts_text_entry(window):
+                if header is not None:
+                    yield _finish_text_entry(header, body)
+                header, body = [window[1], window[2], window[3]], []
+                window.clear()
+                window.extend(islice(lines, 5))
+                continue
+            line = window.popleft()
+            if header is not None:
+                body.append(line)
+            window.extend(islice(lines, 1))
+        if header is not None:
+            yield _finish_text_entry(header, body)
+
+
+def migrate_text_log(source: str, destination: str, batch_size: int = 1000,
+                     segment_bytes: Optional[int] = 64 * 2**20, compression: Optional[str] = 'gzip') -> int:
+    """Copy an old text log into a new segmented log; returns the number of entries."""
+    log = SegmentedResponseLog(destination, segment_bytes=segment_bytes, daily=False, compression=compression)
+    if (os.path.exists(destination) and os.path.getsize(destination) > 0) or os.path.exists(log.manifest_path):
+        raise ValueError(f"{destination} already has entries")
+    log.open()
+    migrated = 0
+    try:
+        batch = []
+        for entry in read_text_log(source):
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                log.append(batch)
+                migrated += len(batch)
+                batch = []
+        log.append(batch)
+        migrated += len(batch)
+        log.sync()
+    finally:
+        log.close()
+    return migrated
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the indexed response log.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate = commands.add_parser('migrate', help="Convert an old text response log")
+    migrate.add_argument('source', nargs='?', default="response_log.txt")
+    migrate.add_argument('-o', '--output', default="response_log.jsonl")
+    migrate.add_argument('--segment-mb', type=float, default=64, help="Segment size; 0 keeps one file")
+    migrate.add_argument('--compress', default="gzip", choices=["gzip", "zstd", "off"])
+    reindex = commands.add_parser('reindex', help="Rebuild the .idx file of the active or an uncompressed segment")
+    reindex.add_argument('log', nargs='?', default="response_log.jsonl")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'migrate':
+        count = migrate_text_log(args.source, args.output,
+                                 segment_bytes=int(args.segment_mb * 2**20) or None,
+                                 compression=None if args.compress == "off" else args.compress)
+        print(f"✓ Migrated {count:,} responses from {args.source} → {args.output} "
+              f"in {time.perf_counter() - start:.1f} s")
+    else:
+        if os.path.exists(args.log + ".idx"):
+            os.remove(args.log + ".idx")
+        log = ResponseLog(args.log)
+        log.open()
+        log.close()
+        print(f"✓ Indexed {len(log):,} responses in {args.log} in {time.perf_counter() - start:.1f} s")
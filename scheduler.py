@@ -0,0 +1,100 @@
+"""Runs pipeline stages as a dependency graph, concurrently where it allows."""
+
+import asyncio
+import time
+from typing import Any, Callable, Container, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class Stage(NamedTuple):
+    name: str
+    # Called with the results of the stages named in ``after``
+    run: Callable[[Dict[str, Any]], Any]
+    after: Tuple[str, ...] = ()
+
+
+class StageRun:
+    """Results of one run, with each stage's (start, end) in ms since the run began."""
+
+    def __init__(self, results: Dict[str, Any], spans: Dict[str, Tuple[float, float]],
+                 stages: Sequence[Stage]):
+        self.results = results
+        self.spans = spans
+        self._after = {stage.name: stage.after for stage in stages}
+
+    def critical_path(self, worked: Optional[Container[str]] = None) -> List[str]:
+        """The chain of stages that determined the total time, first stage first.
+
+        ``worked`` limits the chain to stages that did something; a stage that
+        returned at once can otherwise finish last and hide the real work.
+        """
+        counted = [name for name in self.spans if worked is None or name in worked]
+        path = []
+        while counted:
+            name = max(counted, key=lambda n: self.spans[n][1])
+            path.append(name)
+            counted = [dep for dep in self._after[name] if worked is None or dep in worked]
+        return path[::-1]
+
+
+def _check_order(stages: Sequence[Stage]) -> None:
+    seen = set()
+    for stage in stages:
+        missing = [name for name in stage.after if name not in seen]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' runs after unknown or later stages: {missing}")
+        seen.add(stage.name)
+
+
+def run_stages(stages: Sequence[Stage], parallel: bool = True) -> StageRun:
+    """Run ``stages`` (listed dependencies first) on threads, each as soon as its dependencies finish."""
+    _check_order(stages)
+    start = time.perf_counter()
+    spans: Dict[str, Tuple[float, float]] = {}
+
+    def run(stage: Stage, done: Dict[str, Any]) -> Any:
+        began = time.perf_counter()
+        result = stage.run(done)
+        spans[stage.name] = ((began - start) * 1000, (time.perf_counter() - start) * 1000)
+        return result
+
+    if not parallel:
+        results: Dict[str, Any] = {}
+        for stage in stages:
+            results[stage.name] = run(stage, {name: results[name] for name in stage.after})
+        return StageRun(results, spans, stages)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    # One worker per stage, so a stage waiting on its dependencies never starves them
+    with ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix="stage") as pool:
+        futures = {}
+        for stage in stages:
+            deps = [(name, futures[name]) for name in stage.after]
+            futures[stage.name] = pool.submit(
+                lambda stage=stage, deps=deps: run(stage, {name: f.result() for name, f in deps}))
+    return StageRun({name: f.result() for name, f in futures.items()}, spans, stages)
+
+
+async def run_stages_async(stages: Sequence[Stage]) -> StageRun:
+    """run_stages() for event loops: each stage's ``run`` returns an awaitable."""
+    _check_order(stages)
+    start = time.perf_counter()
+    spans: Dict[str, Tuple[float, float]] = {}
+    tasks: Dict[str, asyncio.Future] = {}
+
+    async def run(stage: Stage) -> Any:
+        done = {name: await tasks[name] for name in stage.after}
+        began = time.perf_counter()
+        result = await stage.run(done)
+        spans[stage.name] = ((began - start) * 1000, (time.perf_counter() - start) * 1000)
+        return result
+
+    for stage in stages:
+        tasks[stage.name] = asyncio.ensure_future(run(stage))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return StageRun({name: task.result() for name, task in tasks.items()}, spans, stages)
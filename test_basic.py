@@ -59,10 +59,10 @@ try:
         
         # Check if log file was created
         import os
-        if os.path.exists('response_log.txt'):
-            print(f"✓ response_log.txt created and updated")
+        if os.path.exists('response_log.jsonl'):
+            print(f"✓ response_log.jsonl created and updated")
         else:
-            print(f"⚠ response_log.txt not found")
+            print(f"⚠ response_log.jsonl not found")
     else:
         print(f"✗ Failed to log response")
 except Exception as e:
@@ -138,6 +138,649 @@ for filename in required_files:
     else:
         print(f"✗ {filename} - NOT FOUND")
 
+# Test 8: Inverted Index Parity
+print("\n[TEST 8] Inverted Index Parity")
+print("-"*80)
+
+
+def linear_scan_search(tool, query, category=None, top_k=3):
+    # Reference implementation: score every FAQ in every category
+    query_lower = query.lower()
+    keywords = tool._extract_keywords(query_lower)
+    results = []
+    for cat in ([category] if category else tool.faqs.keys()):
+        for faq_data in tool.faqs.get(cat, {}).values():
+            score = tool._calculate_relevance(query_lower, keywords,
+                                              faq_data.get('question', '').lower(),
+                                              faq_data.get('answer', '').lower())
+            if score > 0:
+                results.append({'category': cat, 'question': faq_data.get('question', ''),
+                                'answer': faq_data.get('answer', ''), 'score': score})
+    results.sort(key=lambda x: x['score'], reverse=True)
+    return results[:top_k]
+
+
+parity_queries = [q for q, _, _ in test_queries] + test_sentences + [
+    "password", "pass", "invoice?", "how do i", "", "Settings > Security",
+    "can't sign in to the app", "refund within 30 days",
+]
+parity_queries += [faq['question'] for cat in faq_tool.faqs.values() for faq in cat.values()]
+
+mismatches = []
+for query in parity_queries:
+    for category in [None] + list(faq_tool.faqs.keys()):
+        for top_k in (3, 50):
+            if faq_tool.search(query, category, top_k) != linear_scan_search(faq_tool, query, category, top_k):
+                mismatches.append((query, category, top_k))
+
+if mismatches:
+    print(f"✗ {len(mismatches)} ranking mismatch(es), e.g. {mismatches[0]}")
+    raise AssertionError("Indexed search diverges from linear scan")
+print(f"✓ Indexed rankings match linear scan on {len(parity_queries)} queries")
+
+# Test 9: BM25 Scorer
+print("\n[TEST 9] BM25 Scorer")
+print("-"*80)
+
+for query, category, expected_category in test_queries:
+    results = faq_tool.search(query, category, scorer='bm25')
+    scores = [r['score'] for r in results]
+    assert scores == sorted(scores, reverse=True), "BM25 results not ranked by score"
+    assert all(r['category'] == category for r in results) if category else True
+    found = results[0]['category'] if results else 'none'
+    match = "✓" if found == expected_category else "⚠"
+    print(f"{match} Query: '{query}' → {len(results)} result(s), top in '{found}'")
+
+try:
+    faq_tool.search("password", scorer='nope')
+    print("✗ Unknown scorer accepted")
+except ValueError:
+    print("✓ Unknown scorer rejected")
+
+# Test 10: Embedding Retrieval
+print("\n[TEST 10] Embedding Retrieval")
+print("-"*80)
+
+try:
+    import numpy as np
+    embeddings = FAQSearchTool(sharded=False)._index.embeddings()
+    assert embeddings.matrix.dtype == np.float32 and embeddings.matrix.flags['C_CONTIGUOUS']
+    print(f"✓ {embeddings.matrix.shape[0]} FAQ vectors in a {embeddings.matrix.shape} float32 matrix")
+
+    for query, category, expected_category in test_queries:
+        results = faq_tool.search(query, category, scorer='embedding')
+        found = results[0]['category'] if results else 'none'
+        match = "✓" if found == expected_category else "⚠"
+        print(f"{match} Query: '{query}' → {len(results)} result(s), top in '{found}'")
+
+    batch_queries = [q for q, _, _ in test_queries]
+    batch_categories = [c for _, c, _ in test_queries]
+    batch = embeddings.search_batch(batch_queries, batch_categories, top_k=3)
+    single = [embeddings.search(q, c, top_k=3) for q, c in zip(batch_queries, batch_categories)]
+    assert [[d for d, _ in r] for r in batch] == [[d for d, _ in r] for r in single]
+    print(f"✓ Batch matmul path matches single-query results")
+except ImportError as e:
+    print(f"⚠ Skipped, NumPy not installed: {e}")
+
+# Test 11: Batch Search
+print("\n[TEST 11] Batch Search (search_many)")
+print("-"*80)
+
+batch_queries = parity_queries + parity_queries[:5]
+batch_categories = [list(faq_tool.faqs.keys())[i % 4] if i % 3 == 0 else None
+                    for i in range(len(batch_queries))]
+scorers = ['heuristic', 'bm25'] + (['embedding'] if 'np' in globals() else [])
+for scorer in scorers:
+    batched = faq_tool.search_many(batch_queries, batch_categories, top_k=3, scorer=scorer)
+    looped = [faq_tool.search(q, c, 3, scorer=scorer) for q, c in zip(batch_queries, batch_categories)]
+    if [[r['question'] for r in rs] for rs in batched] != [[r['question'] for r in rs] for rs in looped]:
+        raise AssertionError(f"search_many diverges from search() with scorer '{scorer}'")
+    print(f"✓ {scorer}: {len(batch_queries)} queries match looped search, in input order")
+
+# Test 12: Hot Reload
+print("\n[TEST 12] FAQ Hot Reload")
+print("-"*80)
+
+import shutil
+import tempfile
+import time
+
+reload_dir = tempfile.mkdtemp()
+reload_file = os.path.join(reload_dir, 'faqs.json')
+shutil.copy('faqs.json', reload_file)
+reload_tool = FAQSearchTool(reload_file)
+old_index = reload_tool._index
+
+result = reload_tool.reload(force=False)
+assert not result['reloaded'], "Unchanged file should not be rebuilt"
+
+edited = json.loads(json.dumps(faqs))
+edited['general']['parking'] = {'question': 'Where is visitor parking?', 'answer': 'Level B2 of the garage.'}
+with open(reload_file, 'w', encoding='utf-8') as f:
+    json.dump(edited, f)
+reload_tool.start_watching(interval=0.05)
+deadline = time.time() + 5
+while reload_tool._index is old_index and time.time() < deadline:
+    time.sleep(0.05)
+reload_tool.stop_watching()
+assert reload_tool.search("visitor parking"), "Watcher did not pick up the edited file"
+print(f"✓ Watcher swapped in the edited file ({len(reload_tool._index)} entries)")
+
+with open(reload_file, 'w', encoding='utf-8') as f:
+    f.write('{not valid json')
+try:
+    reload_tool.reload()
+    print("✗ Broken FAQ file accepted")
+except ValueError:
+    assert reload_tool.search("visitor parking"), "Failed reload replaced the index"
+    print("✓ Broken FAQ file rejected, previous index kept")
+shutil.rmtree(reload_dir)
+
+# Test 13: Incremental FAQ Updates
+print("\n[TEST 13] Incremental FAQ Updates")
+print("-"*80)
+
+update_tool = FAQSearchTool()
+if 'np' in globals():
+    update_tool._index.build_embeddings()
+created = update_tool.upsert_faq('general', 'parking', 'Where is visitor parking?', 'Level B2 of the garage.')['created']
+replaced = not update_tool.upsert_faq('account', 'password_reset', 'How do I reset my passphrase?',
+                                      'Use the passphrase reset link on the login page.')['created']
+deleted = update_tool.delete_faq('billing', 'refund_request')
+assert created and replaced and deleted and not update_tool.delete_faq('billing', 'refund_request')
+
+rebuilt = FAQSearchTool()
+rebuilt._index = type(update_tool._index)(json.loads(json.dumps(update_tool.faqs)))
+for scorer in ['heuristic', 'bm25']:
+    for query in parity_queries + ["visitor parking", "passphrase", "refund"]:
+        incremental = {r['question']: r['score'] for r in update_tool.search(query, top_k=50, scorer=scorer)}
+        full = {r['question']: r['score'] for r in rebuilt.search(query, top_k=50, scorer=scorer)}
+        assert incremental == full, f"Incremental index diverges from rebuild ({scorer}, '{query}')"
+    print(f"✓ {scorer}: incremental index matches a full rebuild")
+
+for scorer in scorers:
+    # Incremental vectors reuse the original IDF weights, so compare outcomes only
+    assert update_tool.search("visitor parking", scorer=scorer)[0]['question'] == 'Where is visitor parking?'
+    assert update_tool.search("passphrase reset", scorer=scorer)[0]['question'] == 'How do I reset my passphrase?'
+    assert all('refund' not in r['question'].lower() for r in update_tool.search("refund", scorer=scorer))
+print(f"✓ Added, replaced and deleted FAQs are searchable with every scorer")
+
+save_dir = tempfile.mkdtemp()
+save_file = os.path.join(save_dir, 'faqs.json')
+shutil.copy('faqs.json', save_file)
+with open(save_file, 'rb') as f:
+    original_bytes = f.read()
+save_tool = FAQSearchTool(save_file)
+save_tool.upsert_faq('general', 'parking', 'Where is visitor parking?', 'Level B2 of the garage.')
+save_tool.delete_faq('billing', 'refund_request')
+with open(save_file, 'rb') as f:
+    assert f.read() == original_bytes, "An edit rewrote the FAQ file before save()"
+assert save_tool.unsaved_edits == 2 and save_tool.save() == 2 and save_tool.unsaved_edits == 0
+with open(save_file, encoding='utf-8') as f:
+    saved_faqs = json.load(f)
+assert 'parking' in saved_faqs['general'] and 'refund_request' not in saved_faqs['billing']
+print("✓ Edits stay in memory until save() writes them in one batch")
+shutil.rmtree(save_dir)
+
+# Test 14: Binary Snapshot
+print("\n[TEST 14] Binary FAQ Snapshot")
+print("-"*80)
+
+from faq_index import compile_snapshot, SnapshotFAQIndex
+
+snapshot_dir = tempfile.mkdtemp()
+snapshot_json = os.path.join(snapshot_dir, 'faqs.json')
+shutil.copy('faqs.json', snapshot_json)
+compile_snapshot(snapshot_json)
+json_tool = FAQSearchTool(snapshot_json, snapshot_file=os.path.join(snapshot_dir, 'missing.snapshot'))
+mapped_tool = FAQSearchTool(snapshot_json)
+assert isinstance(mapped_tool._index, SnapshotFAQIndex) and not isinstance(json_tool._index, SnapshotFAQIndex)
+assert mapped_tool.faqs == json_tool.faqs
+
+for scorer in scorers:
+    for query in parity_queries:
+        assert mapped_tool.search(query, top_k=50, scorer=scorer) == json_tool.search(query, top_k=50, scorer=scorer), \
+            f"Snapshot search diverges from JSON ({scorer}, '{query}')"
+    print(f"✓ {scorer}: memory-mapped snapshot matches the JSON index")
+
+mapped_tool.upsert_faq('general', 'parking', 'Where is visitor parking?', 'Level B2 of the garage.')
+assert not mapped_tool._index.read_only and mapped_tool.search("visitor parking")
+print("✓ First write switches the read-only snapshot to an in-memory index")
+
+os.utime(snapshot_json, ns=(0, 0))
+assert not isinstance(FAQSearchTool(snapshot_json)._index, SnapshotFAQIndex)
+print("✓ Out-of-date snapshot ignored, JSON loaded instead")
+shutil.rmtree(snapshot_dir)
+
+# Test 15: Lazy Tool Initialization
+print("\n[TEST 15] Lazy Tool Initialization")
+print("-"*80)
+
+import subprocess
+import sys
+
+lazy_probe = """
+import sys, threading
+import tools
+assert tools._faq_search is None and tools._email_sender is None, "tools built singletons at import"
+assert 'numpy' not in sys.modules, "tools imported NumPy at import"
+assert not {'smtplib', 'delivery', 'log_writer', 'response_log'} & set(sys.modules), "tools imported the response log or SMTP at import"
+built = []
+threads = [threading.Thread(target=lambda: built.append(tools.get_faq_search())) for _ in range(16)]
+[t.start() for t in threads]
+[t.join() for t in threads]
+assert len({id(b) for b in built}) == 1 and tools.faq_search is built[0], "more than one FAQSearchTool built"
+"""
+probe = subprocess.run([sys.executable, '-X', 'importtime', '-c', lazy_probe],
+                       capture_output=True, text=True)
+if probe.returncode != 0:
+    print(probe.stderr.strip().splitlines()[-1])
+    raise AssertionError("Lazy initialization probe failed")
+import_us = next(int(line.split('|')[1]) for line in probe.stderr.splitlines()
+                 if line.split('|')[-1].strip() == 'tools')
+# Wall-clock time depends on the machine, so it is reported, not asserted
+print(f"✓ 'import tools' builds nothing and skips NumPy, SMTP and the response log "
+      f"({import_us / 1000:.1f} ms cumulative)")
+print("✓ 16 concurrent first calls share one FAQSearchTool")
+
+# Test 16: Category Shards
+print("\n[TEST 16] Category Shards")
+print("-"*80)
+
+from faq_index import ShardedFAQIndex
+
+sharded_tool, flat_tool = FAQSearchTool(), FAQSearchTool(sharded=False)
+assert isinstance(sharded_tool._index, ShardedFAQIndex)
+print(f"✓ {len(sharded_tool._index.shards)} shards: {', '.join(sharded_tool._index.shards)}")
+
+for scorer in scorers:
+    for query in parity_queries:
+        for category in [None] + list(flat_tool.faqs.keys()):
+            expected = flat_tool.search(query, category, 5, scorer=scorer)
+            found = sharded_tool.search(query, category, 5, scorer=scorer)
+            if scorer == 'embedding':
+                # Same vectors, so only float rounding may reorder near-ties
+                assert [r['score'] for r in found] == [r['score'] for r in expected], \
+                    f"Sharded embedding scores diverge for '{query}' in {category}"
+            else:
+                assert found == expected, f"Sharded {scorer} search diverges for '{query}' in {category}"
+    many = sharded_tool.search_many(parity_queries, scorer=scorer)
+    assert many == [sharded_tool.search(q, scorer=scorer) for q in parity_queries]
+    print(f"✓ {scorer}: sharded rankings match the unsharded index")
+
+sharded_tool.upsert_faq('shipping', 'tracking', 'How do I track my parcel?', 'Use the tracking link in your email.')
+assert sharded_tool.search("track my parcel", 'shipping')[0]['category'] == 'shipping'
+assert sharded_tool.search("track my parcel", 'billing') == []
+print("✓ Upsert into a new category creates its shard")
+
+# Test 17: Search Allocations
+print("\n[TEST 17] Search Allocations")
+print("-"*80)
+
+import tracemalloc
+from collections.abc import Mapping
+
+
+def dict_per_hit_search(tool, query, top_k=3):
+    # Reference: a result dict for every scoring FAQ, then a full sort
+    index = tool._index
+    query_lower = query.lower()
+    keywords = tool._extract_keywords(query_lower)
+    results = []
+    for doc_id in index.candidates(query_lower, keywords):
+        entry = index.entries[doc_id]
+        score = tool._calculate_relevance(query_lower, keywords, entry.question_lower, entry.answer_lower)
+        if score > 0:
+            results.append({'category': entry.category, 'question': entry.question,
+                            'answer': entry.answer, 'score': score})
+    results.sort(key=lambda x: x['score'], reverse=True)
+    return results[:top_k]
+
+
+def peak_bytes(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+broad_faqs = json.loads(json.dumps(faq_tool.faqs))
+for i in range(3000):
+    source = list(faq_tool.faqs['general'].values())[i % len(faq_tool.faqs['general'])]
+    broad_faqs['general'][f"copy_{i}"] = {'question': f"{source['question']} ({i})", 'answer': source['answer']}
+broad_tool = FAQSearchTool(sharded=False)
+broad_tool._index = type(broad_tool._index)(broad_faqs)
+
+broad_query = "how do i contact the support team"
+hits = sum(1 for _ in broad_tool.search(broad_query, top_k=10**6))
+assert broad_tool.search(broad_query) == dict_per_hit_search(broad_tool, broad_query)
+heap_peak = peak_bytes(lambda: broad_tool.search(broad_query))
+dict_peak = peak_bytes(lambda: dict_per_hit_search(broad_tool, broad_query))
+print(f"✓ Broad query ({hits:,} scoring FAQs): peak {heap_peak / 1024:.0f} KiB "
+      f"vs {dict_peak / 1024:.0f} KiB for dict-per-hit + sort")
+assert heap_peak < dict_peak / 2, "Top-k search allocates like a full sort"
+
+result = broad_tool.search(broad_query)[0]
+entry = result.entry
+assert isinstance(result, Mapping) and not hasattr(result, '__dict__')
+assert result['question'] is entry.question and result['answer'] is entry.answer
+assert dict(result) == {'category': entry.category, 'question': entry.question,
+                        'answer': entry.answer, 'score': result['score']}
+assert result.get('missing', 'default') == 'default' and 'answer' in result
+print("✓ Results are dict-compatible __slots__ records sharing the indexed strings")
+
+# Test 18: Buffered Response Log
+print("\n[TEST 18] Buffered Response Log")
+print("-"*80)
+
+import contextlib
+import io
+import threading
+from log_writer import BufferedWriter
+from response_log import ResponseLog
+
+log_dir = tempfile.mkdtemp()
+log_path = os.path.join(log_dir, "response_log.jsonl")
+sender = EmailResponseTool(log_path, buffered=True)
+producers, per_producer = 16, 50
+
+
+def produce(n):
+    for i in range(per_producer):
+        sender.send(f"user{n}@example.com", f"Reply {i} for user {n}\n" + "body line\n" * 20)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    threads = [threading.Thread(target=produce, args=(n,)) for n in range(producers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+assert sender.flush(timeout=5)
+stats = sender.stats()
+entries = sender.get_recent_responses(count=10**6)
+assert stats['entries'] == producers * per_producer and stats['dropped'] == 0
+assert len(entries) == producers * per_producer
+assert all(entry['response'].count("body line") == 20 for entry in entries)
+assert stats['batches'] < stats['entries']
+print(f"✓ {stats['entries']} entries from {producers} threads, intact, in {stats['batches']} batched writes")
+
+sender.close()
+assert sender._writer._thread is None
+with contextlib.redirect_stdout(io.StringIO()):
+    assert sender.send("late@example.com", "After close")
+sender.close()
+assert sender.get_recent_responses(count=1)[0]['response'] == "After close"
+print("✓ close() drains the queue; a later send restarts the writer")
+
+stalled = BufferedWriter(ResponseLog(os.path.join(log_dir, "stalled.jsonl")), max_queue=1,
+                         flush_interval=0, put_timeout=0.05)
+stalled._write_batch = lambda batch: time.sleep(0.2) or stalled._settle(len(batch))
+accepted = [stalled.write({'to': "a@example.com", 'subject': "s", 'response': "r"}) for _ in range(4)]
+assert not all(accepted) and stalled.stats()['dropped'] >= 1
+stalled.close()
+print(f"✓ A full queue pushes back: {accepted.count(False)} of 4 writes refused")
+
+synced = []
+timed = ResponseLog(os.path.join(log_dir, "timed.jsonl"))
+timed.sync = lambda: synced.append(time.monotonic())
+timed_writer = BufferedWriter(timed, flush_interval=0, fsync=0.05)
+timed_writer.write({'to': "a@example.com", 'subject': "s", 'response': "last one"})
+assert timed_writer.flush(timeout=1)
+written_at = time.monotonic()
+time.sleep(0.3)
+assert any(t >= written_at for t in synced)
+timed_writer.close()
+print("✓ The last batch is fsynced on the timer even when no write follows it")
+
+racing = BufferedWriter(ResponseLog(os.path.join(log_dir, "racing.jsonl")), flush_interval=0.001, fsync="off")
+stop = threading.Event()
+
+
+def write_until_stopped():
+    while not stop.is_set():
+        racing.write({'to': "a@example.com", 'subject': "s", 'response': "r"})
+
+writers = [threading.Thread(target=write_until_stopped) for _ in range(4)]
+for t in writers:
+    t.start()
+for _ in range(20):
+    racing.close()
+stop.set()
+for t in writers:
+    t.join()
+assert racing.flush(timeout=2)
+racing.close()
+assert racing.stats()['queued'] == 0 and len(ResponseLog(racing.sink.path)) == racing.stats()['entries']
+print(f"✓ {racing.stats()['entries']:,} writes racing 20 close() calls were all written")
+shutil.rmtree(log_dir)
+
+# Test 19: Indexed Response Log
+print("\n[TEST 19] Indexed Response Log")
+print("-"*80)
+
+from datetime import datetime
+from response_log import TEXT_RULE, migrate_text_log
+
+log_dir = tempfile.mkdtemp()
+log_path = os.path.join(log_dir, "response_log.jsonl")
+sender = EmailResponseTool(log_path, buffered=False)
+tricky = f"Before the rule\n{TEXT_RULE}\nTIMESTAMP: not a header\nAfter the rule"
+with contextlib.redirect_stdout(io.StringIO()):
+    for i in range(300):
+        if i == 150:
+            sender.send("tricky@example.com", tricky)
+        else:
+            sender.send(f"user{i % 7}@example.com", f"Reply {i}")
+        if i == 199:
+            middle = time.time()
+            time.sleep(0.01)
+recent = sender.get_recent_responses(count=3)
+assert [e['response'] for e in recent] == ["Reply 297", "Reply 298", "Reply 299"]
+assert [e['response'] for e in sender.find_responses(email="tricky@example.com")] == [tricky]
+user0 = sender.find_responses(email="USER0@example.com", limit=2)
+assert [e['response'] for e in user0] == ["Reply 287", "Reply 294"]
+after = sender.find_responses(since=middle, limit=None)
+assert len(after) == 100 and after[0]['response'] == "Reply 200"
+assert len(sender.find_responses(until=middle, limit=None)) == 200
+print("✓ Last N, by email and by time range read through the offset index; bodies with the old separator survive")
+
+# A crash can leave a torn last line and an index that lags the data
+sender.close()
+with open(log_path, 'ab') as f:
+    f.write(b'{"timestamp": "2026-01-01 00:00:00.000", "to": "torn')
+with open(log_path + ".idx", 'r+b') as f:
+    f.truncate(os.path.getsize(log_path + ".idx") - 10 * 28)
+with contextlib.redirect_stdout(io.StringIO()):
+    sender.send("after@example.com", "After recovery")
+assert len(sender.log) == 301
+assert sender.get_recent_responses(count=1)[0]['response'] == "After recovery"
+assert [e['response'] for e in sender.find_responses(email="tricky@example.com")] == [tricky]
+sender.close()
+print("✓ Reopening re-indexes unindexed entries and cuts off a torn write")
+
+text_path = os.path.join(log_dir, "response_log.txt")
+with open(text_path, 'w', encoding='utf-8') as f:
+    for i, body in enumerate(["First reply", tricky, "Third reply\n\nwith a blank line"]):
+        f.write(f"\n{TEXT_RULE}\nTIMESTAMP: 2025-03-0{i + 1} 10:00:00\nTO: old{i}@example.com\n"
+                f"SUBJECT: Customer Support Response\n{TEXT_RULE}\n{body}\n{TEXT_RULE}\n\n")
+migrated_path = os.path.join(log_dir, "migrated.jsonl")
+assert migrate_text_log(text_path, migrated_path) == 3
+migrated = ResponseLog(migrated_path)
+assert [e['response'] for e in migrated.recent(3)][1:] == [tricky, "Third reply\n\nwith a blank line"]
+assert migrated.find(email="old1@example.com")[0]['timestamp'] == "2025-03-02 10:00:00.000"
+assert len(migrated.find(since=datetime(2025, 3, 2), until=datetime(2025, 3, 3))) == 1
+print("✓ Old text logs migrate with their timestamps, bodies intact")
+shutil.rmtree(log_dir)
+
+# Test 20: Response Log Segments
+print("\n[TEST 20] Response Log Segments")
+print("-"*80)
+
+import response_log
+from response_log import SegmentedResponseLog
+
+log_dir = tempfile.mkdtemp()
+log_path = os.path.join(log_dir, "response_log.jsonl")
+segmented = SegmentedResponseLog(log_path, segment_bytes=16 * 1024, compression='gzip')
+segmented.open()
+for i in range(600):
+    segmented.append([{'to': f"user{i % 9}@example.com", 'subject': "s", 'response': f"Reply {i} " + "x" * 100}])
+    if i == 299:
+        middle = time.time()
+        time.sleep(0.01)
+segmented.close()
+stats = segmented.stats()
+assert stats['rollovers'] >= 4 and stats['compressed'] == stats['rollovers']
+assert stats['stored_bytes'] * 5 < stats['sealed_bytes']
+assert not [name for name in os.listdir(log_dir) if name.endswith(".jsonl") and name != "response_log.jsonl"]
+assert len(segmented) == 600
+user4 = [e['response'].split()[1] for e in segmented.find(email="user4@example.com")]
+assert user4 == [str(i) for i in range(4, 600, 9)]
+assert [e['response'].split()[1] for e in segmented.find(since=middle, limit=2)] == ["598", "599"]
+assert len(segmented.find(until=middle)) == 300
+print(f"✓ {stats['segments']} segments, sealed ones gzipped {stats['sealed_bytes'] / stats['stored_bytes']:.0f}x; "
+      f"lookups span them")
+
+opened = []
+real_recent = response_log.ResponseLog.recent
+response_log.ResponseLog.recent = lambda self, count=5: opened.append(self.path) or real_recent(self, count)
+assert [e['response'].split()[1] for e in segmented.recent(3)] == ["597", "598", "599"]
+response_log.ResponseLog.recent = real_recent
+assert opened == [log_path]
+print("✓ Recent responses come from the active segment alone")
+
+# A new day seals the active segment; a lost manifest is rebuilt from the files
+segmented.open()
+rollovers = segmented.rollovers
+segmented._active_first -= 86400
+segmented.append([{'to': "late@example.com", 'subject': "s", 'response': "Next day"}])
+segmented.close()
+assert segmented.rollovers == rollovers + 1
+os.remove(segmented.manifest_path)
+with contextlib.redirect_stdout(io.StringIO()):
+    segmented.open()
+    segmented.close()
+assert len(segmented) == 601 and segmented.recent(2)[0]['response'].startswith("Reply 599")
+print("✓ Day rollover seals the segment; segments missing from the manifest are adopted on open")
+
+retained = SegmentedResponseLog(os.path.join(log_dir, "retained.jsonl"), segment_bytes=16 * 1024,
+                                compression=None, retain_bytes=48 * 1024)
+retained.open()
+for i in range(600):
+    retained.append([{'to': "a@example.com", 'subject': "s", 'response': "x" * 100}])
+retained.close()
+stats = retained.stats()
+assert stats['expired'] > 0 and stats['sealed_bytes'] <= 48 * 1024
+print(f"✓ Retention dropped {stats['expired']} oldest segments, keeping {stats['sealed_bytes']:,} bytes sealed")
+
+# Many segments sealed within one second, while expiry deletes older ones in the background
+churn = SegmentedResponseLog(os.path.join(log_dir, "churn.jsonl"), segment_bytes=2 * 1024,
+                             compression=None, retain_bytes=8 * 1024)
+output = io.StringIO()
+with contextlib.redirect_stdout(output):
+    churn.open()
+    start = time.time()
+    for i in range(1000):
+        churn.append([{'to': "a@example.com", 'subject': "s", 'response': f"Reply {i} " + "x" * 100}])
+    elapsed = time.time() - start
+    churn.close()
+names = [segment['name'] for segment in churn._load_manifest()]
+assert "✗" not in output.getvalue() and len(set(names)) == len(names)
+assert all(os.path.exists(os.path.join(log_dir, name)) for name in names)
+assert churn.recent(1)[0]['response'].startswith("Reply 999")
+print(f"✓ {churn.rollovers} segments sealed in {elapsed:.2f} s get unique names; expiry never touches a live one")
+shutil.rmtree(log_dir)
+
+# Test 21: Tail Reader
+print("\n[TEST 21] Tail Reader")
+print("-"*80)
+
+from response_log import tail_lines
+
+log_dir = tempfile.mkdtemp()
+log_path = os.path.join(log_dir, "tail.jsonl")
+with open(log_path, 'wb') as f:
+    for i in range(2000):
+        f.write(b'{"to": "user%d@example.com", "response": "Reply %d %s"}\n' % (i % 7, i, b"x" * (i % 300)))
+    f.write(b'{"to": "torn@exam')
+assert [json.loads(line)['response'].split()[1] for line in tail_lines(log_path, 3, block_size=256)] == ["1997", "1998", "1999"]
+assert len(tail_lines(log_path, 5000, block_size=256)) == 2000
+assert tail_lines(log_path, 0) == []
+
+# Without an index, recent() reads back from the end instead of scanning the file
+log = ResponseLog(log_path)
+assert not os.path.exists(log.index_path)
+assert [e['response'].split()[1] for e in log.recent(2)] == ["1998", "1999"]
+
+big_path = os.path.join(log_dir, "big.jsonl")
+with open(big_path, 'wb') as f:
+    f.write(b'{"to": "a@example.com", "response": "old"}\n' * 200_000)
+    f.write(b'{"to": "b@example.com", "response": "new"}\n')
+tracemalloc.start()
+last = tail_lines(big_path, 1)
+peak = tracemalloc.get_traced_memory()[1]
+tracemalloc.stop()
+assert json.loads(last[0])['response'] == "new" and peak < 1024 * 1024
+print(f"✓ Last lines of a {os.path.getsize(big_path) / 1e6:.1f} MB log read with a {peak / 1024:.0f} KiB peak; "
+      "torn tail left out")
+shutil.rmtree(log_dir)
+
+# Test 22: SMTP Delivery
+print("\n[TEST 22] SMTP Delivery")
+print("-"*80)
+
+import email
+import email.policy
+from delivery import LocalSMTPServer, SMTPDelivery
+
+log_dir = tempfile.mkdtemp()
+with LocalSMTPServer() as server:
+    smtp = SMTPDelivery(server.hostname, server.port, pool_size=2, base_delay=0.01)
+    sender = EmailResponseTool(os.path.join(log_dir, "response_log.jsonl"), delivery=smtp)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(30):
+            sender.send(f"user{i}@example.com", f"Reply {i}\n.\nGrüße")
+        assert sender.flush()
+    received = sorted(server.messages, key=lambda m: int(m['rcpt_tos'][0][4:].split('@')[0]))
+    assert [m['rcpt_tos'] for m in received] == [[f"user{i}@example.com"] for i in range(30)]
+    body = email.message_from_bytes(received[7]['data'], policy=email.policy.default).get_content()
+    assert body.replace("\r\n", "\n") == "Reply 7\n.\nGrüße\n"
+    assert smtp.connections <= 2 and smtp.pipelined == 30 and len(sender.get_recent_responses(30)) == 30
+    print(f"✓ 30 responses logged and delivered over {smtp.connections} pooled, pipelined connections")
+
+    # 4xx replies and a dropped connection are retried; a 5xx reply is not
+    server.fail_next(2)
+    server.disconnect_next(1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sender.send("retry@example.com", "Second try")
+        sender.flush()
+        server.fail_next(1, "550 5.1.1 No such user")
+        sender.send("gone@example.com", "Bounced")
+        sender.flush()
+    stats = sender.stats()['delivery']
+    assert stats['sent'] == 31 and stats['retries'] == 3 and stats['failed'] == 1
+    assert server.messages[-1]['rcpt_tos'] == ["retry@example.com"]
+    print(f"✓ Transient failures retried ({stats['retries']} retries), permanent ones given up on")
+    failure = stats['recent_failures'][-1]
+    assert sender.stats()['delivery_failed'] == 1 and failure['to'] == "gone@example.com" and "550" in failure['error']
+    print("✓ A response queued but never delivered is reported in the log stats")
+    sender.close()
+    assert smtp.stats()['idle'] == 0
+
+with LocalSMTPServer(pipelining=False) as server:
+    smtp = SMTPDelivery(server.hostname, server.port)
+    sender = EmailResponseTool(os.path.join(log_dir, "direct.jsonl"), buffered=False, delivery=smtp)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert sender.send("a@example.com", "One") and sender.send("b@example.com", "Two")
+    sender.close()
+    assert len(server.messages) == 2 and smtp.connections == 1 and smtp.pipelined == 0
+    print("✓ Unbuffered sends deliver before returning and fall back to one command per round trip")
+assert EmailResponseTool(os.path.join(log_dir, "file.jsonl")).delivery is None
+print("✓ File logging is the default backend")
+shutil.rmtree(log_dir)
+
 # Summary
 print("\n" + "="*80)
 print("BASIC TESTS COMPLETE")
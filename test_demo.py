@@ -153,4 +153,4 @@ TO START REST API SERVER:
 PROJECT STATUS: ✓ READY FOR DEPLOYMENT
 """)
 
-print(f"Check 'response_log.txt' for all mock responses sent.\n")
+print(f"Check 'response_log.jsonl' for all mock responses sent.\n")
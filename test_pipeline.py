@@ -0,0 +1,700 @@
+"""
+Pipeline tests for the Customer Support AI Agent System.
+
+Runs the full agent pipeline against a local fake model (fake_model.py),
+so no API key or network access is needed.
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+os.environ.setdefault("FAQ_WATCH_INTERVAL", "0")
+# Every model call should reach the fake model unless a test installs a cache
+os.environ["LLM_CACHE"] = "off"
+os.environ["ANSWER_CACHE"] = "off"
+os.environ["LOCAL_CLASSIFIER_THRESHOLD"] = "off"
+os.environ["RESEARCH_LOCAL_SUMMARY_THRESHOLD"] = "off"
+os.environ["PARALLEL_STAGES"] = "off"
+os.environ["MERGED_CATEGORIES"] = "off"
+
+import tools
+from agent import CATEGORY_HINTS, CustomerSupportOrchestrator
+from cache import LRUCache, SemanticAnswerCache, SQLiteCache
+from faq_index import CategoryClassifier
+from fake_model import FakeModel, install
+from tools import EmailResponseTool
+
+print("="*80)
+print("CUSTOMER SUPPORT AI AGENT - PIPELINE TESTS")
+print("="*80)
+
+# Keep test responses out of the real response log
+log_dir = tempfile.mkdtemp()
+tools._email_sender = EmailResponseTool(os.path.join(log_dir, "response_log.jsonl"))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    orchestrator = CustomerSupportOrchestrator()
+
+scenarios = [
+    ("I forgot my password and can't log in", "john.doe@example.com", "account"),
+    ("Where can I find my invoices?", "billing.user@example.com", "billing"),
+    ("The app is running very slowly", "tech.user@example.com", "technical"),
+    ("What are your business hours?", "visitor@example.com", "general"),
+]
+
+
+def quietly(fn, *args):
+    # The pipeline narrates every step; keep the test output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args)
+
+
+# Test 1: Async Pipeline Parity
+print("\n[TEST 1] Async Pipeline Parity")
+print("-"*80)
+
+model = install(orchestrator, FakeModel(latency=0))
+for question, email, expected_category in scenarios:
+    sync_result = quietly(orchestrator.process_inquiry, question, email)
+    async_result = quietly(asyncio.run, orchestrator.process_inquiry_async(question, email))
+    assert (sync_result.category, sync_result.final_response, sync_result.validation_status) == \
+        (async_result.category, async_result.final_response, async_result.validation_status)
+    assert async_result.category == expected_category, (question, async_result.category)
+    print(f"✓ '{question}' → {async_result.category}, {async_result.validation_status} (sync == async)")
+print(f"✓ {model.calls // (2 * len(scenarios))} model calls per inquiry")
+
+# Test 2: Concurrency Scaling
+print("\n[TEST 2] Concurrency Scaling")
+print("-"*80)
+
+LATENCY = 0.05
+N_INQUIRIES = 32
+model = install(orchestrator, FakeModel(latency=LATENCY))
+# Distinct questions, so identical-inquiry coalescing doesn't kick in
+inquiries = [(f"{scenarios[i % len(scenarios)][0]} (ticket {i})", scenarios[i % len(scenarios)][1])
+             for i in range(N_INQUIRIES)]
+
+
+async def run_all(concurrency):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(question, email):
+        async with limit:
+            return await orchestrator.process_inquiry_async(question, email)
+
+    return await asyncio.gather(*(one(q, e) for q, e in inquiries))
+
+
+timings = {}
+for concurrency in (1, 8, 32):
+    start = time.perf_counter()
+    results = quietly(asyncio.run, run_all(concurrency))
+    timings[concurrency] = time.perf_counter() - start
+    assert all(r.validation_status == "approved" for r in results)
+    print(f"✓ concurrency {concurrency:>2}: {N_INQUIRIES} inquiries in {timings[concurrency]:.2f} s "
+          f"({N_INQUIRIES / timings[concurrency]:.1f}/s, {timings[1] / timings[concurrency]:.1f}x)")
+assert timings[32] < timings[1] / 8, "Concurrent inquiries are not overlapping"
+print(f"✓ Peak concurrent model calls: {model.max_in_flight}")
+
+# Test 3: API Endpoint Concurrency
+print("\n[TEST 3] API Endpoint Concurrency")
+print("-"*80)
+
+try:
+    import httpx
+    import api_server
+
+    async def post_inquiries(n):
+        api_server.orchestrator = orchestrator
+        transport = httpx.ASGITransport(app=api_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(
+                client.post("/api/support/inquiry", json={"question": q, "email": e})
+                for q, e in inquiries[:n]
+            ))
+            return responses, time.perf_counter() - start
+
+    single = quietly(asyncio.run, post_inquiries(1))[1]
+    responses, elapsed = quietly(asyncio.run, post_inquiries(16))
+    assert all(r.status_code == 200 and r.json()['success'] for r in responses)
+    print(f"✓ 16 concurrent POST /api/support/inquiry in {elapsed:.2f} s (one alone: {single:.2f} s)")
+    assert elapsed < single * 3, "The inquiry endpoint blocks the event loop"
+except ImportError as e:
+    print(f"⚠ Skipped: {e}")
+
+# Test 4: LLM Response Cache
+print("\n[TEST 4] LLM Response Cache")
+print("-"*80)
+
+stages = (orchestrator.classifier, orchestrator.researcher, orchestrator.writer, orchestrator.validator)
+model = install(orchestrator, FakeModel(latency=0))
+memory_cache = LRUCache(max_entries=64)
+for stage in stages:
+    stage.agent.cache = memory_cache
+
+question, email, _ = scenarios[0]
+first = quietly(orchestrator.process_inquiry, question, email)
+calls_after_first = model.calls
+second = quietly(asyncio.run, orchestrator.process_inquiry_async(question, email))
+assert model.calls == calls_after_first and second.final_response == first.final_response
+print(f"✓ Repeat inquiry served from cache: {calls_after_first} model calls, then 0 "
+      f"({memory_cache.hits} hits, {memory_cache.misses} misses)")
+
+orchestrator.writer.agent.temperature = 0.9
+quietly(orchestrator.process_inquiry, question, email)
+assert model.calls == calls_after_first + 1, "Temperature is not part of the cache key"
+orchestrator.writer.agent.temperature = orchestrator.classifier.agent.temperature
+print("✓ A different temperature misses the cache")
+
+small = LRUCache(max_entries=2, ttl=0.05)
+for key in "abc":
+    small.set(key, key * 10)
+assert small.get("a") is None and small.get("c") == "c" * 10 and small.evictions == 1
+time.sleep(0.06)
+assert small.get("c") is None
+print(f"✓ LRU eviction and TTL expiry: {small.stats()}")
+
+sqlite_path = os.path.join(log_dir, "llm_cache.sqlite3")
+for stage in stages:
+    stage.agent.cache = SQLiteCache(sqlite_path)
+quietly(orchestrator.process_inquiry, scenarios[1][0], scenarios[1][1])
+calls_before_restart = model.calls
+for stage in stages:
+    # A fresh connection stands in for a restarted process
+    stage.agent.cache = SQLiteCache(sqlite_path)
+quietly(orchestrator.process_inquiry, scenarios[1][0], scenarios[1][1])
+assert model.calls == calls_before_restart, "SQLite cache did not survive a restart"
+print(f"✓ SQLite cache survives a restart ({len(stages[0].agent.cache)} entries on disk)")
+
+try:
+    from fastapi.testclient import TestClient
+    import api_server
+    import cache
+
+    cache._response_cache, cache._configured = memory_cache, True
+    stats = TestClient(api_server.app).get("/api/support/stats").json()['llm_cache']
+    assert stats['hits'] == memory_cache.hits and stats['backend'] == 'memory'
+    print(f"✓ /api/support/stats reports the cache: {stats}")
+except ImportError as e:
+    print(f"⚠ Skipped: {e}")
+
+for stage in stages:
+    stage.agent.cache = None
+
+# Test 5: Semantic Answer Cache
+print("\n[TEST 5] Semantic Answer Cache")
+print("-"*80)
+
+try:
+    shared_search = tools.get_faq_search()
+    tools._faq_search = cold_search = tools.FAQSearchTool(shared_search.faq_file)
+    cold = SemanticAnswerCache()
+    cold.store("reset password", "account", (0, 0), "text", {}, 100.0)
+    assert cold.lookup("reset password", "account", (0, 0)) is None and len(cold) == 0
+    cold_search._fitting.join()
+    cold.store("reset password", "account", (0, 0), "text", {}, 100.0)
+    assert cold.lookup("reset password", "account", (0, 0)) is not None
+    assert not cold_search._index.has_embeddings()
+    tools._faq_search = shared_search
+    print("✓ The FAQ embedder is fitted in the background, without building the FAQ vectors")
+
+    orchestrator.answer_cache = answers = SemanticAnswerCache()
+    tools.get_faq_search().embedder()
+    model = install(orchestrator, FakeModel(latency=0.01))
+
+    first = quietly(orchestrator.process_inquiry, "I forgot my password and can't log in", "a@example.com")
+    calls = model.calls
+    similar = quietly(asyncio.run, orchestrator.process_inquiry_async(
+        "forgot my password, cannot log in", "b@example.com"))
+    assert model.calls == calls + 1 and similar.final_response == first.final_response
+    assert similar.faq_results is first.faq_results and similar.validation_status == "approved"
+    print(f"✓ Near-duplicate question reused the validated answer (1 model call instead of {calls})")
+
+    quietly(orchestrator.process_inquiry, "How do I change my email address?", "c@example.com")
+    assert answers.misses == 2 and answers.stores == 2
+    print("✓ A different question in the same category misses")
+
+    key = "answer_cache_probe"
+    tools.get_faq_search().upsert_faq('account', key, 'How do I rename my profile?', 'Open Profile > Edit.')
+    quietly(orchestrator.process_inquiry, "forgot my password, cannot log in", "d@example.com")
+    tools.get_faq_search().delete_faq('account', key)
+    assert answers.invalidations == 2 and answers.hits == 1
+    print("✓ Editing the category's FAQs invalidates its cached answers")
+
+    orchestrator.validator.agent.model = type(model)(latency=0)
+    orchestrator.validator.agent.model.reply = lambda prompt: "STATUS: NEEDS_REVISION"
+    quietly(orchestrator.process_inquiry, "Where can I find my invoices?", "e@example.com")
+    assert answers.stores == 3, "A response approved only after max attempts was cached"
+    print("✓ Responses approved only after max attempts are not cached")
+
+    labelled = SemanticAnswerCache()
+    for cached, asked, same in [
+        ("How do I export my invoices?", "Exporting invoices", True),
+        ("Is my account locked?", "My account seems to be locked", True),
+        ("The website won't open", "the website is not opening for me", True),
+        ("How do I delete my account?", "I want to delete my account", True),
+        ("How do I cancel my subscription?", "How do I upgrade my subscription?", False),
+        ("Why was I charged twice?", "Why was I charged?", False),
+        ("How do I reset my password?", "How do I reset my email?", False),
+        ("I can log in", "I can't log in", False),
+    ]:
+        labelled.clear()
+        labelled.store(cached, "account", (0, 0), "text", {}, 100.0)
+        found = labelled.lookup(asked, "account", (0, 0))
+        assert (found is not None) == same, \
+            f"'{asked}' {'missed' if same else 'reused the answer to'} '{cached}'"
+    assert labelled.embedder is tools.get_faq_search().embedder()
+    print("✓ Paraphrases hit; questions with a different intent miss, using the FAQ-fitted embedder")
+
+    expiring = SemanticAnswerCache(ttl=0.01)
+    expiring.store("reset password", "account", (0, 0), "text", {}, 100.0)
+    time.sleep(0.02)
+    assert expiring.lookup("reset password", "account", (0, 0)) is None and expiring.expirations == 1
+    print("✓ Entries expire after their TTL")
+    print(f"✓ Stats: {answers.stats()}")
+    assert answers.stats()['latency_saved_ms'] > 0
+    orchestrator.answer_cache = None
+except ImportError as e:
+    print(f"⚠ Skipped: {e}")
+
+# Test 6: Coalescing Identical Inquiries
+print("\n[TEST 6] Coalescing Identical Inquiries")
+print("-"*80)
+
+import threading
+import agent
+
+sent_to = []
+real_send_response = agent.send_response
+
+
+def counting_send_response(email, response):
+    sent_to.append(email)
+    return real_send_response(email, response)
+
+
+agent.send_response = counting_send_response
+try:
+    model = install(orchestrator, FakeModel(latency=0.1))
+    N_IDENTICAL = 16
+    burst = [("The app won't load!" if i % 2 else "the app WON'T load", f"user{i}@example.com")
+             for i in range(N_IDENTICAL)]
+
+    async def post_burst():
+        api_server.orchestrator = orchestrator
+        transport = httpx.ASGITransport(app=api_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post("/api/support/inquiry", json={"question": q, "email": e}) for q, e in burst
+            ))
+
+    responses = quietly(asyncio.run, post_burst())
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.json()['response'] for r in responses}) == 1
+    assert model.calls == 4, f"{model.calls} model calls for one shared pipeline"
+    assert sorted(sent_to) == sorted(e for _, e in burst)
+    print(f"✓ {N_IDENTICAL} concurrent identical API requests ran 1 pipeline "
+          f"({model.calls} model calls) and sent {len(sent_to)} responses")
+
+    sent_to.clear()
+    model = install(orchestrator, FakeModel(latency=0.1))
+    threads = [threading.Thread(target=orchestrator.process_inquiry, args=(q, e)) for q, e in burst[:8]]
+    # redirect_stdout is process-wide, so wrap all threads at once
+    with contextlib.redirect_stdout(io.StringIO()):
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+    assert model.calls == 4 and len(sent_to) == 8
+    print(f"✓ 8 threads with the same question ran 1 pipeline and sent 8 responses")
+
+    quietly(orchestrator.process_inquiry, burst[0][0], burst[0][1])
+    assert model.calls == 8, "A finished inquiry was reused as if still in flight"
+    stats = TestClient(api_server.app).get("/api/support/stats").json()
+    assert stats['coalesced_inquiries'] == orchestrator.coalesced == (N_IDENTICAL - 1) + 7
+    print(f"✓ Sequential repeats run again; {stats['coalesced_inquiries']} inquiries coalesced in total")
+except NameError as e:
+    print(f"⚠ Skipped: {e}")
+finally:
+    agent.send_response = real_send_response
+
+# Test 7: Local Fast-Path Classifier
+print("\n[TEST 7] Local Fast-Path Classifier")
+print("-"*80)
+
+classifier = orchestrator.classifier
+model = install(orchestrator, FakeModel(latency=0))
+classifier.local_threshold = 0.6
+llm_before, local_before = classifier.llm_decisions, classifier.local_decisions
+assert classifier.classify("reset password") == "account" and model.calls == 0
+assert classifier.classify("The app won't open") == "technical" and model.calls == 0
+print(f"✓ Obvious inquiries classified locally (0 model calls)")
+
+label, confidence = classifier.classify_locally("can I talk to a human")
+assert confidence < classifier.local_threshold
+classifier.classify("can I talk to a human")
+assert model.calls == 1 and classifier.llm_decisions - llm_before == 1
+assert classifier.local_decisions - local_before == 2
+print(f"✓ Low-confidence inquiry ({label}, {confidence:.2f}) falls back to the model")
+
+key = "classifier_probe"
+faq_search = tools.get_faq_search()
+local_model = faq_search.category_classifier()
+faq_search.upsert_faq('general', key, 'Can I talk to a human agent?', 'Yes, call our human agents.')
+assert classifier.classify_locally("can I talk to a human")[0] == 'general'
+faq_search.upsert_faq('general', key, 'Can I talk to a person?', 'Yes, our agents answer by phone.')
+retrained = CategoryClassifier(faq_search._index.live_entries(), CATEGORY_HINTS)
+for probe in ("can I talk to a human", "reset password", "refund my invoice", "talk to a person"):
+    updated, fresh = classifier.classify_locally(probe), retrained.predict(probe)
+    assert updated[0] == fresh[0] and abs(updated[1] - fresh[1]) < 1e-9, (probe, updated, fresh)
+faq_search.delete_faq('general', key)
+assert faq_search.category_classifier() is local_model
+assert classifier.classify_locally("reset password") == CategoryClassifier(
+    faq_search._index.live_entries(), CATEGORY_HINTS).predict("reset password")
+print("✓ FAQ edits update the local model in place and match a full retrain")
+classifier.local_threshold = None
+
+# Test 8: Local Research Summaries
+print("\n[TEST 8] Local Research Summaries")
+print("-"*80)
+
+researcher = orchestrator.researcher
+model = install(orchestrator, FakeModel(latency=0))
+researcher.summary_threshold = 6.0
+confident = researcher.research("How do I reset my password?", "account")
+assert model.calls == 0 and confident['summary'].startswith("Best match: How do I reset my password?")
+print(f"✓ Confident search summarized locally (top score {confident['raw_results'][0]['score']})")
+
+weak = researcher.research("my login isn't working", "account")
+assert model.calls == 1 and weak['raw_results'][0]['score'] < researcher.summary_threshold
+print(f"✓ Weak search (top score {weak['raw_results'][0]['score']}) still asks the model")
+
+def fail(prompt, generation_config=None):
+    raise RuntimeError("model unavailable")
+
+orchestrator.researcher.agent.model = FakeModel(latency=0)
+orchestrator.researcher.agent.model.generate_content = fail
+fallback = quietly(researcher.research, "my login isn't working", "account")
+assert fallback['found_answers'] and fallback['summary'].startswith("Best match:")
+print("✓ A failed model call falls back to the local summary of the search results")
+
+model = install(orchestrator, FakeModel(latency=0.02))
+timed = quietly(orchestrator.process_inquiry, "How do I reset my password? (timed)", "t@example.com")
+assert set(timed.stage_timings) == {'classify', 'research', 'write', 'validate', 'send'}
+assert timed.stage_timings['research'] < 20 <= timed.stage_timings['write']
+print(f"✓ Per-stage timings (ms): {timed.stage_timings}")
+researcher.summary_threshold = None
+
+# Test 9: Revise and Re-validate
+print("\n[TEST 9] Revise and Re-validate")
+print("-"*80)
+
+
+class StrictModel(FakeModel):
+    """Rejects drafts until they give exact steps; optionally never changes a draft."""
+
+    def __init__(self, revise=True):
+        super().__init__(latency=0)
+        self.revise = revise
+
+    def reply(self, prompt):
+        if prompt.startswith("Validate this customer support response"):
+            draft = prompt.split("DRAFT RESPONSE:", 1)[1]
+            if "exact steps" not in draft:
+                return "STATUS: NEEDS_REVISION\nISSUES: No steps given\nSUGGESTIONS: List the exact steps"
+        if prompt.startswith("Revise this customer support response") and not self.revise:
+            assert "ISSUES: No steps given" in prompt and "STATUS" not in prompt
+            return prompt.split("CURRENT DRAFT:\n", 1)[1].split("\n\nREVIEWER FEEDBACK:", 1)[0]
+        return super().reply(prompt)
+
+
+question = "I forgot my password and can't log in"
+revisions = orchestrator.revisions
+model = install(orchestrator, StrictModel())
+revised = quietly(orchestrator.process_inquiry, question, "r@example.com")
+assert "exact steps" in revised.final_response and revised.validation_status == "approved"
+assert model.calls == 6 and orchestrator.revisions == revisions + 1
+model = install(orchestrator, StrictModel())
+revised_async = quietly(asyncio.run, orchestrator.process_inquiry_async(question, "r@example.com"))
+assert revised_async.final_response == revised.final_response and model.calls == 6
+print("✓ Rejected draft is rewritten from the feedback and re-validated (6 model calls, sync and async)")
+
+saved = orchestrator.validation_calls_saved
+model = install(orchestrator, StrictModel(revise=False))
+unchanged = quietly(orchestrator.process_inquiry, question, "u@example.com")
+assert model.calls == 5 and orchestrator.validation_calls_saved == saved + 3
+print("✓ An unchanged revision is not re-validated (3 calls saved)")
+
+budget, orchestrator.validation_budget = orchestrator.validation_budget, 1
+model = install(orchestrator, StrictModel())
+capped = quietly(orchestrator.process_inquiry, question, "b@example.com")
+assert model.calls == 4 and orchestrator.validation_calls_saved == saved + 7
+orchestrator.validation_budget = budget
+print("✓ Validation budget of 1 call stops after the first verdict (4 more calls saved)")
+
+# Test 10: Parallel Stages
+print("\n[TEST 10] Parallel Stages")
+print("-"*80)
+
+from scheduler import Stage, run_stages, run_stages_async
+
+
+def nap(seconds, value):
+    return lambda done: (time.sleep(seconds), value)[1]
+
+
+async def nap_async(seconds, value):
+    await asyncio.sleep(seconds)
+    return value
+
+graph = [
+    Stage('slow', nap(0.05, 1)),
+    Stage('fast', nap(0.01, 2)),
+    Stage('join', lambda done: done['slow'] + done['fast'], ('slow', 'fast')),
+]
+start = time.perf_counter()
+run = run_stages(graph)
+elapsed = time.perf_counter() - start
+assert run.results['join'] == 3 and elapsed < 0.058 and run.critical_path() == ['slow', 'join']
+async_graph = [
+    Stage('slow', lambda done: nap_async(0.05, 1)),
+    Stage('fast', lambda done: nap_async(0.01, 2)),
+    Stage('join', lambda done: nap_async(0, done['slow'] + done['fast']), ('slow', 'fast')),
+]
+run = asyncio.run(run_stages_async(async_graph))
+assert run.results['join'] == 3 and run.critical_path() == ['slow', 'join']
+print(f"✓ Independent stages overlap ({elapsed * 1000:.0f} ms for 50 + 10 ms); critical path slow → join")
+
+question = "I forgot my password and can't log in"
+model = install(orchestrator, FakeModel(latency=0.05))
+start = time.perf_counter()
+sequential = quietly(orchestrator.process_inquiry, question, "s@example.com")
+sequential_ms = (time.perf_counter() - start) * 1000
+orchestrator.parallel_stages = True
+used = orchestrator.speculations_used
+start = time.perf_counter()
+parallel = quietly(orchestrator.process_inquiry, question, "p@example.com")
+parallel_ms = (time.perf_counter() - start) * 1000
+assert parallel.final_response == sequential.final_response and model.calls == 8
+assert orchestrator.speculations_used == used + 1
+assert sequential.critical_path == ['classify', 'research', 'write', 'validate']
+assert parallel.critical_path[-3:] == ['research', 'write', 'validate'] and 'retrieve' in parallel.stage_timings
+parallel_async = quietly(asyncio.run, orchestrator.process_inquiry_async(question, "p@example.com"))
+assert parallel_async.final_response == parallel.final_response and orchestrator.speculations_used == used + 2
+print(f"✓ The FAQ search runs beside classification: {sequential_ms:.0f} → {parallel_ms:.0f} ms, same model calls")
+print(f"  Critical path: {' → '.join(parallel.critical_path)}")
+
+wasted = orchestrator.speculations_wasted
+model = install(orchestrator, FakeModel(latency=0))
+mismatch = quietly(orchestrator.process_inquiry, "The app crashes when I open my invoice", "m@example.com")
+assert mismatch.category == "billing" and model.calls == 4
+assert orchestrator.speculations_wasted == wasted
+assert mismatch.faq_results['raw_results'] == tools.search_faq("The app crashes when I open my invoice", "billing")
+print("✓ The early search serves whichever category the model picks, with no extra model call")
+
+from agent import SPECULATIVE_TOP_K
+for query in ["I forgot my password and can't log in", "The app crashes when I open my invoice",
+              "how do I contact you", "refund", "account"]:
+    early = tools.get_faq_search().search(query, None, top_k=SPECULATIVE_TOP_K)
+    for category in tools.get_faq_search().faqs:
+        probe = agent.CustomerInquiry(query, "x@example.com", category=category)
+        assert orchestrator._use_speculation(probe, early, needed=True) == tools.search_faq(query, category)
+print("✓ Re-filtered early hits match a category-filtered search")
+orchestrator.parallel_stages = False
+
+# Test 11: Single-Call Mode
+print("\n[TEST 11] Single-Call Mode")
+print("-"*80)
+
+from agent import MergedAgent
+
+orchestrator.merged_categories = frozenset({'general'})
+model = install(orchestrator, FakeModel(latency=0))
+merged = quietly(orchestrator.process_inquiry, "What are your business hours?", "h@example.com")
+assert model.calls == 1 and merged.category == "general" and merged.validation_status == "approved"
+assert merged.critical_path == ['merged'] and merged.faq_results['found_answers']
+merged_async = quietly(asyncio.run, orchestrator.process_inquiry_async("What are your business hours?", "h@example.com"))
+assert model.calls == 2 and merged_async.final_response == merged.final_response
+print("✓ General inquiry answered by one structured-output call (sync and async)")
+
+model = install(orchestrator, FakeModel(latency=0))
+other = quietly(orchestrator.process_inquiry, "I forgot my password and can't log in", "o@example.com")
+assert other.category == "account" and model.calls == 4 and 'merged' not in other.stage_timings
+print("✓ Other categories keep the four-agent pipeline")
+
+model = install(orchestrator, FakeModel(latency=0))
+handed_over = quietly(orchestrator.process_inquiry, "How do I contact customer support about my profile?", "a@example.com")
+assert handed_over.category == "account" and model.calls == 4 and 'classify' not in handed_over.stage_timings
+print("✓ A non-merged category from the model runs the full pipeline without classifying again (4 calls)")
+
+model = install(orchestrator, FakeModel(latency=0))
+orchestrator.answer_cache = unsure_cache = SemanticAnswerCache()
+unsure_question = "How do I contact support about my account?"
+unsure_cache.store(unsure_question, "general", tools.get_faq_search().faq_version("general"),
+                   "A general answer", {}, 100.0)
+category, confidence = orchestrator.classifier.classify_locally(unsure_question)
+assert category == "general" and confidence < orchestrator.merged_threshold
+unsure = quietly(orchestrator.process_inquiry, unsure_question, "u@example.com")
+assert 'merged' not in unsure.stage_timings and unsure.category == "account"
+assert unsure.final_response != "A general answer" and unsure_cache.hits == 0
+orchestrator.answer_cache = None
+print(f"✓ A local label below the threshold ({confidence:.2f}) neither routes to one call nor reuses its cached answer")
+
+
+class SelfDoubtingModel(FakeModel):
+    def reply(self, prompt):
+        if prompt.startswith("Answer this customer inquiry in one step"):
+            return '```json\n{"category": "general", "response": "We open at 9.", "approved": false, "issues": "Too short"}\n```'
+        return super().reply(prompt)
+
+model = install(orchestrator, SelfDoubtingModel(latency=0))
+checked = quietly(orchestrator.process_inquiry, "What are your business hours?", "d@example.com")
+assert model.calls == 2 and checked.critical_path == ['merged', 'validate'] and checked.final_response == "We open at 9."
+print("✓ A failed self-check goes to the validator")
+
+fallbacks = orchestrator.merged_fallbacks
+model = install(orchestrator, FakeModel(latency=0))
+model.reply = lambda prompt: "not json" if prompt.startswith("Answer this") else FakeModel.reply(model, prompt)
+broken = quietly(orchestrator.process_inquiry, "What are your business hours?", "j@example.com")
+assert model.calls == 5 and broken.category == "general" and orchestrator.merged_fallbacks == fallbacks + 1
+try:
+    MergedAgent._parse('{"category": "sales", "response": "Hi"}')
+    assert False, "Unknown category accepted"
+except ValueError:
+    pass
+print("✓ Invalid JSON falls back to the four-agent pipeline")
+orchestrator.merged_categories = frozenset()
+
+# Test 12: Rate Limiter and Concurrency Governor
+print("\n[TEST 12] Rate Limiter and Concurrency Governor")
+print("-"*80)
+
+import threading
+from google.api_core.exceptions import ResourceExhausted
+from ratelimit import PRIORITY_HIGH, PRIORITY_LOW, ModelGovernor, governor_from_env
+
+governor = ModelGovernor(max_in_flight=2)
+model = FakeModel(latency=0.02)
+threads = [threading.Thread(target=governor.call, args=(lambda: model.generate_content("hi"),))
+           for _ in range(8)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+assert model.max_in_flight == 2 and governor.calls == 8 and governor.in_flight == 0
+print(f"✓ 8 threads, at most 2 model calls in flight ({governor.throttled} throttled)")
+
+governor = ModelGovernor(max_in_flight=1)
+governor.acquire()
+order = []
+waiters = []
+for name, priority in (("validator", PRIORITY_LOW), ("writer", PRIORITY_HIGH)):
+    waiters.append(threading.Thread(target=governor.call, args=(lambda name=name: order.append(name), priority)))
+    waiters[-1].start()
+    while governor.stats()['queue_depth'] < len(waiters):
+        time.sleep(0.001)
+assert governor.stats()['queued'] == {'low': 1, 'high': 1}
+governor.release()
+for t in waiters:
+    t.join()
+assert order == ["writer", "validator"]
+print("✓ Queued writer call gets capacity before the earlier validator call")
+
+# A queued caller is woken by the release, not by a polling interval
+governor = ModelGovernor(max_in_flight=1)
+governor.acquire()
+granted = []
+waiter = threading.Thread(target=lambda: (governor.acquire(), granted.append(time.perf_counter())))
+waiter.start()
+while governor.stats()['queue_depth'] < 1:
+    time.sleep(0.001)
+released = time.perf_counter()
+governor.release()
+waiter.join()
+assert (granted[0] - released) * 1000 < 10
+assert governor_from_env().max_in_flight is None
+print(f"✓ A release hands its slot on in {(granted[0] - released) * 1000:.2f} ms; no in-flight cap unless configured")
+
+governor = ModelGovernor(rate=50, burst=1)
+start = time.perf_counter()
+for _ in range(6):
+    governor.call(lambda: None)
+elapsed = time.perf_counter() - start
+assert elapsed >= 0.09 and governor.throttled >= 5
+print(f"✓ Token bucket at 50 calls/s: 6 calls took {elapsed * 1000:.0f} ms")
+
+attempts = []
+
+
+def flaky():
+    attempts.append(1)
+    if len(attempts) < 3:
+        raise ResourceExhausted("quota exceeded")
+    return "ok"
+
+governor = ModelGovernor(rate=100, base_delay=0.001)
+assert governor.call(flaky) == "ok" and governor.retries == 2 and governor.rate_limited == 2
+assert governor.current_rate < 100
+try:
+    governor.call(lambda: 1 / 0)
+    assert False, "Non-retryable error swallowed"
+except ZeroDivisionError:
+    assert governor.retries == 2 and governor.failures == 1
+print(f"✓ 429s retried with backoff (rate backed off to {governor.current_rate:g}/s); other errors raised at once")
+
+
+async def cancel_queued():
+    governor = ModelGovernor(max_in_flight=1)
+    await governor.acquire_async()
+    waiter = asyncio.ensure_future(governor.acquire_async())
+    await asyncio.sleep(0.01)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    governor.release()
+    await asyncio.wait_for(governor.acquire_async(), 1)
+    return governor.stats()
+
+stats = asyncio.run(cancel_queued())
+assert stats['in_flight'] == 1 and stats['queue_depth'] == 0
+print("✓ A cancelled waiter gives up its place without leaking capacity")
+
+governor = ModelGovernor(max_in_flight=4)
+for stage in (orchestrator.classifier, orchestrator.researcher, orchestrator.writer,
+              orchestrator.validator, orchestrator.merged):
+    stage.agent.governor = governor
+model = install(orchestrator, FakeModel(latency=0.02))
+results = quietly(asyncio.run, run_all(16))
+stats = governor.stats()
+assert all(r.validation_status == "approved" for r in results)
+assert model.max_in_flight == 4 and stats['calls'] == model.calls and stats['queue_depth'] == 0
+print(f"✓ Pipeline under a 4-call cap: peak {model.max_in_flight} in flight, "
+      f"{stats['throttled']} throttled {stats['throttled_by_priority']}")
+
+# Test 13: Recent Responses Endpoint
+print("\n[TEST 13] Recent Responses Endpoint")
+print("-"*80)
+
+try:
+    from fastapi.testclient import TestClient
+    import api_server
+
+    sent = {r.customer_email for r in results}
+    client = TestClient(api_server.app)
+    body = client.get("/api/support/responses/recent", params={"count": 3}).json()
+    assert body['count'] == 3 and body['responses'] == tools.get_email_sender().get_recent_responses(3)
+    assert all(r['to'] in sent for r in body['responses'])
+    assert client.get("/api/support/responses/recent", params={"count": 0}).status_code == 422
+    print(f"✓ GET /api/support/responses/recent returns the last {body['count']} responses sent")
+except ImportError as e:
+    print(f"⚠ Skipped: {e}")
+
+shutil.rmtree(log_dir)
+
+# Summary
+print("\n" + "="*80)
+print("PIPELINE TESTS COMPLETE")
+print("="*80)
@@ -1,20 +1,117 @@
 """Customer support tools - FAQ search and email responses."""
 
+import heapq
 import json
 import os
-from typing import List, Dict, Any
+import threading
+import time
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, List, Dict, Any, Iterator, Optional, Sequence
 from datetime import datetime
 
+from faq_index import (CategoryClassifier, FAQEntry, FAQIndex, ShardedFAQIndex, SnapshotFAQIndex, STOP_WORDS,
+                       analyze, numpy_available, snapshot_path)
+
+if TYPE_CHECKING:
+    from response_log import TimeLike
+
+
+SCORERS = ('heuristic', 'bm25', 'embedding')
+
+
+class FAQResult(Mapping):
+    """A search hit that reads like a ``{'category', 'question', 'answer', 'score'}``
+    dict but points at the indexed FAQ entry instead of copying its strings."""
+    
+    __slots__ = ('entry', 'score')
+    _FIELDS = ('category', 'question', 'answer', 'score')
+    
+    def __init__(self, entry: FAQEntry, score: float):
+        self.entry = entry
+        self.score = score
+    
+    def __getitem__(self, key: str) -> Any:
+        if key == 'score':
+            return self.score
+        if key in ('category', 'question', 'answer'):
+            return getattr(self.entry, key)
+        raise KeyError(key)
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._FIELDS)
+    
+    def __len__(self) -> int:
+        return len(self._FIELDS)
+    
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
 
 class FAQSearchTool:
-    def __init__(self, faq_file: str = "faqs.json"):
+    def __init__(self, faq_file: str = "faqs.json", snapshot_file: Optional[str] = None,
+                 sharded: bool = True):
         self.faq_file = faq_file
-        self.faqs = self._load_faqs()
+        self.snapshot_file = snapshot_file or snapshot_path(faq_file)
+        self.sharded = sharded
+        self._file_signature = self._stat_faq_file()
+        self._rejected_signature = None
+        self._index = self._open_snapshot() or self._new_index(self._load_faqs())
+        self._write_lock = threading.Lock()
+        # Bumped whenever a category's FAQs change, so derived caches can tell
+        self._reload_generation = 0
+        self._category_versions: Dict[str, int] = {}
+        self._edits = 0
+        # Local category classifier, trained on first use and kept in step with edits
+        self._classifier: Optional[CategoryClassifier] = None
+        # Edits since the FAQ file was last written or read
+        self.unsaved_edits = 0
+        self._watcher: Optional[threading.Thread] = None
+        self._fitting: Optional[threading.Thread] = None
+        self._fit_lock = threading.Lock()
+        self._stop_watching = threading.Event()
+    
+    @property
+    def faqs(self) -> Dict[str, Any]:
+        return self._index.faqs
+    
+    def faq_version(self, category: Optional[str] = None) -> tuple:
+        """Changes whenever the FAQs of ``category`` (or any, if None) do: edits or a reload."""
+        if category is None:
+            return (self._reload_generation, self._edits)
+        return (self._reload_generation, self._category_versions.get(category, 0))
+    
+    def embedder(self, fit: bool = True):
+        """The text embedder fitted on the current FAQ corpus.
+        
+        Fitting scans every FAQ. With ``fit=False`` an unfitted embedder is
+        fitted on a background thread instead and None is returned meanwhile.
+        """
+        index = self._index
+        if fit or index.embedder_fitted():
+            return index.embedder()
+        with self._fit_lock:
+            if self._fitting is None or not self._fitting.is_alive():
+                self._fitting = threading.Thread(target=index.embedder, daemon=True)
+                self._fitting.start()
+        return None
+    
+    def category_classifier(self, hints: Optional[Dict[str, str]] = None) -> CategoryClassifier:
+        """The naive Bayes category classifier over the current FAQs."""
+        classifier = self._classifier
+        if classifier is None:
+            with self._write_lock:
+                if self._classifier is None:
+                    self._classifier = CategoryClassifier(self._index.live_entries(), hints)
+                classifier = self._classifier
+        return classifier
+    
+    def _new_index(self, faqs: Dict[str, Any]):
+        # One shard per category, so category-filtered searches only scan their own
+        return ShardedFAQIndex(faqs) if self.sharded else FAQIndex(faqs)
     
     def _load_faqs(self) -> Dict[str, Any]:
         try:
-            with open(self.faq_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self._read_faqs()
         except FileNotFoundError:
             print(f"Warning: FAQ file '{self.faq_file}' not found. Using empty database.")
             return {}
@@ -22,47 +119,274 @@ class FAQSearchTool:
             print(f"Error: Failed to parse FAQ file: {e}")
             return {}
     
-    def search(self, query: str, category: str = None, top_k: int = 3) -> List[Dict[str, str]]:
-        query_lower = query.lower()
-        results = []
+    def _open_snapshot(self) -> Optional[SnapshotFAQIndex]:
+        # Compiled with: python faq_index.py faqs.json
+        if not os.path.exists(self.snapshot_file):
+            return None
+        try:
+            index = SnapshotFAQIndex(self.snapshot_file)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not open FAQ snapshot '{self.snapshot_file}': {e}. Loading JSON.")
+            return None
+        if self._file_signature is not None and index.source_signature != self._file_signature:
+            print(f"Warning: FAQ snapshot '{self.snapshot_file}' is out of date. Loading JSON.")
+            return None
+        return index
+    
+    def _read_faqs(self) -> Dict[str, Any]:
+        with open(self.faq_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _stat_faq_file(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.faq_file)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+    
+    def reload(self, force: bool = True) -> Dict[str, Any]:
+        """Rebuild the index from the FAQ file and swap it in atomically.
+        
+        Searches keep using the old index until the new one is complete. A
+        file that fails to parse raises and leaves the current index in place.
+        With ``force=False`` the rebuild only happens if the file changed.
+        """
+        with self._write_lock:
+            signature = self._stat_faq_file()
+            if not force and signature in (self._file_signature, self._rejected_signature):
+                return {'reloaded': False, 'entries': len(self._index), 'build_time_ms': 0}
+            
+            start = time.perf_counter()
+            try:
+                new_index = self._new_index(self._read_faqs())
+            except Exception:
+                # Don't retry the same broken file until it changes again
+                self._rejected_signature = signature
+                raise
+            if self._index.has_embeddings():
+                # Don't leave the first embedding search after a reload to pay for the build
+                new_index.build_embeddings()
+            elif self._index.embedder_fitted():
+                new_index.embedder()
+            classifier = self._classifier
+            if classifier is not None:
+                classifier = CategoryClassifier(new_index.live_entries(), classifier.hints)
+            build_time_ms = (time.perf_counter() - start) * 1000
+            
+            self._index = new_index
+            self._classifier = classifier
+            self._file_signature = signature
+            self._reload_generation += 1
+            self.unsaved_edits = 0
+        
+        print(f"✓ FAQ index reloaded: {len(new_index)} entries in {build_time_ms:.1f} ms")
+        return {'reloaded': True, 'entries': len(new_index), 'build_time_ms': round(build_time_ms, 2)}
+    
+    # Tombstones tolerated (as a fraction of live entries) before a compacting rebuild
+    MAX_DEAD_FRACTION = 0.25
+    
+    def upsert_faq(self, category: str, key: str, question: str, answer: str) -> Dict[str, Any]:
+        """Add or replace a single FAQ without rebuilding the index."""
+        with self._write_lock:
+            index = self._writable_index()
+            old_entry = index.get(category, key)
+            created = index.upsert(category, key, {'question': question, 'answer': answer})
+            self._update_classifier(old_entry, index.get(category, key))
+            self._bump_version(category)
+            self._compact_if_needed()
+        return {'created': created, 'entries': len(self._index)}
+    
+    def delete_faq(self, category: str, key: str) -> bool:
+        with self._write_lock:
+            index = self._writable_index()
+            old_entry = index.get(category, key)
+            deleted = index.delete(category, key)
+            if deleted:
+                self._update_classifier(old_entry, None)
+                self._bump_version(category)
+            self._compact_if_needed()
+        return deleted
+    
+    def _update_classifier(self, old_entry: Optional[FAQEntry], new_entry: Optional[FAQEntry]) -> None:
+        # Only the edited entry's terms change, so no retrain is needed
+        if self._classifier is not None:
+            if old_entry is not None:
+                self._classifier.remove(old_entry)
+            if new_entry is not None:
+                self._classifier.add(new_entry)
+    
+    def _bump_version(self, category: str) -> None:
+        self._category_versions[category] = self._category_versions.get(category, 0) + 1
+        self._edits += 1
+        self.unsaved_edits += 1
+    
+    def _writable_index(self):
+        # A memory-mapped snapshot is read-only: switch to an in-memory copy on first write
+        if self._index.read_only:
+            self._index = self._new_index(self._index.faqs)
+        return self._index
+    
+    def _compact_if_needed(self) -> None:
+        index = self._index
+        if index.dead_count > max(64, self.MAX_DEAD_FRACTION * len(index)):
+            compacted = index.compacted()
+            if index.has_embeddings():
+                compacted.build_embeddings()
+            elif index.embedder_fitted():
+                compacted.embedder()
+            self._index = compacted
+    
+    def save(self) -> int:
+        """Write the current FAQs back to the FAQ file atomically.
+        
+        Edits only change the index in memory; this rewrites the whole file,
+        so call it once per batch of edits. Returns the edits it wrote.
+        """
+        with self._write_lock:
+            tmp_file = f"{self.faq_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._index.faqs, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_file, self.faq_file)
+            # Our own write is not a change for the watcher to reload
+            self._file_signature = self._stat_faq_file()
+            saved, self.unsaved_edits = self.unsaved_edits, 0
+        return saved
+    
+    def start_watching(self, interval: float = 5.0) -> None:
+        """Poll the FAQ file's mtime in a background thread and reload on change."""
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,),
+                                         name="faq-watcher", daemon=True)
+        self._watcher.start()
+    
+    def stop_watching(self) -> None:
+        self._stop_watching.set()
+        if self._watcher:
+            self._watcher.join()
+            self._watcher = None
+    
+    def _watch(self, interval: float) -> None:
+        while not self._stop_watching.wait(interval):
+            try:
+                self.reload(force=False)
+            except Exception as e:
+                print(f"Error: FAQ reload failed, keeping current index: {e}")
+    
+    def search(self, query: str, category: str = None, top_k: int = 3,
+               scorer: str = 'heuristic') -> List[FAQResult]:
+        if scorer not in SCORERS:
+            raise ValueError(f"Unknown scorer '{scorer}'. Choose from: {', '.join(SCORERS)}")
+        return self._search_index(self._index, [query], [category or None], top_k, scorer)[0]
+    
+    def search_many(self, queries: Sequence[str], categories: Optional[Sequence[str]] = None,
+                    top_k: int = 3, scorer: str = 'heuristic') -> List[List[FAQResult]]:
+        """Search many queries in one pass; results are in input order."""
+        if scorer not in SCORERS:
+            raise ValueError(f"Unknown scorer '{scorer}'. Choose from: {', '.join(SCORERS)}")
+        if categories is None:
+            categories = [None] * len(queries)
+        elif len(categories) != len(queries):
+            raise ValueError("categories must be None or the same length as queries")
+        
+        # Repeated (query, category) pairs are only scored once
+        slots: Dict[tuple, int] = {}
+        positions = [slots.setdefault((q, c or None), len(slots)) for q, c in zip(queries, categories)]
+        unique_results = self._search_index(
+            self._index, [q for q, _ in slots], [c for _, c in slots], top_k, scorer)
+        
+        return [list(unique_results[pos]) for pos in positions]
+    
+    def _search_index(self, index, queries: List[str], categories: List[Optional[str]],
+                      top_k: int, scorer: str) -> List[List[FAQResult]]:
+        """Top ``top_k`` hits per query: a bounded top-k per shard, then a k-way merge."""
+        # Route each query to the shards that can hold its results
+        plan = []
+        for shard_no, shard in enumerate(index.shards_for(None)):
+            rows = [i for i, c in enumerate(categories)
+                    if not c or shard.shard_category in (None, c)]
+            if rows and len(shard):
+                plan.append((shard_no, shard, rows))
+        
+        # BM25 weights come from the whole corpus, not the shard
+        stats = ([index.bm25_stats(analyze(q)) for q in queries]
+                 if scorer == 'bm25' else [None] * len(queries))
+        
+        # Shards are scanned one after another: the scorers hold the GIL, so threads gain nothing
+        merged: List[list] = [[] for _ in queries]
+        for shard_no, shard, rows in plan:
+            hits_per_row = self._shard_top_k(shard, [queries[i] for i in rows], [categories[i] for i in rows],
+                                             [stats[i] for i in rows], top_k, scorer)
+            for i, hits in zip(rows, hits_per_row):
+                merged[i].extend((neg_score, shard_no, doc_id, shard, score)
+                                 for neg_score, doc_id, score in hits)
+        
+        # Highest score first; shard then corpus order among ties
+        return [
+            [FAQResult(shard.entries[doc_id], score)
+             for _, _, doc_id, shard, score in heapq.nsmallest(top_k, hits, key=lambda h: h[:3])]
+            for hits in merged
+        ]
+    
+    def _shard_top_k(self, shard: FAQIndex, queries: List[str], categories: List[Optional[str]],
+                     stats: list, top_k: int, scorer: str) -> List[List[tuple]]:
+        """Per query, the shard's best ``(-score, doc_id, score)`` hits in merge order."""
+        entries = shard.entries
+        if scorer == 'embedding':
+            embeddings = shard.embeddings()
+            if len(queries) == 1:
+                hit_lists = [embeddings.search(queries[0], categories[0], top_k)]
+            else:
+                hit_lists = embeddings.search_batch(queries, categories, top_k)
+            return [[(-score, doc_id, round(score, 4)) for doc_id, score in hits] for hits in hit_lists]
+        
+        if scorer == 'bm25':
+            return [
+                [(neg_score, doc_id, round(-neg_score, 4)) for neg_score, doc_id in heapq.nsmallest(top_k, (
+                    (-score, doc_id)
+                    for doc_id, score in shard.bm25_scores(query, query_stats).items()
+                    if not category or entries[doc_id].category == category
+                ))]
+                for query, category, query_stats in zip(queries, categories, stats)
+            ]
         
         # Keywords for better matching
-        keywords = self._extract_keywords(query_lower)
+        query_lowers = [q.lower() for q in queries]
+        keyword_lists = [self._extract_keywords(q) for q in query_lowers]
         
-        # Search through categories
-        categories_to_search = [category] if category else self.faqs.keys()
+        # Only score FAQs sharing a keyword (or the phrase) with the query
+        if len(queries) == 1:
+            candidate_lists = [shard.candidates(query_lowers[0], keyword_lists[0])]
+        else:
+            candidate_lists = shard.candidates_many(query_lowers, keyword_lists)
         
-        for cat in categories_to_search:
-            if cat not in self.faqs:
+        # Bounded heap over the scored stream: only top_k hits are ever held
+        return [
+            heapq.nsmallest(top_k, self._score_candidates(entries, query_lower, keywords, candidates, category))
+            for query_lower, keywords, candidates, category
+            in zip(query_lowers, keyword_lists, candidate_lists, categories)
+        ]
+    
+    def _score_candidates(self, entries, query_lower: str, keywords: List[str],
+                          candidates: List[int], category: Optional[str]) -> Iterator[tuple]:
+        for doc_id in candidates:
+            entry = entries[doc_id]
+            if category and entry.category != category:
                 continue
-                
-            for faq_key, faq_data in self.faqs[cat].items():
-                score = self._calculate_relevance(
-                    query_lower, 
-                    keywords,
-                    faq_data.get('question', '').lower(),
-                    faq_data.get('answer', '').lower()
-                )
-                
-                if score > 0:
-                    results.append({
-                        'category': cat,
-                        'question': faq_data.get('question', ''),
-                        'answer': faq_data.get('answer', ''),
-                        'score': score
-                    })
-        
-        # Sort by relevance score and return top results
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:top_k]
+            score = self._calculate_relevance(
+                query_lower,
+                keywords,
+                entry.question_lower,
+                entry.answer_lower
+            )
+            if score > 0:
+                yield (-score, doc_id, score)
     
     def _extract_keywords(self, query: str) -> List[str]:
         # Remove common stop words
-        stop_words = {'how', 'do', 'i', 'can', 'what', 'where', 'why', 'when', 
-                     'is', 'are', 'the', 'a', 'an', 'to', 'my', 'me'}
-        
         words = query.split()
-        keywords = [w for w in words if w not in stop_words and len(w) > 2]
+        keywords = [w for w in words if w not in STOP_WORDS and len(w) > 2]
         return keywords
     
     def _calculate_relevance(self, query: str, keywords: List[str], 
@@ -84,27 +408,70 @@ class FAQSearchTool:
 
 
 class EmailResponseTool:
-    def __init__(self, log_file: str = "response_log.txt"):
+    def __init__(self, log_file: str = "response_log.jsonl", buffered: Optional[bool] = None,
+                 delivery: Any = None):
+        """``delivery`` sends each logged response on, e.g. ``delivery.SMTPDelivery``.
+
+        It has the same ``open``/``append``/``sync``/``close`` methods as the
+        log. None takes it from EMAIL_BACKEND; "file" only writes the log.
+        """
+        # Loaded here rather than at import, so `import tools` stays cheap
+        from log_writer import BufferedWriter, parse_fsync_policy
+        from response_log import SegmentedResponseLog, response_log_from_env
+
         self.log_file = log_file
+        self.log = response_log_from_env(log_file)
+        if delivery is None and os.getenv("EMAIL_BACKEND", "file").lower() != "file":
+            # smtplib and the email package only load for a real mail backend
+            from delivery import delivery_from_env
+            delivery = delivery_from_env()
+        self.delivery = None if delivery is None or delivery == "file" else delivery
+        if buffered is None:
+            buffered = os.getenv("RESPONSE_LOG_BUFFERED", "on").lower() not in ("off", "0", "false")
+        # Entries go through one background writer thread unless RESPONSE_LOG_BUFFERED=off
+        self._writer = BufferedWriter(
+            self.log,
+            max_queue=int(os.getenv("RESPONSE_LOG_QUEUE", "10000")),
+            flush_interval=float(os.getenv("RESPONSE_LOG_FLUSH_MS", "50")) / 1000,
+            fsync=parse_fsync_policy(os.getenv("RESPONSE_LOG_FSYNC", "1")),
+            sizeof=SegmentedResponseLog.approx_size
+        ) if buffered else None
+        # Delivery has its own queue and thread, so a slow mail server never holds up the log
+        self._delivery_writer = BufferedWriter(
+            self.delivery,
+            max_queue=int(os.getenv("RESPONSE_LOG_QUEUE", "10000")),
+            flush_interval=0.01,
+            fsync="off",
+            sizeof=lambda entry: len(entry['response']),
+            name="response-delivery"
+        ) if buffered and self.delivery is not None else None
     
     def send(self, email: str, response: str, subject: str = "Customer Support Response") -> bool:
+        """Log (and hand to delivery) one response; False if that failed.
+        
+        When buffered, True only means the response was queued: delivery
+        failures show up later in ``stats()``.
+        """
         try:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            log_entry = f"""
-{'='*80}
-TIMESTAMP: {timestamp}
-TO: {email}
-SUBJECT: {subject}
-{'='*80}
-{response}
-{'='*80}
-
-"""
+            # Timestamped when it is written to the log
+            entry = {'to': email, 'subject': subject, 'response': response}
             
-            # Append to log file
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(log_entry)
+            if self._writer is not None:
+                if not self._writer.write(entry):
+                    print(f"✗ Failed to send response: response log queue is full")
+                    return False
+                if self._delivery_writer is not None and not self._delivery_writer.write(entry):
+                    print(f"✗ Failed to send response: delivery queue is full")
+                    return False
+                print(f"✓ Response queued for {email}")
+                return True
+            else:
+                self.log.open()
+                self.log.append([entry])
+                if self.delivery is not None:
+                    self.delivery.open()
+                    if not self.delivery.append([entry]):
+                        return False
             
             print(f"✓ Response sent to {email}")
             return True
@@ -113,36 +480,114 @@ SUBJECT: {subject}
             print(f"✗ Failed to send response: {e}")
             return False
     
-    def get_recent_responses(self, count: int = 5) -> List[str]:
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued response is in the log file (and delivered, or given up on)."""
+        if self._writer is None:
+            return True
+        if self._delivery_writer is not None and not self._delivery_writer.flush(timeout):
+            return False
+        return self._writer.flush(timeout)
+    
+    def close(self) -> None:
+        """Write out queued responses and stop the writer threads (a later send restarts them)."""
+        if self._writer is not None:
+            self._writer.close()
+        else:
+            self.log.close()
+        if self._delivery_writer is not None:
+            self._delivery_writer.close()
+        elif self.delivery is not None:
+            self.delivery.close()
+    
+    def stats(self) -> Dict[str, Any]:
+        stats = self._writer.stats() if self._writer is not None else {}
+        stats['segments'] = self.log.stats()
+        if self.delivery is not None:
+            delivery = self._delivery_writer.stats() if self._delivery_writer is not None else {}
+            if hasattr(self.delivery, 'stats'):
+                delivery.update(self.delivery.stats())
+            stats['delivery'] = delivery
+            # Sends that returned True but never reached the customer
+            stats['delivery_failed'] = delivery.get('failed', 0) + delivery.get('dropped', 0)
+        return stats
+    
+    def get_recent_responses(self, count: int = 5) -> List[Dict[str, Any]]:
+        """The last ``count`` logged responses, oldest first."""
         try:
-            if not os.path.exists(self.log_file):
-                return []
-            
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Split by separator and get last N entries
-            entries = content.split('='*80)
-            entries = [e.strip() for e in entries if e.strip()]
-            
-            return entries[-count:] if entries else []
-            
+            self.flush()
+            return self.log.recent(count)
+        except Exception as e:
+            print(f"Error reading response log: {e}")
+            return []
+    
+    def find_responses(self, email: Optional[str] = None, since: Optional['TimeLike'] = None,
+                       until: Optional['TimeLike'] = None, limit: Optional[int] = 100) -> List[Dict[str, Any]]:
+        """Logged responses to ``email`` and/or within [since, until), newest ``limit``, oldest first."""
+        try:
+            self.flush()
+            return self.log.find(email, since, until, limit)
         except Exception as e:
             print(f"Error reading response log: {e}")
             return []
 
 
-# Tool instances for easy import
-faq_search = FAQSearchTool()
-email_sender = EmailResponseTool()
+# Tool instances, built on first use so importing this module stays cheap
+_faq_search: Optional[FAQSearchTool] = None
+_email_sender: Optional[EmailResponseTool] = None
+_singleton_lock = threading.Lock()
+
+
+def get_faq_search() -> FAQSearchTool:
+    global _faq_search
+    if _faq_search is None:
+        with _singleton_lock:
+            if _faq_search is None:
+                _faq_search = FAQSearchTool()
+    return _faq_search
+
+
+def get_email_sender() -> EmailResponseTool:
+    global _email_sender
+    if _email_sender is None:
+        with _singleton_lock:
+            if _email_sender is None:
+                _email_sender = EmailResponseTool()
+    return _email_sender
+
+
+def __getattr__(name: str) -> Any:
+    # Keeps `tools.faq_search` / `tools.email_sender` working without eager construction
+    if name == 'faq_search':
+        return get_faq_search()
+    if name == 'email_sender':
+        return get_email_sender()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def warmup(embeddings: bool = False) -> Dict[str, Any]:
+    """Build the tool instances now rather than on the first request."""
+    start = time.perf_counter()
+    faq_search = get_faq_search()
+    get_email_sender()
+    if embeddings and numpy_available():
+        faq_search._index.build_embeddings()
+    return {
+        'entries': len(faq_search._index),
+        'warmup_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
+
+
+def search_faq(query: str, category: str = None, scorer: str = 'heuristic') -> List[FAQResult]:
+    return get_faq_search().search(query, category, scorer=scorer)
 
 
-def search_faq(query: str, category: str = None) -> List[Dict[str, str]]:
-    return faq_search.search(query, category)
+def search_faq_many(queries: Sequence[str], categories: Optional[Sequence[str]] = None,
+                    scorer: str = 'heuristic') -> List[List[FAQResult]]:
+    return get_faq_search().search_many(queries, categories, scorer=scorer)
 
 
 def send_response(email: str, response: str) -> bool:
-    return email_sender.send(email, response)
+    return get_email_sender().send(email, response)
 
 
 # Tool descriptions for ADK agents
@@ -215,6 +660,6 @@ Customer Support Team
     
     # Test 4: Retrieve recent responses
     print("\n\nRecent responses:")
-    recent = email_sender.get_recent_responses(count=2)
+    recent = get_email_sender().get_recent_responses(count=2)
     for i, entry in enumerate(recent, 1):
-        print(f"\n{i}. {entry[:200]}...")
+        print(f"\n{i}. [{entry['timestamp']}] to {entry['to']}: {entry['response'][:200]}...")